@@ -0,0 +1,174 @@
+"""The statistics of a summary page, accumulated in a single pass over the questions"""
+
+import heapq
+import math
+from collections import Counter
+from collections.abc import Iterable
+from statistics import StatisticsError
+
+
+class Distribution:
+    """Mean, grouped median and mode of a sequence of numbers, from the count of each value.
+
+    Same results as the statistics module on the whole sequence, in O(unique values)"""
+
+    def __init__(self, values: Iterable[float] = ()) -> None:
+        """Initialize."""
+        self.counts = Counter(values)  # type: Counter[float]
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Count a value"""
+        self.counts[value] += count
+
+    def __len__(self) -> int:
+        return self.counts.total()
+
+    def mean(self) -> float:
+        """Like statistics.mean"""
+        if not self.counts:
+            raise StatisticsError("mean requires at least one data point")
+        n = len(self)
+        products = [value * count for value, count in self.counts.items()]
+        if all(isinstance(value, int) for value in self.counts):
+            total = sum(products)
+            # an exact mean of integers stays an integer
+            return total // n if total % n == 0 else total / n
+        return math.fsum(products) / n
+
+    def median(self) -> float:
+        """Like statistics.median_grouped, interval 1"""
+        n = len(self)
+        if n == 0:
+            raise StatisticsError("no median for empty data")
+        below = 0  # values lower than the median one
+        for value in sorted(self.counts):
+            count = self.counts[value]
+            if below + count > n // 2:
+                break
+            below += count
+        if n == 1:
+            return value
+        return value - 0.5 + (n / 2 - below) / count
+
+    def mode(self) -> float:
+        """Like statistics.mode: the first value seen among the most common ones"""
+        if not self.counts:
+            raise StatisticsError("no mode for empty data")
+        return self.counts.most_common(1)[0][0]
+
+    def summary(self, mode: bool = True) -> dict | None:
+        """Mean, median and mode, None without values"""
+        if not self.counts:
+            return None
+        summary = {"mean": self.mean(), "median": self.median()}
+        if mode:
+            summary["mode"] = self.mode()
+        return summary
+
+
+class OpenTimes:
+    """The (open time, post) pairs, shortest first like a stable sort.
+
+    With extremes, only the shortest ones and the longest are kept"""
+
+    def __init__(self, extremes: int | None = None) -> None:
+        """Initialize."""
+        self.extremes = extremes
+        self._items = []  # type: list
+        self._seen = 0
+        self._longest = None  # type: tuple | None
+
+    def add(self, time: float, post: dict) -> None:
+        """Add the open time of a post"""
+        self._seen += 1
+        if self.extremes is None:
+            self._items.append((time, post))
+            return
+        # a max-heap on (time, arrival): the first arrived wins the ties, like sorted()
+        heapq.heappush(self._items, (-time, -self._seen, post))
+        if len(self._items) > self.extremes:
+            heapq.heappop(self._items)
+        if self._longest is None or time >= self._longest[0]:
+            self._longest = (time, self._seen, post)
+
+    def sorted(self) -> list[tuple[float, dict]]:
+        """The open times, shortest first"""
+        if self.extremes is None:
+            return sorted(self._items, key=lambda item: item[0])
+        shortest = sorted((-time, -seen, post) for time, seen, post in self._items)
+        if self._longest and self._longest[:2] not in {item[:2] for item in shortest}:
+            shortest.append(self._longest)
+        return [(time, post) for time, _, post in shortest]
+
+
+class StatsAccumulator:
+    """The counters, open times and summaries of Summarizer.make_stats, fed one question
+    (or ruota) at a time: questions can come straight from a file or a query"""
+
+    def __init__(self, extremes: int | None = None) -> None:
+        """Initialize, keep only the extremes shortest open times (and the longest) if given"""
+        self.authors = Counter()  # type: Counter[str]
+        self.solvers = Counter()  # type: Counter[str]
+        self.goodbyers = Counter()  # type: Counter[str]
+        self.chars = Counter()  # type: Counter[str]
+        self.ruote_solvers = Counter()  # type: Counter[str]
+        self.open_time = OpenTimes(extremes)
+        self.ruote_open_time = OpenTimes(extremes)
+        self.size = Distribution()
+        self.otime = Distribution()
+
+    def add_question(self, question: dict) -> None:
+        """Count a question with answer"""
+        comments = question["comments"]
+        self.authors[question["author"]] += 1
+        solvers, chars = self.solvers, self.chars
+        for comment in comments[0:-1]:
+            solvers[comment["author"]] += 1
+            chars[comment["body"].strip().upper()] += 1
+        goodbye = comments[-1]
+        self.goodbyers[goodbye["author"]] += 1
+        open_time = goodbye["created_utc"] - question["created_utc"]
+        self.open_time.add(open_time, question)
+        self.otime.add(open_time)
+        self.size.add(len(question["answer"]))
+
+    def add_ruota(self, ruota: dict) -> None:
+        """Count a solved ruota"""
+        solution = ruota["comments"][-1]
+        self.ruote_solvers[solution["author"]] += 1
+        self.ruote_open_time.add(solution["created_utc"] - ruota["created_utc"], ruota)
+
+    def consume(self, questions: Iterable[dict], ruote: Iterable[dict] = ()) -> "StatsAccumulator":
+        """Count every question and ruota of the iterables"""
+        for question in questions:
+            self.add_question(question)
+        for ruota in ruote:
+            self.add_ruota(ruota)
+        return self
+
+    def stats(self) -> dict:
+        """The statistics of Summarizer.make_stats"""
+        return {
+            "authors": self.authors,
+            "solvers": self.solvers,
+            "goodbyers": self.goodbyers,
+            "chars": self.chars,
+            "open_time": self.open_time.sorted(),
+            "ruote_solvers": self.ruote_solvers,
+            "ruote_open_time": self.ruote_open_time.sorted(),
+        }
+
+    def summaries(self) -> dict:
+        """The size, solver and otime variables of stats.md, without the empty ones"""
+        return summaries(self.size, Distribution(self.solvers.values()), self.otime)
+
+
+def summaries(size: Distribution, solver: Distribution, otime: Distribution) -> dict:
+    """The size (answer lengths), solver (letters per user) and otime (open times)
+    variables of stats.md, without the empty ones"""
+    values = {
+        "size": size.summary(),
+        "solver": solver.summary(),
+        "otime": otime.summary(mode=False),
+    }
+    return {key: value for key, value in values.items() if value is not None}
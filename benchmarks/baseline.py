@@ -0,0 +1,120 @@
+"""Request counts and wall times of every entry point, against an offline reddit.
+
+Every scenario runs in a scratch directory, on a fresh synthetic subreddit.
+Run from the repository root: python -m benchmarks.baseline [--output baseline.json]"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import bot
+import clear_pmlist
+import dump
+import ruota
+import summary
+from tests.helpers import FakeReddit, make_subreddit, prepare
+
+SUBREDDIT = "DimmiOuija"
+
+
+def check(fake: FakeReddit) -> None:
+    """Two check runs, the second one finds nothing new"""
+    ouija = bot.Ouija(SUBREDDIT, reddit=fake.reddit())
+    ouija.check_submission()
+    ouija.check_submission()
+
+
+def bot_open(fake: FakeReddit) -> None:
+    bot.Ouija(SUBREDDIT, reddit=fake.reddit()).open("italy")
+
+
+def close(fake: FakeReddit) -> None:
+    bot.Ouija(SUBREDDIT, reddit=fake.reddit()).close()
+
+
+def work(fake: FakeReddit) -> None:
+    ruota.Ouija(SUBREDDIT, reddit=fake.reddit()).work()
+
+
+def run_dump(fake: FakeReddit) -> None:
+    dumper = dump.Dumper(SUBREDDIT, reddit=fake.reddit())
+    dumper.write_records(dumper.records())
+
+
+def run_summary(fake: FakeReddit) -> None:
+    # summary reads the JSON written by the dump, its requests are not counted
+    run_dump(fake)
+    fake.requests.clear()
+    summarizer = summary.Summarizer(SUBREDDIT, reddit=fake.reddit())
+    questions, ruote = summarizer.load_infos()
+    summarizer.write_answers(questions, ruote)
+    stats = summarizer.make_stats(questions, ruote)
+    summarizer.write_stats(questions, ruote, stats)
+    summarizer.caffe_wiki("italy")
+
+
+def clear(fake: FakeReddit) -> None:
+    clear_pmlist.Cleaner(SUBREDDIT, reddit=fake.reddit()).start()
+
+
+SCENARIOS = {
+    "check": check,
+    "open": bot_open,
+    "close": close,
+    "work": work,
+    "dump": run_dump,
+    "summary": run_summary,
+    "clear_pmlist": clear,
+}
+
+
+def measure(name: str, args: argparse.Namespace) -> dict:
+    """Run a scenario, return its wall time and requests by endpoint"""
+    fake = FakeReddit(latency=args.latency)
+    world = {"questions": args.questions, "size": args.size, "collapse": args.collapse}
+    make_subreddit(fake, seed=args.seed, **world)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare(Path(workdir))
+        os.chdir(workdir)
+        try:
+            start = time.perf_counter()
+            SCENARIOS[name](fake)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": fake.total(),
+        "endpoints": dict(sorted(fake.requests.items())),
+    }
+
+
+def main() -> None:
+    """Measure the scenarios and print (or save) the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenarios", nargs="*", choices=[[], *SCENARIOS], default=[])
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--size", type=int, default=150, help="comments per question")
+    parser.add_argument("--collapse", type=float, default=0.2, help="share behind MoreComments")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        results[name] = measure(name, args)
+        print(
+            f"{name:>12}: {results[name]['requests']:5d} requests "
+            f"in {results[name]['seconds'] * 1000:7.0f} ms - {results[name]['endpoints']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            json.dump(results, fout, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark the answer resolution of bot.OuijaPost on synthetic threads.
+
+Run from the repository root: python -m benchmarks.bench_browse"""
+
+import time
+
+import bot
+from tests.helpers import make_chain, make_thread
+
+SIZE = 50_000
+SHAPES = {  # name: depth_bias, noise
+    "wide": (0.2, 1.0),
+    "mixed": (0.7, 1.0),
+    "clean": (0.7, 0.05),
+}
+
+
+def main() -> None:
+    """Time a full walk of a SIZE comments thread for every shape"""
+    threads = {
+        shape: make_thread(SIZE, seed=1, depth_bias=depth_bias, users=5000, noise=noise)
+        for shape, (depth_bias, noise) in SHAPES.items()
+    }
+    threads["chain"] = make_chain(SIZE)
+    for shape, submission in threads.items():
+        post = bot.OuijaPost(submission)
+        start = time.perf_counter()
+        post.walk()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{shape:>6}: {SIZE} comments in {elapsed * 1000:.0f} ms "
+            f"({SIZE / elapsed:.0f} comments/s), "
+            f"{len(submission.log)} removals, answer length {len(post.answer_text or '')}"
+        )
+
+
+if __name__ == "__main__":
+    main()
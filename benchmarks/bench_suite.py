@@ -0,0 +1,249 @@
+"""Throughput and peak memory of the comment-processing and statistics hot paths.
+
+Every benchmark runs on generated editions, from a single one up to ten years of them,
+with in-memory stand-ins for praw. Results can be saved and compared between commits.
+
+Run from the repository root:
+python -m benchmarks.bench_suite [--scales 1 4] [--output new.json] [--compare old.json]"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import bot
+import dump
+import ruota
+import summary
+from tests.helpers import (
+    ALPHABET,
+    QUESTIONS,
+    START,
+    FakeReddit,
+    FakeRedditor,
+    make_answered,
+    make_edition,
+    make_editions,
+    make_ruota,
+    make_thread,
+    prepare,
+)
+
+SCALES = {1: "edition", 4: "month", 52: "year", 520: "ten years"}
+SIZE = 150  # comments per question thread
+RUOTA_SIZE = 200  # comments per ruota
+
+Case = Callable[[], object]
+
+
+def bot_browse(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """bot.OuijaPost.browse_comments on every question of the editions"""
+    threads = [make_thread(SIZE, seed + i, submission_id=f"q{i}") for i in range(QUESTIONS)]
+
+    def cases() -> Iterator[Case]:
+        for _ in range(editions):
+            for thread in threads:
+                thread.log.clear()
+                yield bot.OuijaPost(thread).browse_comments
+
+    return cases(), editions * QUESTIONS * SIZE
+
+
+def ruota_browse(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """ruota.OuijaPost.browse_comments on the ruota of every edition"""
+
+    def cases() -> Iterator[Case]:
+        for index in range(editions):
+            # the bot replies to every comment, a ruota can be browsed only once
+            thread = make_ruota(RUOTA_SIZE, seed + index)
+            post = ruota.OuijaPost(thread, "UNA FRASE MISTERIOSA")
+            yield lambda post=post, thread=thread: post.browse_comments(thread)
+
+    return cases(), editions * RUOTA_SIZE
+
+
+def find_solution(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """dump.find_solution on every question of the editions"""
+    rnd = random.Random(seed)
+    threads = []
+    for i in range(QUESTIONS):
+        answer = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(2, 12)))
+        threads.append((make_answered(SIZE, seed + i, START, f"q{i}", answer), answer))
+
+    def cases() -> Iterator[Case]:
+        for _ in range(editions):
+            for thread, answer in threads:
+                yield lambda thread=thread, answer=answer: dump.find_solution(thread, answer)
+
+    return cases(), editions * QUESTIONS * SIZE
+
+
+def add_ruota(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """dump.Dumper.add_ruota on the solved ruota of every edition"""
+    thread = make_ruota(RUOTA_SIZE, seed)
+    thread.add_comment(thread, "Una frase misteriosa", author=FakeRedditor("user1"))
+
+    def cases() -> Iterator[Case]:
+        for _ in range(editions):
+            question = {"_thread": thread, "answer": "UNA FRASE MISTERIOSA"}
+            yield lambda question=question: dump.Dumper.add_ruota([question])
+
+    return cases(), editions * RUOTA_SIZE
+
+
+def to_sql(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """dump.Dumper.to_sql of every edition, in a fresh database"""
+    workdir = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    prepare(Path(workdir.name))
+    os.chdir(workdir.name)
+    try:
+        dumper = dump.Dumper("DimmiOuija", reddit=FakeReddit().reddit())
+    finally:
+        os.chdir(cwd)
+    data = [make_edition(index, seed) for index in range(editions)]
+
+    def cases() -> Iterator[Case]:
+        with workdir:
+            for index, (questions, ruote) in enumerate(data):
+                dumper.week = f"{2017 + index // 52}_{index % 52:02d}"
+                yield lambda questions=questions, ruote=ruote: dumper.to_sql(questions, ruote)
+            dumper._store.close()
+
+    rows = sum(len(q) + sum(len(x["comments"]) for x in q + r) + len(r) for q, r in data)
+    return cases(), rows
+
+
+def make_stats(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """summary.Summarizer.make_stats over all the editions, summaries included"""
+    questions, ruote = make_editions(editions, seed)
+    return iter([lambda: summary.Summarizer.make_stats(questions, ruote)]), len(questions)
+
+
+def top_filters(editions: int, seed: int) -> tuple[Iterator[Case], int]:
+    """The top_counter and top_answer filters of stats.md, over all the editions"""
+    questions, ruote = make_editions(editions, seed)
+    stats = summary.Summarizer.make_stats(questions, ruote)
+
+    def filters() -> None:
+        summary.top_counter(stats["authors"], 4)
+        summary.top_counter(stats["solvers"], 9)
+        summary.top_counter(stats["goodbyers"], 3)
+        summary.top_counter(stats["ruote_solvers"], 5)
+        summary.top_answer(questions, 4)
+
+    return iter([filters]), len(questions)
+
+
+BENCHMARKS = {
+    "bot_browse": (bot_browse, "comments"),
+    "ruota_browse": (ruota_browse, "comments"),
+    "find_solution": (find_solution, "comments"),
+    "add_ruota": (add_ruota, "comments"),
+    "to_sql": (to_sql, "rows"),
+    "make_stats": (make_stats, "questions"),
+    "top_filters": (top_filters, "questions"),
+}
+
+
+def run(name: str, editions: int, seed: int) -> dict:
+    """Time the cases of a benchmark, then run them again to trace the peak memory.
+
+    Only the calls are measured, the fixtures are built outside of them."""
+    factory, unit = BENCHMARKS[name]
+    cases, units = factory(editions, seed)
+    elapsed = 0.0
+    for case in cases:
+        start = time.perf_counter()
+        case()
+        elapsed += time.perf_counter() - start
+    cases, _ = factory(editions, seed)
+    peak = 0
+    tracemalloc.start()
+    try:
+        for case in cases:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            case()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "editions": editions,
+        "seconds": round(elapsed, 4),
+        unit: units,
+        "per_second": round(units / elapsed) if elapsed else None,
+        "peak_kib": round(peak / 1024),
+    }
+
+
+def commit() -> str | None:
+    """Current commit of the repository, if any"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print the throughput and memory ratios of new over old"""
+    for name, scales in new["results"].items():
+        for scale, result in scales.items():
+            before = old["results"].get(name, {}).get(scale)
+            if not before or not before["per_second"] or not result["per_second"]:
+                continue
+            speed = result["per_second"] / before["per_second"]
+            memory = (result["peak_kib"] or 1) / (before["peak_kib"] or 1)
+            print(f"{name:>14} x{scale:<4}: throughput x{speed:.2f}, peak memory x{memory:.2f}")
+
+
+def main() -> None:
+    """Run the benchmarks and print (or save) the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", choices=[[], *BENCHMARKS], default=[])
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[1, 52, 520],
+        help="number of editions: " + ", ".join(f"{k} ({v})" for k, v in SCALES.items()),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON file of a previous run")
+    args = parser.parse_args()
+    results: dict[str, dict] = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = {}
+        for editions in args.scales:
+            result = results[name][str(editions)] = run(name, editions, args.seed)
+            print(
+                f"{name:>14} x{editions:<4}: {result['seconds'] * 1000:9.1f} ms, "
+                f"{result['per_second'] or 0:9d} {BENCHMARKS[name][1]}/s, "
+                f"peak {result['peak_kib']:7d} KiB"
+            )
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            json.dump(report, fout, indent=4)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fin:
+            compare(json.load(fin), report)
+
+
+if __name__ == "__main__":
+    main()
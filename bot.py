@@ -2,12 +2,30 @@
 
 # pylint: disable=C0103
 import argparse
+import heapq
 import logging
 import re
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 import grapheme
 import praw
+import prawcore
+from praw.models import MoreComments
+
+from outbox import Outbox
+from session import RequestGate, RequestMeter, retry_after
+from state import (
+    PM_FAILED,
+    PM_MISSING,
+    PM_RETRY,
+    PM_SENT,
+    ListingCursor,
+    PostState,
+    StateStore,
+)
 
 AGENT = "python:dimmi-ouja:0.3.2 (by /u/timendum)"
 
@@ -70,6 +88,18 @@ TEXT_WIKI_CAFFE = (
     "e ricevere risposte, una lettera alla volta. Partecipazione aperta a tutti."
 )
 TIME_LIMIT = 14 * 24 * 60 * 60
+KEEP_OLD = 100  # open posts followed after TIME_LIMIT, like the new(limit=100) of the listing
+MORE_BUDGET = 0  # MoreComments requests per run outside the branches that can lead to an answer
+VISIT_SKIP = 0
+VISIT_GOODBYE = 1
+VISIT_LETTER = 2
+RECONCILE = 10 * 60  # daemon: check all the submissions every 10 minutes
+PM_BATCH = 20  # PM sent per check
+PM_DAEMON_BATCH = 2  # daemon: PM sent between two looks at the stream
+DAEMON_BACKOFF = 60  # daemon: wait after a reddit error, doubled on every error in a row
+DAEMON_MAX_BACKOFF = 30 * 60
+PM_CHECKPOINT = 50  # write the pmlist_todo wiki every 50 PM
+PM_RESERVE = 30  # requests of the rate limit kept for the moderation
 PREVIOUS = time.time() - TIME_LIMIT
 NOW = time.time()
 
@@ -78,22 +108,60 @@ LOGGER.addHandler(logging.NullHandler())
 LOGGER.setLevel(logging.INFO)
 
 
+class Budget:
+    """A number of requests, shared by the threads processing the posts"""
+
+    def __init__(self, requests: int) -> None:
+        """Initialize."""
+        self.requests = requests
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Use a request of the budget, return False if exhausted"""
+        with self._lock:
+            if self.requests <= 0:
+                return False
+            self.requests -= 1
+            return True
+
+
 class OuijaPost:
     """A post in ouija"""
 
-    def __init__(self, post: "praw.reddit.models.Submission") -> None:
+    def __init__(
+        self, post: "praw.reddit.models.Submission", state: PostState | None = None
+    ) -> None:
         """Initialize."""
         self._post = post
+        self.state = state or PostState(post.id)
         self.author: praw.reddit.models.Redditor | None = None
         if post.author:
             self.author = post.author.name
+        self.id = post.id
         self.question = post.title
         self.answer_text: str | None = None
         self.answer_permalink: str | None = None
         self.answer_score = float("-inf")
+        self.answer_id: str | None = None
+        self._walked = {}  # type: dict[str, praw.reddit.models.Comment | praw.reddit.models.Submission]
+        self._levels = {}  # type: dict[str, dict[str, praw.reddit.models.Comment]]
+        self._new_replies = Counter()  # type: Counter[str]
+        self._known_more = set()  # type: set[str]
+        self._answer: praw.reddit.models.Comment | None = None
+        self.more_budget = Budget(MORE_BUDGET)
+        """MoreComments requests allowed outside the answer branches"""
+        self.more_requests = 0
+        self.more_saved = 0
+        self.more_known = 0
+        """MoreComments not loaded because nothing changed under them since the last walk"""
+        self.notifications = []  # type: list[dict]
+        """Modmails to send, see outbox.Outbox.modmail"""
         self.flair: str | None = None
         if post.link_flair_text and post.link_flair_text != UNANSWERED["text"]:
             self.flair = post.link_flair_text
+        if self.state.flair != self.flair:
+            # changed since by a moderator (or not applied): the ledger is stale
+            self.state.flair = None
 
     def is_unanswered(self) -> bool:
         """Check if the submission is Unanswered"""
@@ -123,36 +191,212 @@ class OuijaPost:
             text = ANSWERED["text"] + self.answer_text
             if len(text) > 64:
                 text = text[0:61] + "..."
-            if text != self.flair:
+            if text != self.flair and text != self.state.flair:
                 self._post.mod.flair(
                     text=text,
                     css_class=ANSWERED["css_class"],
                     flair_template_id=ANSWERED["flair_template_id"],
                 )
+                self.state.flair = text
                 if self._post.author:
-                    try:
-                        modconv: praw.reddit.models.ModmailConversation = (
-                            self._post.subreddit.modmail.create(
-                                recipient=self._post.author,
-                                subject=PM_ANSWER_TITLE,
-                                body=PM_ANSWER_BODY.format(
-                                    question=self._post.title,
-                                    answer=self.answer_text,
-                                    permalink=self.answer_permalink,
-                                ),
-                            )
-                        )
-                        if not modconv.is_internal:
-                            modconv.archive()
-                    except praw.exceptions.RedditAPIException:
-                        LOGGER.exception("Error sending PM to %s", self._post.author.name)
+                    # sent later by the outbox
+                    self.notifications.append(
+                        {
+                            "recipient": self._post.author.name,
+                            "subject": PM_ANSWER_TITLE,
+                            "body": PM_ANSWER_BODY.format(
+                                question=self._post.title,
+                                answer=self.answer_text,
+                                permalink=self.answer_permalink,
+                            ),
+                            "key": f"answer:{self.id}:{text}",
+                        }
+                    )
                 LOGGER.debug("Flair - %s - https://www.reddit.com%s", text, self._post.permalink)
 
+    def is_unchanged(self) -> bool:
+        """Check if the comments are the same of the previous run"""
+        return self.state.is_unchanged(self._post.num_comments)
+
     def process(self) -> bool:
         """Check for answers in the comments and delete wrong comments"""
+        if self.is_unchanged():
+            LOGGER.debug("Unchanged - https://www.reddit.com%s", self._post.permalink)
+            return self.restore_answer()
+        return self.walk(skip_known=self.state.is_recent())
+
+    def walk(self, skip_known: bool = False) -> bool:
+        """Fetch and browse the whole comment tree.
+
+        With skip_known, the MoreComments hiding only comments already moderated
+        by the last walk are not loaded, see is_known."""
+        self.answer_text = self.answer_permalink = self.answer_id = None
+        self.answer_score = float("-inf")
         self._post.comment_sort = "top"
-        self._post.comments.replace_more(limit=None)
-        return self.browse_comments(self._post)
+        self.expand_more(skip_known)
+        self.state.candidates = {}
+        found = self.browse_comments()
+        self.store_answer()
+        return found
+
+    def expand_more(self, skip_known: bool = False) -> None:
+        """Replace the MoreComments like CommentForest.replace_more(limit=None) does,
+        but the ones outside the branches that can lead to an answer only within more_budget.
+
+        Those branches are never browsed nor deleted, so the results are the same."""
+        forest = self._post.comments
+        by_name = {
+            comment.name: comment
+            for comment in forest.list()
+            if not isinstance(comment, MoreComments)
+        }
+        branches = {self._post.name: "walk"}  # type: dict[str, str]
+        # parents with replies never moderated, their MoreComments are always loaded
+        changed = {comment.parent_id for comment in by_name.values() if self.is_new(comment)}
+        letters = self.state.branches()
+        more_comments = [
+            (not self.needs_replies(more.parent_id, by_name, branches), more)
+            for more in forest._gather_more_comments(forest._comments)
+        ]
+        heapq.heapify(more_comments)
+        while more_comments:
+            useless, item = heapq.heappop(more_comments)
+            if skip_known and self.is_known(item, changed, letters):
+                self.more_known += 1
+                # the duplicated letters rules count them as replies
+                self._new_replies[item.parent_id] += len(item.children)
+                self._known_more.add(item.parent_id)
+                item._remove_from.remove(item)
+                continue
+            if useless and not self.more_budget.take():
+                self.more_saved += 1
+                item._remove_from.remove(item)
+                continue
+            new_comments = item.comments(update=False)
+            self.more_requests += 1
+            new_more = forest._gather_more_comments(new_comments, parent_tree=forest._comments)
+            for comment in new_comments:
+                forest._insert_comment(comment)
+                if not isinstance(comment, MoreComments):
+                    by_name[comment.name] = comment
+                    if self.is_new(comment):
+                        changed.add(comment.parent_id)
+            for more in new_more:
+                more.submission = self._post
+                useless = not self.needs_replies(more.parent_id, by_name, branches)
+                heapq.heappush(more_comments, (useless, more))
+            item._remove_from.remove(item)
+        if self.more_saved or self.more_known:
+            LOGGER.debug(
+                "MoreComments - %d requests, %d saved, %d known - %s",
+                self.more_requests,
+                self.more_saved,
+                self.more_known,
+                self.permalink(self._post),
+            )
+
+    def is_new(self, comment: "praw.reddit.models.Comment") -> bool:
+        """Check if the comment is moderated by visit and was not in the last walk"""
+        return not (
+            comment.id in self.state.seen
+            or comment.id in self.state.removed
+            or comment.stickied
+            or comment.distinguished
+            or comment.removed
+            or not comment.author
+        )
+
+    def is_known(self, more: MoreComments, changed: set[str], letters: set[str]) -> bool:
+        """Check if the comments hidden by more are all moderated by the last walk,
+        none of them leads to a candidate goodbye and their siblings are unchanged.
+
+        Replies added under them behind other MoreComments wait the next full walk."""
+        return bool(more.children) and not (
+            more.parent_id in changed
+            or any(
+                child in letters
+                or child in self.state.candidates
+                or (child not in self.state.seen and child not in self.state.removed)
+                for child in more.children
+            )
+        )
+
+    def needs_replies(
+        self,
+        name: str,
+        by_name: "dict[str, praw.reddit.models.Comment]",
+        branches: dict[str, str],
+    ) -> bool:
+        """Check if the replies of the comment named name are browsed (or removed).
+
+        A cheap superset of the rules of visit, results are cached in branches:
+        "walk" for possible letters, "delete" for threads to delete, "ignore" otherwise."""
+        start = name
+        chain = []  # type: list[praw.reddit.models.Comment]
+        while name not in branches:
+            comment = by_name.get(name)
+            if comment is None:
+                # unknown parent, better safe
+                branches[name] = "walk"
+                break
+            chain.append(comment)
+            name = comment.parent_id
+        for comment in reversed(chain):
+            parent_branch = branches[comment.parent_id]
+            if parent_branch != "walk":
+                # everything under a deleted thread is deleted
+                branches[comment.name] = parent_branch
+                continue
+            parent = by_name.get(comment.parent_id, self._post)
+            body = comment.body.strip().lstrip("\\")
+            if (
+                comment.stickied
+                or comment.distinguished
+                or comment.removed
+                or comment.id in self.state.removed
+                or not comment.author
+            ):
+                branches[comment.name] = "ignore"
+            elif comment.author.name == self.author or (
+                parent.author and comment.author.name == parent.author.name
+            ):
+                branches[comment.name] = "delete"
+            elif GOODBYE.match(body) or (len(body) != 1 and grapheme.length(body) != 1):
+                branches[comment.name] = "ignore"
+            else:
+                branches[comment.name] = "walk"
+        return branches[start] != "ignore"
+
+    def restore_answer(self) -> bool:
+        """Use the answer found in the previous run, return True if present"""
+        if not self.state.answer_id:
+            return False
+        self.answer_id = self.state.answer_id
+        self.answer_text = self.state.answer_text
+        self.answer_score = self.state.answer_score
+        self.answer_permalink = self.state.answer_permalink
+        return True
+
+    def store_answer(self) -> None:
+        """Save the results of a full walk in the state"""
+        self.state.num_comments = self._post.num_comments
+        self.state.walked_utc = time.time()
+        self.state.answer_id = self.answer_id
+        self.state.answer_text = self.answer_text
+        self.state.answer_score = self.answer_score
+        self.state.answer_permalink = self.answer_permalink
+
+    def check_score(self) -> None:
+        """Revert the answer if its score is too low"""
+        if self.answer_text is None:
+            return
+        # check if the answer score is under the limit
+        # but not if post is old and the answer score is above lower limit
+        if self.answer_score < SCORE_LIMIT and self.answer_score < self.calc_score():
+            # revert accept_answer
+            self.answer_text = None
+            self.answer_score = float("-inf")
+            self.answer_permalink = None
 
     def accept_answer(self, comment: "praw.reddit.models.Comment") -> bool:
         """
@@ -161,9 +405,11 @@ class OuijaPost:
         Return True if accepted, False otherwise.
         """
         if comment.score > self.answer_score:
-            self.answer_text = ""  # remove previous text
+            # answer_text is composed by the caller, once the branch is known
+            self._answer = comment
             self.answer_score = comment.score
             self.answer_permalink = comment.permalink
+            self.answer_id = comment.id
             return True
         return False
 
@@ -176,11 +422,14 @@ class OuijaPost:
 
         def delete_thread(comment) -> None:
             """Delete comments and all children"""
+            if self.state.removed.get(comment.id):
+                # already removed with its replies in a previous run
+                return
             replies = comment.replies
             replies.replace_more(limit=None)
             for reply in replies.list():
-                reply.mod.remove()
-            comment.mod.remove()
+                self.remove(reply)
+            self.remove(comment, thread=True)
 
         if comment.author and comment.author.name == self.author:
             LOGGER.info("Deleting - OP = author - %s", self.permalink(parent))
@@ -192,101 +441,248 @@ class OuijaPost:
             return True
         return False
 
+    def remove(self, comment: "praw.reddit.models.Comment", thread: bool = False) -> None:
+        """Remove a comment, unless the ledger says it is already done"""
+        if comment.id not in self.state.removed:
+            comment.mod.remove()
+        self.state.removed[comment.id] = thread or self.state.removed.get(comment.id, False)
+
     def permalink(
         self, comment: "praw.reddit.models.Comment | praw.reddit.models.Submission"
     ) -> str:
         """Produce a shorter permalink"""
         return f"https://www.reddit.com/r/{self._post.subreddit.display_name}/comments/{self._post.id}//{comment.id}"
 
-    def browse_comments(
-        self, parent: "praw.reddit.models.Comment | praw.reddit.models.Submission"
-    ) -> bool:  # noqa: C901
-        """Given a comment return True if an answer is found"""
-        found = False
-        existing = {}  # type: dict[str, praw.reddit.models.Comment]
-        # try replies for parent=comment
-        try:
-            comments = parent.replies
-        except AttributeError:
-            # try comments for parent=submission
-            comments = parent.comments
-        # loop for every child comment
-        for comment in comments:
-            # skip comments by mods or removed comments
-            if comment.stickied or comment.distinguished or comment.removed:
+    def browse_comments(self) -> bool:
+        """Browse the whole comment tree, return True if an answer is found.
+
+        The tree is visited depth first with an explicit stack, in the same order
+        of a recursive visit, only under the letters that can lead to an answer."""
+        # a frame is: parent, iterator on its replies, letters already seen, answer found
+        root = [self._post, iter(self._post.comments), self.descend(self._post), False]
+        stack = [root]
+        while stack:
+            frame = stack[-1]
+            parent, comments, existing, found = frame
+            comment = next(comments, None)
+            if comment is None:
+                # end of the branch, propagate the answer to the parent
+                stack.pop()
+                if found and stack:
+                    stack[-1][3] = True
                 continue
-            # skip [deleted] comments
-            if not comment.author:
-                continue
-            # if modeation is applied (comment removed), skip
-            if self.moderation(comment, parent):
-                continue
-            # check body (remove space and escape chars)
-            body: str = comment.body.strip().lstrip("\\")
-            if GOODBYE.match(body):
-                if existing.get("GOODBYE"):
-                    if (
-                        comment.score < existing["GOODBYE"].score
-                        or comment.created > existing["GOODBYE"].created
-                    ):
-                        LOGGER.info("Deleting - duplicated goodbye - %s", self.permalink(parent))
-                        comment.mod.remove()
-                        continue
-                existing["GOODBYE"] = comment
+            outcome = self.visit(comment, parent, existing)
+            if outcome == VISIT_GOODBYE:
+                self.add_candidate(comment)
                 # check if the new answer is an accepted one (and store the results)
-                found = found or self.accept_answer(comment)
-            elif len(body) == 1 or grapheme.length(body) == 1:
-                if existing.get(body):
-                    # the letter is already insered
-                    if comment.created > existing[body].created and len(comment.replies) < 1:
-                        # the new comment is newer and does not have replies: delete it
-                        LOGGER.info("Deleting - duplicated - %s", self.permalink(parent))
-                        comment.mod.remove()
-                        continue
-                    if len(existing[body].replies) < 1:
-                        # the previous comment has not replies: delete it
-                        LOGGER.info("Deleting - duplicated - %s", self.permalink(parent))
-                        existing[body].mod.remove()
-                        existing[body] = comment
-                        continue
-                # the letter is not already insered, save it
-                existing[body] = comment
-                if self.browse_comments(comment):
-                    # compose the answer
-                    self.answer_text = body + self.answer_text
-                    # to uppercase
-                    self.answer_text = self.answer_text.upper()
-                    found = True
-            else:
-                # comment is by user and longer than 1 char (unicode ok), delete it
-                LOGGER.info("Deleting - length <> 1 - %s", self.permalink(comment))
-                comment.mod.remove()
-        return found
+                frame[3] = found or self.accept_answer(comment)
+            elif outcome == VISIT_LETTER:
+                stack.append([comment, iter(comment.replies), self.descend(comment), False])
+        if root[3]:
+            self.answer_text = self.compose_answer(self._answer)
+        return root[3]
+
+    def descend(
+        self, parent: "praw.reddit.models.Comment | praw.reddit.models.Submission"
+    ) -> "dict[str, praw.reddit.models.Comment]":
+        """Mark the replies of parent as part of an answer, return its letters already seen"""
+        existing = {}  # type: dict[str, praw.reddit.models.Comment]
+        # new comments under this branch will be visited by handle_comment
+        self._walked[parent.name] = parent
+        self._levels[parent.name] = existing
+        return existing
+
+    def branch(self, goodbye: "praw.reddit.models.Comment") -> "list[praw.reddit.models.Comment]":
+        """Return the letters from the submission to goodbye"""
+        letters = []
+        parent = self._walked[goodbye.parent_id]
+        while parent is not self._post:
+            letters.append(parent)
+            parent = self._walked[parent.parent_id]
+        return letters[::-1]
+
+    def compose_answer(self, goodbye: "praw.reddit.models.Comment") -> str:
+        """Return the answer made by the letters from the submission to goodbye"""
+        return "".join(letter.body.strip().lstrip("\\") for letter in self.branch(goodbye)).upper()
+
+    def add_candidate(self, goodbye: "praw.reddit.models.Comment") -> None:
+        """Record a goodbye in the state, its score is refreshed while the tree is unchanged"""
+        self.state.candidates[goodbye.id] = (
+            self.compose_answer(goodbye),
+            goodbye.score,
+            goodbye.permalink,
+            tuple(letter.id for letter in self.branch(goodbye)),
+        )
 
+    def visit(  # noqa: C901
+        self,
+        comment: "praw.reddit.models.Comment",
+        parent: "praw.reddit.models.Comment | praw.reddit.models.Submission",
+        existing: "dict[str, praw.reddit.models.Comment]",
+    ) -> int:
+        """Apply the rules to a comment, given its siblings already visited in existing.
+
+        Return VISIT_GOODBYE for a valid goodbye, VISIT_LETTER for a valid letter
+        (its replies are to be visited), VISIT_SKIP otherwise."""
+        # skip comments by mods or removed comments (even if reddit does not know yet)
+        if (
+            comment.stickied
+            or comment.distinguished
+            or comment.removed
+            or comment.id in self.state.removed
+        ):
+            return VISIT_SKIP
+        # skip [deleted] comments
+        if not comment.author:
+            return VISIT_SKIP
+        # if modeation is applied (comment removed), skip
+        # (authors do not change, so comments seen in previous runs are already fine)
+        if comment.id not in self.state.seen and self.moderation(comment, parent):
+            return VISIT_SKIP
+        self.state.seen.add(comment.id)
+        self.state.last_comment_utc = max(self.state.last_comment_utc, comment.created_utc)
+        # check body (remove space and escape chars)
+        body: str = comment.body.strip().lstrip("\\")
+        if GOODBYE.match(body):
+            if existing.get("GOODBYE"):
+                if (
+                    comment.score < existing["GOODBYE"].score
+                    or comment.created > existing["GOODBYE"].created
+                ):
+                    LOGGER.info("Deleting - duplicated goodbye - %s", self.permalink(parent))
+                    self.remove(comment)
+                    return VISIT_SKIP
+            existing["GOODBYE"] = comment
+            return VISIT_GOODBYE
+        if len(body) == 1 or grapheme.length(body) == 1:
+            if existing.get(body):
+                # the letter is already insered
+                if comment.created > existing[body].created and self.replies(comment) < 1:
+                    # the new comment is newer and does not have replies: delete it
+                    LOGGER.info("Deleting - duplicated - %s", self.permalink(parent))
+                    self.remove(comment)
+                    return VISIT_SKIP
+                if self.replies(existing[body]) < 1:
+                    # the previous comment has not replies: delete it
+                    LOGGER.info("Deleting - duplicated - %s", self.permalink(parent))
+                    self.remove(existing[body])
+                    existing[body] = comment
+                    return VISIT_SKIP
+            # the letter is not already insered, save it
+            existing[body] = comment
+            return VISIT_LETTER
+        # comment is by user and longer than 1 char (unicode ok), delete it
+        LOGGER.info("Deleting - length <> 1 - %s", self.permalink(comment))
+        self.remove(comment)
+        return VISIT_SKIP
+
+    def replies(self, comment: "praw.reddit.models.Comment") -> int:
+        """Number of replies of a comment, including the ones arrived from the stream
+        and the ones behind known MoreComments"""
+        return len(comment.replies) + self._new_replies[comment.name]
+
+    def handle_comment(self, comment: "praw.reddit.models.Comment") -> bool:
+        """Moderate a single new comment, re-evaluating only its branch.
+
+        Return True if an answer is found."""
+        if not self._walked:
+            # first comment since the tree was last fetched, the walk includes it
+            return self.walk()
+        if comment.id in self.state.seen:
+            return False
+        self._new_replies[comment.parent_id] += 1
+        parent = self._walked.get(comment.parent_id)
+        if parent is None:
+            # parent is not a letter that can lead to an answer (or it is unknown yet)
+            return False
+        if comment.parent_id in self._known_more:
+            # some siblings are behind a known MoreComments, the next walk loads them
+            return False
+        outcome = self.visit(comment, parent, self._levels[comment.parent_id])
+        if outcome == VISIT_LETTER:
+            self.descend(comment)
+        if outcome == VISIT_GOODBYE:
+            self.add_candidate(comment)
+        if outcome != VISIT_GOODBYE or not self.accept_answer(comment):
+            return False
+        self.answer_text = self.compose_answer(comment)
+        return True
 
-class PMList:
-    """Manage a list of user to message"""
 
-    def __init__(self, reddit: "praw.Reddit", subreddit: "praw.reddit.models.Subreddit") -> None:
+class PMList:
+    """Manage a list of user to message.
+
+    The queue is kept in the state database, the pmlist_todo wiki page is only
+    a view of the users still to message, written back at checkpoints."""
+
+    def __init__(
+        self,
+        reddit: "praw.Reddit",
+        subreddit: "praw.reddit.models.Subreddit",
+        state: StateStore,
+        batch: int = PM_BATCH,
+    ) -> None:
         self.reddit = reddit
         self.wiki_main = subreddit.wiki["pmlist"]
         self.wiki_todo = subreddit.wiki["pmlist_todo"]
         self.subreddit = subreddit
+        self.state = state
+        self.batch = batch
+        self._dirty = 0
+        """PM sent since the last checkpoint"""
+
+    @staticmethod
+    def _users(content: str) -> list[str]:
+        users = content.split("\n")
+        users = [user.strip() for user in users]
+        users = [user.replace("\\", "") for user in users]
+        return [user for user in users if user]
 
     def start(self):
         """Prepare for a new start"""
+        self.state.load_pmlist(self._users(self.wiki_main.content_md))
+        self._dirty = 0
         self.wiki_todo.edit(content=self.wiki_main.content_md, reason="New opening")
 
-    def send_next(self):
-        """Send a new PM"""
-        users = self.wiki_todo.content_md.split("\n")
-        users = [user.strip() for user in users]
-        users = [user.replace("\\", "") for user in users]
-        users = [user for user in users if user]
-        if not users:
+    def checkpoint(self, force: bool = False) -> None:
+        """Write the users still to message in the wiki"""
+        if not self._dirty or (self._dirty < PM_CHECKPOINT and not force):
             return
-        user, users = users[0], users[1:]
-        self.wiki_todo.edit(content="\n\n".join(users), reason="Done " + user)
+        users = self.state.unsent_pm()
+        self.wiki_todo.edit(content="\n\n".join(users), reason=f"Done {self._dirty}")
+        self._dirty = 0
+
+    def _has_budget(self) -> bool:
+        """True if the rate limit leaves room for a PM, besides the moderation"""
+        remaining = self.reddit.auth.limits.get("remaining")
+        return remaining is None or remaining > PM_RESERVE
+
+    def send_next(self, limit: int | None = None) -> int:
+        """Send up to limit PM (default: the batch size), return the number sent"""
+        if not self.state.has_pmlist():
+            # queue still in the wiki only
+            self.state.load_pmlist(self._users(self.wiki_todo.content_md))
+        now = time.time()
+        sent = 0
+        for user in self.state.pending_pm(now, limit or self.batch):
+            if not self._has_budget():
+                LOGGER.debug("PMList - rate limit reached")
+                break
+            status, retry = self._send(user, now)
+            self.state.mark_pm(user, status, retry)
+            self._dirty += 1
+            if status == PM_RETRY:
+                # the rate limit is the same for all the users
+                break
+            if status == PM_SENT:
+                sent += 1
+        if sent:
+            LOGGER.info("PMList - %d sent", sent)
+        self.checkpoint(force=not self.state.unsent_pm())
+        return sent
+
+    def _send(self, user: str, now: float) -> tuple[str, float | None]:
+        """Send the PM to user, return its status and when to retry"""
         try:
             modconv: praw.reddit.models.ModmailConversation = self.subreddit.modmail.create(
                 recipient=user, subject=APERTURA_TITOLO, body=APERTURA_COMMENTO
@@ -297,28 +693,82 @@ class PMList:
             for subexception in e.items:
                 if subexception.error_type == "USER_DOESNT_EXIST":
                     self.subreddit.message(user, "User not found")
-                    break
-            else:
-                print(user, e)
+                    return PM_MISSING, None
+                if subexception.error_type == "RATELIMIT":
+                    return PM_RETRY, now + retry_after(subexception.message)
+            print(user, e)
+            return PM_FAILED, None
+        return PM_SENT, None
 
 
 class Ouija:
     """Contain all bot logic."""
 
-    def __init__(self, subreddit: str) -> None:
+    def __init__(
+        self,
+        subreddit: str,
+        workers: int = 1,
+        more_budget: int = MORE_BUDGET,
+        reddit: praw.Reddit | None = None,
+    ) -> None:
         """Initialize.
 
         subreddit = DimmiOuija subreddit
+        workers = number of posts processed (and notifications sent) in parallel
+        more_budget = MoreComments requests per run outside the answer branches
+        reddit = the praw instance to use, default from praw.ini
         """
-        reddit = praw.Reddit(check_for_updates=False, client_secret=None)
+        reddit = reddit or praw.Reddit(check_for_updates=False, client_secret=None)
         self._reddit = reddit
+        self.meter = RequestMeter.install(reddit)
         self.me = reddit.user.me()
         self.subreddit = reddit.subreddit(subreddit)
-        self.pmlist = PMList(reddit, self.subreddit)
-
-    def check_submission(self) -> None:
-        """Check the submission for unanswered post"""
-        submissions = self.subreddit.new(limit=100)
+        self.state = StateStore()
+        self.pmlist = PMList(reddit, self.subreddit, self.state)
+        self.outbox = Outbox(reddit, self.subreddit, self.state, workers)
+        self.listing = ListingCursor(
+            self.state,
+            reddit,
+            self.subreddit,
+            "unanswered",
+            TIME_LIMIT,
+            lambda: self.subreddit.new(limit=100),
+            keep_old=KEEP_OLD,
+        )
+        self.workers = workers
+        if workers > 1:
+            # praw rate limiter is not made for threads
+            RequestGate.install(reddit)
+        self.more_budget = more_budget
+
+    def refresh_answers(self, posts: list[OuijaPost]) -> None:
+        """Update the score of every goodbye found for unchanged posts, in a single request,
+        and choose their answers again.
+
+        The letters leading to them are checked in the same request"""
+        states = {}  # type: dict[str, PostState]
+        for post in posts:
+            if post.is_unchanged():
+                for comment_id in post.state.candidates or filter(None, [post.state.answer_id]):
+                    states[comment_id] = post.state
+                for comment_id in post.state.branches():
+                    states[comment_id] = post.state
+        if not states:
+            return
+        for comment in self._reddit.info(fullnames=["t1_" + comment_id for comment_id in states]):
+            state = states[comment.id]
+            if comment.removed or not comment.author:
+                # a goodbye or one of its letters is gone, check the whole tree again
+                state.invalidate()
+            else:
+                state.rescore(comment.id, comment.score)
+        for state in set(states.values()):
+            state.choose_answer()
+
+    def check_submission(self) -> list[OuijaPost]:
+        """Check the submission for unanswered post, return them"""
+        submissions = self.listing.fetch()
+        posts = []  # type: list[OuijaPost]
         for submission in submissions:
             if submission.distinguished:
                 if not submission.link_flair_text:
@@ -330,19 +780,94 @@ class Ouija:
                 continue
             if submission.author == self.me:
                 continue
-            post = OuijaPost(submission)
+            post = OuijaPost(submission, self.state.load_post(submission.id))
             if post.is_unanswered():
-                answer = post.process()
-                if answer:
-                    # check if the answer score is under the limit
-                    # but not if post is old and the answer score is above lower limit
-                    if post.answer_score < SCORE_LIMIT and post.answer_score < post.calc_score():
-                        # revert accept_answer
-                        post.answer_text = None
-                        post.answer_score = float("-inf")
-                        post.answer_permalink = None
-                post.change_flair()
+                posts.append(post)
+        self.refresh_answers(posts)
+        # the MoreComments budget is shared by all the posts of the run
+        budget = Budget(self.more_budget)
+        for post in posts:
+            post.more_budget = budget
+        if self.workers > 1:
+            # moderation of each post is independent, flair and PM are sent later in order
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(OuijaPost.process, posts))
+        else:
+            for post in posts:
+                post.process()
+        for post in posts:
+            post.check_score()
+            post.change_flair()
+            self.state.save_post(post.state)
+            self.notify(post)
+        self.outbox.deliver()
+        LOGGER.info(
+            "MoreComments - %d requests, %d saved, %d known",
+            sum(post.more_requests for post in posts),
+            sum(post.more_saved for post in posts),
+            sum(post.more_known for post in posts),
+        )
+        self.listing.keep(post._post for post in posts if post.answer_text is None)
+        self.state.prune(PREVIOUS)
         self.pmlist.send_next()
+        self.pmlist.checkpoint(force=True)
+        return posts
+
+    def notify(self, post: OuijaPost) -> None:
+        """Move the notifications of post to the outbox"""
+        for notification in post.notifications:
+            self.outbox.modmail(**notification)
+        post.notifications.clear()
+
+    def daemon(self, reconcile: int = RECONCILE) -> None:
+        """Moderate new comments as they arrive from the stream.
+
+        Every reconcile seconds run a full check_submission.
+        Network and server errors of reddit are retried with a backoff, like the cron did."""
+        posts = {}  # type: dict[str, OuijaPost]
+        next_check = 0.0
+        errors = 0
+        stream = None
+        while True:
+            try:
+                if stream is None:
+                    stream = self.subreddit.stream.comments(skip_existing=True, pause_after=0)
+                if time.time() >= next_check:
+                    posts = {
+                        post.id: post
+                        for post in self.check_submission()
+                        if post.answer_text is None
+                    }
+                    next_check = time.time() + reconcile
+                for comment in stream:
+                    if comment is None:
+                        # no new comments, drain the PM list a bit and check the clock
+                        self.pmlist.send_next(PM_DAEMON_BATCH)
+                        self.outbox.deliver()
+                        break
+                    post = posts.get(comment.link_id.split("_", 1)[1])
+                    if post is None:
+                        # not an unanswered post
+                        continue
+                    if post.handle_comment(comment):
+                        post.check_score()
+                        post.change_flair()
+                        if post.answer_text is not None:
+                            del posts[post.id]
+                    self.state.save_post(post.state)
+                    if post.notifications:
+                        self.notify(post)
+                        self.outbox.deliver()
+                errors = 0
+            except (prawcore.exceptions.RequestException, prawcore.exceptions.ServerError):
+                delay = min(DAEMON_BACKOFF * 2**errors, DAEMON_MAX_BACKOFF)
+                LOGGER.warning("Daemon - reddit error, retry in %d s", delay, exc_info=True)
+                errors += 1
+                time.sleep(delay)
+                # the stream is closed by the error, the comments missed meanwhile
+                # are found by a full check
+                stream = None
+                next_check = 0.0
 
     def open(self, swcaffe: str | None = None) -> None:
         """Open the subreddit to new submission"""
@@ -367,12 +892,13 @@ class Ouija:
                 submission.comments.replace_more(limit=None)
                 for comment in submission.comments:
                     if comment.distinguished:
-                        for to_notify in comment.replies:
-                            to_notify.reply(APERTURA_COMMENTO)
+                        to_notify = list(comment.replies)
                         break
                 else:
-                    for comment in submission.comments:
-                        comment.reply(APERTURA_COMMENTO)
+                    to_notify = list(submission.comments)
+                for comment in to_notify:
+                    self.outbox.reply(comment.name, APERTURA_COMMENTO, key=f"open:{comment.name}")
+                self.outbox.deliver()
                 break
         self.pmlist.start()
         # Update ambrogio_caffe
@@ -404,9 +930,10 @@ class Ouija:
         title = title + MESI[next_day.tm_mon]
         body = PROSSIMA_TESTO
         unanswered = []  # type: list[praw.reddit.models.Submission]
-        for submission in self.subreddit.new(limit=100):
+        for submission in self.listing.fetch():
             if OuijaPost(submission).is_unanswered():
                 unanswered.append(submission)
+        self.listing.keep(unanswered)
         if unanswered:
             body += PROSSIMA_APERTE
             body += "\n".join([f"* [{sub.title}]({sub.permalink})" for sub in unanswered])
@@ -422,19 +949,36 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Activate mod bot on /r/DimmiOuija ")
     parser.add_argument(
         "action",
-        choices=["check", "open", "close"],
+        choices=["check", "open", "close", "daemon"],
         default="check",
         help="The action to perform (default: %(default)s)",
     )
+    parser.add_argument(
+        "--more-budget",
+        type=int,
+        default=MORE_BUDGET,
+        help="MoreComments requests per run outside the answer branches (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Posts checked and notifications sent in parallel (default: %(default)s)",
+    )
     args = parser.parse_args()
 
-    bot = Ouija("DimmiOuija")
-    if args.action == "check":
-        bot.check_submission()
-    elif args.action == "open":
-        bot.open("italy")
-    elif args.action == "close":
-        bot.close()
+    bot = Ouija("DimmiOuija", workers=args.workers, more_budget=args.more_budget)
+    try:
+        if args.action == "check":
+            bot.check_submission()
+        elif args.action == "open":
+            bot.open("italy")
+        elif args.action == "close":
+            bot.close()
+        elif args.action == "daemon":
+            bot.daemon()
+    finally:
+        bot.meter.write(f"bot_{args.action}")
 
 
 if __name__ == "__main__":
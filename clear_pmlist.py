@@ -7,6 +7,8 @@ import time
 
 import praw
 
+from session import RequestMeter
+
 AGENT = "python:dimmi-ouja:0.3.2 (by /u/timendum)"
 
 OK_LIMIT = 2
@@ -19,8 +21,9 @@ LOGGER.setLevel(logging.INFO)
 class Cleaner:
     """Manage a list of user to message"""
 
-    def __init__(self, subreddit) -> None:
-        self.reddit = praw.Reddit(check_for_updates=False)
+    def __init__(self, subreddit, reddit: praw.Reddit | None = None) -> None:
+        self.reddit = reddit or praw.Reddit(check_for_updates=False)
+        self.meter = RequestMeter.install(self.reddit)
         rsubreddit = self.reddit.subreddit(subreddit)
         self.subreddit = subreddit
         self.wiki_main = rsubreddit.wiki["pmlist"]
@@ -54,14 +57,17 @@ class Cleaner:
                 removed_users.append(user)
         LOGGER.info("Saved: %s", ", ".join(saved_users))
         LOGGER.info("Removed: %s", ", ".join(removed_users))
-        self.wiki_main.edit("\n\n".join(saved_users), reason="Clean up")
+        self.wiki_main.edit(content="\n\n".join(saved_users), reason="Clean up")
 
 
 def main():
     """Perform action"""
 
     cleaner = Cleaner("DimmiOuija")
-    cleaner.start()
+    try:
+        cleaner.start()
+    finally:
+        cleaner.meter.write("clear_pmlist")
 
 
 if __name__ == "__main__":
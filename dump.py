@@ -1,70 +1,125 @@
 """Summarize a brief period of DimmiOuija activity"""
 
+import argparse
 import datetime
 import json
+import os
 import re
-import sqlite3
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
 import praw
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from pathlib import Path
+
     from praw.models import Comment, Submission
 
 import bot
 import ruota
+import snapshot
+from session import RequestGate, RequestMeter
+from state import ListingCursor, StateStore
+from storage import DumpStore
 
 ANSWERED_FLAIR = bot.ANSWERED["text"]
 GOODBYE = bot.GOODBYE
 RUOTA_ANSWERED = ruota.ANSWERED["text"]
+WEEK = 7 * 24 * 60 * 60
+QUESTION = "question"
+RUOTA = "ruota"
+TABLES = {QUESTION: ("questions", "comments"), RUOTA: ("ruote", "rcomments")}
+
+
+def ancestors(
+    comment: "Comment", by_name: "dict[str, Comment]", root: str
+) -> "list[Comment] | None":
+    """The chain from the top level comment down to comment, None if a link is missing"""
+    tree = [comment]
+    while tree[-1].parent_id != root:
+        parent = by_name.get(tree[-1].parent_id)
+        if parent is None:
+            return None
+        tree.append(parent)
+    tree.reverse()
+    return tree
+
+
+def deleted_letters(tree: "list[Comment]", solution: str) -> "dict[int, str] | None":
+    """Match the solution accepting [deleted] comments for any letter.
+
+    RETURNS the letter taken by each deleted comment (by index in tree), None if no match"""
+    sol = ""
+    letters = {}
+    for i in range(len(tree) - 1, -1, -1):
+        body = tree[i].body
+        if body == "[deleted]" and len(sol) < len(solution) and solution.endswith(sol):
+            # comment is deleted and the solution so far is good
+            sol = solution[-len(sol) - 1] + sol
+            letters[i] = sol[0]
+        else:
+            sol = body.strip().lstrip("\\").upper() + sol
+    if sol != solution:
+        return None
+    return letters
 
 
 def find_solution(submission: "Submission", solution: str) -> "list[Comment] | None":
     """Given a submission and the solution,
-    RETURNS the list of comment, in order, including the Goodbye"""
+    RETURNS the list of comment, in order, including the Goodbye.
+
+    Ancestors are taken from the expanded comments, without other requests.
+    If no chain matches exactly, [deleted] comments can stand for the missing letters."""
     submission.comments.replace_more(limit=None)
-    for comment in submission.comments.list():
+    comments = submission.comments.list()
+    by_name = {comment.name: comment for comment in comments}
+    fallback = None  # type: tuple[list[Comment], dict[int, str]] | None
+    for comment in comments:
         if comment.removed:
             continue
         if comment.distinguished:
             continue
-        if GOODBYE.match(comment.body.strip()):
-            # solution candidate!
-            tree = [comment]
-            sol = ""
-            while tree[0].parent() != submission:
-                tree = [tree[0].parent()] + tree
-                sol = tree[0].body.strip().lstrip("\\").upper() + sol
-            if sol == solution:
-                return tree
-    # Solution not found, include deleted
-    for comment in submission.comments.list():
-        if comment.removed:
+        if not GOODBYE.match(comment.body.strip()):
             continue
-        if comment.distinguished:
+        # solution candidate!
+        tree = ancestors(comment, by_name, submission.name)
+        if tree is None:
             continue
-        if GOODBYE.match(comment.body.strip()):
-            # solution candidate!
-            tree = [comment]
-            sol = ""
-            while tree[0].parent() != submission:
-                tree = [tree[0].parent()] + tree
-                if tree[0].body == "[deleted]" and solution[-len(sol) :] == sol:
-                    # comment is deleted and the solution so far is good
-                    sol = solution[-len(sol) - 1] + sol
-                elif tree[0].body == "[deleted]" and len(sol) == 0:
-                    # comment is deleted and solution is empty
-                    sol = solution[-1]
-                else:
-                    sol = tree[0].body.strip().lstrip("\\").upper() + sol
-            if sol == solution:
-                # tree is ok
-                for i, c in enumerate(tree):
-                    if c.body == "[deleted]":
-                        # overwrite body
-                        c.__dict__["body"] = solution[i]
-                return tree
-    return None
+        letters = tree[:-1]
+        if "".join(c.body.strip().lstrip("\\").upper() for c in letters) == solution:
+            return tree
+        if fallback is None:
+            deleted = deleted_letters(letters, solution)
+            if deleted is not None:
+                fallback = (tree, deleted)
+    if fallback is None:
+        return None
+    tree, deleted = fallback
+    for i, letter in deleted.items():
+        # overwrite body
+        tree[i].__dict__["body"] = letter
+    return tree
+
+
+def map_threads(function: Callable, questions: Iterable, workers: int = 1) -> Iterator:
+    """Apply function to every question, on a pool of workers if more than one.
+
+    Yields the results in the order of questions, reading at most 2 * workers of them ahead"""
+    if workers <= 1:
+        for question in questions:
+            yield function(question)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+        for question in questions:
+            pending.append(executor.submit(function, question))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 def author(content: praw.models.reddit.mixins.UserContentMixin) -> str:
@@ -74,144 +129,296 @@ def author(content: praw.models.reddit.mixins.UserContentMixin) -> str:
     return "[deleted]"
 
 
+def parse_comment(comment: "Comment", strip: bool = False) -> dict:
+    """The fields of a comment, strip its body for ruote"""
+    return {
+        "body": comment.body.strip() if strip else comment.body,
+        "name": comment.name,
+        "score": comment.score,
+        "permalink": comment.permalink,
+        "created_utc": comment.created_utc,
+        "author": author(comment),
+    }
+
+
+def thread_comments(question: dict) -> list[dict] | None:
+    """The comments of the solution of a question, None if not found"""
+    comments = find_solution(question["_thread"], question["answer"])
+    if not comments:
+        return None
+    return [parse_comment(comment) for comment in comments]
+
+
+def ruota_comments(question: dict) -> list[dict] | None:
+    """The comments of a ruota, None without the solution"""
+    comments = []
+    question["_thread"].comments.replace_more(limit=None)
+    solution = False
+    for c in question["_thread"].comments.list():
+        if c.removed:
+            continue
+        if c.distinguished:
+            continue
+        if c.locked:
+            continue
+        body = c.body.strip().upper()
+        if len(body) > 1:
+            if re.sub(r"\W+", "", body) != re.sub(r"\W+", "", question["answer"]):
+                continue
+            solution = True
+        comments.append(parse_comment(c, strip=True))
+    if not solution:
+        return None
+    return sorted(comments, key=lambda c: (len(c["body"]), c["created_utc"]))
+
+
+FETCH = {QUESTION: thread_comments, RUOTA: ruota_comments}
+
+
 class Dumper:
     """Save answered thead in a json"""
 
-    def __init__(self, subreddit: str) -> None:
-        """Initialize."""
-        reddit = praw.Reddit(check_for_updates=False, client_secret=None)
+    def __init__(
+        self,
+        subreddit: str,
+        reddit: praw.Reddit | None = None,
+        workers: int = 1,
+        snapshots: bool = False,
+    ) -> None:
+        """Initialize.
+
+        subreddit = DimmiOuija subreddit
+        reddit = the praw instance to use, default from praw.ini
+        workers = number of threads fetched in parallel
+        snapshots = archive the comments of every fetched thread, see snapshot.py
+        """
+        reddit = reddit or praw.Reddit(check_for_updates=False, client_secret=None)
+        self.meter = RequestMeter.install(reddit)
+        self.workers = workers
+        self.snapshots = snapshots
+        if workers > 1:
+            # praw rate limiter is not made for threads
+            RequestGate.install(reddit)
         self.subreddit = reddit.subreddit(subreddit)
-        self._con = sqlite3.connect("data/dump.sqlite3")
+        self._store = DumpStore()
         self.week: str | None = None
+        self.listing = ListingCursor(
+            StateStore(),
+            reddit,
+            self.subreddit,
+            "week",
+            WEEK,
+            lambda: self.subreddit.top(time_filter="week", limit=None),
+        )
+        self._submissions: list[Submission] | None = None
+        self._classified: tuple[list[dict], list[dict]] | None = None
+
+    def week_submissions(self) -> "list[Submission]":
+        """Return the submissions of the last week, by score like the top listing"""
+        if self._submissions is None:
+            submissions = self.listing.fetch()
+            self.listing.keep(submissions)
+            self._submissions = sorted(submissions, key=lambda s: s.score, reverse=True)
+        return self._submissions
+
+    def classify(self) -> tuple[list[dict], list[dict]]:
+        """Read the week listing once, RETURNS the answered questions and ruote"""
+        if self._classified is None:
+            questions = []  # type: list[dict]
+            ruote = []  # type: list[dict]
+            for submission in self.week_submissions():
+                kind = self.kind(submission)
+                if kind == QUESTION:
+                    questions.append(self.parse_question(submission))
+                elif kind == RUOTA:
+                    ruote.append(self.parse_ruota(submission))
+                    print("Ruota: ", submission.permalink)
+                else:
+                    print("Skipped: ", submission.permalink)
+            if questions:
+                self._update_week(questions[0]["created_utc"])
+            self._classified = (questions, ruote)
+        return self._classified
+
+    @staticmethod
+    def kind(submission: "Submission") -> str | None:
+        """QUESTION or RUOTA if answered, None otherwise"""
+        flair = submission.link_flair_text or ""
+        if flair.startswith(ANSWERED_FLAIR):
+            return QUESTION
+        if flair.startswith(RUOTA_ANSWERED):
+            return RUOTA
+        return None
+
+    @staticmethod
+    def parse_question(submission: "Submission") -> dict:
+        """The fields of an answered question"""
+        return {
+            "title": submission.title,
+            "url": submission.url,
+            "name": submission.name,
+            "score": submission.score,
+            "created_utc": submission.created_utc,
+            "_thread": submission,
+            "author": author(submission),
+            "permalink": submission.permalink,
+            "answer": submission.link_flair_text.replace(ANSWERED_FLAIR, ""),
+        }
+
+    @staticmethod
+    def parse_ruota(submission: "Submission") -> dict:
+        """The fields of a solved ruota"""
+        answer_row = submission.selftext.strip().split("\n")[2]
+        return {
+            "title": submission.title,
+            "url": submission.url,
+            "name": submission.name,
+            "score": submission.score,
+            "created_utc": submission.created_utc,
+            "_thread": submission,
+            "author": author(submission),
+            "permalink": submission.permalink,
+            "answer": ":".join(answer_row.split(":")[1:]).strip(),
+        }
 
     def get_questions(self) -> list[dict]:
         """Check the hot submission of answered posts"""
-        submissions = self.subreddit.top(time_filter="week", limit=None)
-        questions = []  # type: list[dict]
-
-        def parse_submission(submission: "Submission") -> None:
-            """Add the submission to text"""
-            params = {
-                "title": submission.title,
-                "url": submission.url,
-                "name": submission.name,
-                "score": submission.score,
-                "created_utc": submission.created_utc,
-                "_thread": submission,
-                "author": author(submission),
-                "permalink": submission.permalink,
-                "answer": submission.link_flair_text.replace(ANSWERED_FLAIR, ""),
-            }
-            questions.append(params)
-
-        for submission in submissions:
-            if not submission.link_flair_text or not submission.link_flair_text.startswith(
-                ANSWERED_FLAIR
-            ):
-                print("Skipped: ", submission.permalink)
-                continue
-            parse_submission(submission)
-            self._update_week(questions)
-        return questions
+        return self.classify()[0]
 
-    def _update_week(self, questions):
-        self.week = datetime.datetime.fromtimestamp(questions[0]["created_utc"]).strftime("%Y_%W")
+    def _update_week(self, created_utc: float) -> None:
+        self.week = datetime.datetime.fromtimestamp(created_utc).strftime("%Y_%W")
 
     def get_ruota(self) -> list[dict]:
         """Check the hot submission of answered ruota"""
-        submissions = self.subreddit.top(time_filter="week", limit=None)
-        questions = []  # type: list[dict]
-
-        def parse_submission(submission: "Submission") -> None:
-            """Add the submission to text"""
-            answer_row = submission.selftext.strip().split("\n")[2]
-            params = {
-                "title": submission.title,
-                "url": submission.url,
-                "name": submission.name,
-                "score": submission.score,
-                "created_utc": submission.created_utc,
-                "_thread": submission,
-                "author": author(submission),
-                "permalink": submission.permalink,
-                "answer": ":".join(answer_row.split(":")[1:]).strip(),
-            }
-            questions.append(params)
-
-        for submission in submissions:
-            if not submission.link_flair_text or not submission.link_flair_text.startswith(
-                RUOTA_ANSWERED
-            ):
-                continue
-            parse_submission(submission)
-            print("Ruota: ", submission.permalink)
-        return questions
+        return self.classify()[1]
 
     @staticmethod
-    def add_ruota(questions) -> None:
-        """Add comments section to ruota"""
-
-        def parse_comment(comment: "Comment") -> dict:
-            """Add the submission to text"""
-            params = {
-                "body": comment.body.strip(),
-                "name": comment.name,
-                "score": comment.score,
-                "permalink": comment.permalink,
-                "created_utc": comment.created_utc,
-                "author": author(comment),
-            }
-            return params
+    def add_ruota(
+        questions, workers: int = 1, on_done: Callable[[dict], None] | None = None
+    ) -> None:
+        """Add comments section to ruota, fetching workers threads in parallel.
 
-        for question in questions:
-            comments = []
-            question["_thread"].comments.replace_more(limit=None)
-            solution = False
-            for c in question["_thread"].comments.list():
-                if c.removed:
-                    continue
-                if c.distinguished:
-                    continue
-                if c.locked:
-                    continue
-                body = c.body.strip().upper()
-                if len(body) > 1:
-                    if re.sub(r"\W+", "", body) != re.sub(r"\W+", "", question["answer"]):
-                        continue
-                    solution = True
-                comments.append(parse_comment(c))
-            if not solution:
+        on_done is called with each ruota, in order, as soon as it is parsed"""
+        for question, comments in zip(
+            questions, map_threads(ruota_comments, questions, workers), strict=True
+        ):
+            if comments is None:
                 print("No solution found:", question["_thread"])
                 question["comments"] = []
             else:
-                comments = sorted(comments, key=lambda c: (len(c["body"]), c["created_utc"]))
                 question["comments"] = comments
+            if on_done:
+                on_done(question)
             del question["_thread"]
 
     @staticmethod
-    def add_threads(questions) -> None:
-        """Add comments section to questions"""
-
-        def parse_comment(comment: "Comment") -> dict:
-            """Add the submission to text"""
-            params = {
-                "body": comment.body,
-                "name": comment.name,
-                "score": comment.score,
-                "permalink": comment.permalink,
-                "created_utc": comment.created_utc,
-                "author": author(comment),
-            }
-            return params
+    def add_threads(
+        questions, workers: int = 1, on_done: Callable[[dict], None] | None = None
+    ) -> None:
+        """Add comments section to questions, fetching workers threads in parallel.
 
-        for question in questions:
-            comments = find_solution(question["_thread"], question["answer"])
-            if not comments:
+        on_done is called with each question, in order, as soon as it is parsed"""
+        for question, comments in zip(
+            questions, map_threads(thread_comments, questions, workers), strict=True
+        ):
+            if comments is None:
                 print("No solution found:", question["_thread"])
             else:
-                question["comments"] = [parse_comment(comment) for comment in comments]
+                question["comments"] = comments
+            if on_done:
+                on_done(question)
             del question["_thread"]
 
+    def records(self) -> "Iterator[tuple[str, dict]]":
+        """Stream the (kind, record) of the week in listing order:
+        classify, fetch, parse and save one thread at a time.
+
+        Threads saved by a previous run are restored without fetching them, unless
+        snapshots: the snapshot must have every thread of the week.
+        Each submission is released as soon as its record is saved."""
+        submissions = deque(self.week_submissions())
+        self._submissions = None
+        first = next((s for s in submissions if self.kind(s) == QUESTION), None)
+        if first:
+            self._update_week(first.created_utc)
+        archive = None
+        if self.snapshots and self.week:
+            archive = snapshot.Archive(snapshot.snapshot_path(self.week))
+
+        def classified() -> "Iterator[tuple[str, dict]]":
+            while submissions:
+                submission = submissions.popleft()
+                kind = self.kind(submission)
+                if kind is None:
+                    print("Skipped: ", submission.permalink)
+                    continue
+                if kind == RUOTA:
+                    print("Ruota: ", submission.permalink)
+                parse = self.parse_question if kind == QUESTION else self.parse_ruota
+                question = parse(submission)
+                if not archive:
+                    self.restore(question, kind)
+                yield kind, question
+
+        def fetch(item: tuple[str, dict]) -> tuple[str, dict, list[dict] | None, dict | None]:
+            kind, question = item
+            if "_thread" not in question:
+                # restored
+                return kind, question, None, None
+            data = None
+            if archive:
+                # before parsing, that fills in the body of deleted comments
+                question["_thread"].comments.replace_more(limit=None)
+                data = snapshot.snapshot(question["_thread"])
+            return kind, question, FETCH[kind](question), data
+
+        def stream() -> "Iterator[tuple[str, dict]]":
+            complete = False
+            try:
+                for kind, question, comments, data in map_threads(
+                    fetch, classified(), self.workers
+                ):
+                    if "_thread" in question:
+                        if comments is None:
+                            print("No solution found:", question["_thread"])
+                            if kind == RUOTA:
+                                question["comments"] = []
+                        else:
+                            question["comments"] = comments
+                        if data:
+                            archive.add(data)
+                        self.save(question, kind)
+                        del question["_thread"]
+                    yield kind, question
+                complete = True
+            finally:
+                if archive:
+                    archive.close(complete)
+
+        return stream()
+
+    def write_records(self, records: "Iterable[tuple[str, dict]]") -> None:
+        """Write the records to data/<week>.json and data/<week>-ruote.json as they come.
+
+        The files are JSON arrays with a record per line, replaced only when complete"""
+        paths = {QUESTION: f"data/{self.week}.json", RUOTA: f"data/{self.week}-ruote.json"}
+        files = {kind: open(path + ".tmp", "w", encoding="utf-8") for kind, path in paths.items()}
+        try:
+            separators = dict.fromkeys(files, "[\n")
+            for kind, record in records:
+                files[kind].write(separators[kind] + json.dumps(record))
+                separators[kind] = ",\n"
+            for kind, fout in files.items():
+                fout.write("[]\n" if separators[kind] == "[\n" else "\n]\n")
+        finally:
+            for fout in files.values():
+                fout.close()
+        for path in paths.values():
+            os.replace(path + ".tmp", path)
+        # the aggregates of the whole week, with the threads saved by a failed run
+        self._store.touch(self.week)
+        self._store.commit()
+
     def write_json(self, questions, ruote):
         """Write variablies to JSON"""
         with open(f"data/{self.week}.json", "w", encoding="utf-8") as fout:
@@ -221,95 +428,107 @@ class Dumper:
 
     def to_sql(self, questions, ruote) -> None:
         """Write variablies to Sqlite file"""
-        cur = self._con.cursor()
-        cur.executemany(
-            """INSERT OR REPLACE INTO questions(
-            id,
-            title,
-            score,
-            created_utc,
-            author,
-            permalink,
-            answer,
-            week) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            [
-                (
-                    q["name"],
-                    q["title"],
-                    q["score"],
-                    int(q["created_utc"]),
-                    q["author"],
-                    q["permalink"],
-                    q["answer"],
-                    self.week,
-                )
-                for q in questions
-            ],
-        )
-        cur.executemany(
-            """INSERT OR REPLACE into comments(
-            id,
-            parent_id,
-            body,
-            created_utc,
-            author,
-            score) VALUES (?, ?, ?, ?, ?, ?)""",
-            [
-                (c["name"], q["name"], c["body"], int(c["created_utc"]), c["author"], c["score"])
-                for q in questions
-                for c in q["comments"]
-            ],
-        )
-        cur.executemany(
-            """INSERT OR REPLACE INTO ruote(
-            id,
-            title,
-            score,
-            created_utc,
-            author,
-            permalink,
-            answer,
-            week) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            [
-                (
-                    q["name"],
-                    q["title"],
-                    q["score"],
-                    int(q["created_utc"]),
-                    q["author"],
-                    q["permalink"],
-                    q["answer"],
-                    self.week,
-                )
-                for q in ruote
-            ],
-        )
-        cur.executemany(
-            """INSERT OR REPLACE into rcomments(
-            id,
-            parent_id,
-            body,
-            created_utc,
-            author,
-            score) VALUES (?, ?, ?, ?, ?, ?)""",
-            [
-                (c["name"], q["name"], c["body"], int(c["created_utc"]), c["author"], c["score"])
-                for q in ruote
-                for c in q["comments"]
-            ],
-        )
-        self._con.commit()
+        self._store.insert(*TABLES[QUESTION], questions, self.week)
+        self._store.insert(*TABLES[RUOTA], ruote, self.week)
+        self._store.commit()
+
+    def save(self, question: dict, kind: str) -> None:
+        """Commit a parsed question (or ruota) and its checkpoint, before the next thread"""
+        record = {key: value for key, value in question.items() if key != "_thread"}
+        checkpoint = (kind, question["score"], question["_thread"].num_comments, json.dumps(record))
+        self._store.save(*TABLES[kind], question, self.week, checkpoint)
+
+    def restore(self, question: dict, kind: str) -> bool:
+        """Restore a question (or ruota) saved by a previous run, if unchanged since"""
+        row = self._store.checkpoint(question["name"], kind)
+        if not row or row[:2] != (question["score"], question["_thread"].num_comments):
+            return False
+        record = json.loads(row[2])
+        if "comments" in record:
+            question["comments"] = record["comments"]
+        del question["_thread"]
+        return True
+
+    def resume(self, questions: list[dict], kind: str) -> list[dict]:
+        """Restore the questions (or ruote) saved by a previous run, if unchanged since.
+
+        RETURNS the ones still to fetch"""
+        pending = [question for question in questions if not self.restore(question, kind)]
+        if len(pending) < len(questions):
+            print(f"Resumed {kind}: {len(questions) - len(pending)}/{len(questions)}")
+        return pending
+
+
+class SnapshotDumper(Dumper):
+    """A Dumper reading the threads of a week from its snapshot file, without reddit"""
+
+    def __init__(self, path: "Path") -> None:
+        """Initialize."""
+        self._store = DumpStore()
+        self.week: str | None = None
+        self.workers = 1
+        self.snapshots = False
+        self._path = path
+        self._submissions: list[Submission] | None = None
+        self._classified: tuple[list[dict], list[dict]] | None = None
+
+    def week_submissions(self) -> "list[snapshot.SnapshotSubmission]":
+        """Return the submissions of the snapshot, by score like the top listing"""
+        if self._submissions is None:
+            submissions = [snapshot.SnapshotSubmission(data) for data in snapshot.load(self._path)]
+            self._submissions = sorted(submissions, key=lambda s: s.score, reverse=True)
+        return self._submissions
+
+    def restore(self, question: dict, kind: str) -> bool:
+        """Parse every thread again"""
+        return False
+
+
+def rederive() -> None:
+    """Rebuild the tables and the weekly JSON of every week with a complete snapshot"""
+    for week, path in snapshot.weeks():
+        print("Week:", week)
+        if not snapshot.is_complete(path):
+            print("Incomplete snapshot, skipped:", path)
+            continue
+        dumper = SnapshotDumper(path)
+        records = dumper.records()
+        if dumper.week != week:
+            print("No questions of the week in the snapshot, skipped:", path)
+            continue
+        dumper.write_records(records)
 
 
 def main():
     """Perform all bot actions"""
-    summary = Dumper("DimmiOuija")
-    questions = summary.get_questions()
-    summary.add_threads(questions)
-    ruote = summary.get_ruota()
-    summary.add_ruota(ruote)
-    summary.to_sql(questions, ruote)
-    summary.write_json(questions, ruote)
+    parser = argparse.ArgumentParser(description="Dump the last week of /r/DimmiOuija")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of threads to fetch in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--snapshots",
+        action="store_true",
+        help=f"Archive the fetched threads in {snapshot.SNAPSHOT_DIR}",
+    )
+    parser.add_argument(
+        "--rederive",
+        action="store_true",
+        help="Rebuild the dump of every archived week from the snapshots, without reddit",
+    )
+    args = parser.parse_args()
+
+    if args.rederive:
+        rederive()
+        return
+    summary = Dumper("DimmiOuija", workers=args.workers, snapshots=args.snapshots)
+    try:
+        # every thread is saved as soon as it is parsed, a new run fetches only the missing ones
+        summary.write_records(summary.records())
+    finally:
+        summary.meter.write("dump")
 
 
 if __name__ == "__main__":
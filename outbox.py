@@ -0,0 +1,158 @@
+"""Durable outbox of the notifications sent by the bot"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+
+import praw
+import prawcore
+
+from session import RequestGate, retry_after
+from state import NOTIFY_FAILED, NOTIFY_PENDING, NOTIFY_SENT, StateStore
+
+if TYPE_CHECKING:
+    from praw.models import Subreddit
+
+REPLY = "reply"  # target = fullname of the comment
+MODMAIL = "modmail"  # target = username, the conversation is archived
+ARCHIVE = "archive"  # target = id of a modmail conversation whose archive failed
+WORKERS = 1  # more than one installs session.RequestGate
+MAX_ATTEMPTS = 5
+BACKOFF = 30  # seconds, doubled on every failed attempt
+
+LOGGER = logging.getLogger(__file__)
+LOGGER.addHandler(logging.NullHandler())
+LOGGER.setLevel(logging.INFO)
+
+
+class Outbox:
+    """Deliver the notifications stored in the state database with a pool of workers.
+
+    Adding a notification only writes it down, deliver() sends the due ones.
+    A RATELIMIT error or a 429 response pauses every worker until the delay asked by reddit."""
+
+    def __init__(
+        self,
+        reddit: praw.Reddit,
+        subreddit: "Subreddit",
+        state: StateStore,
+        workers: int = WORKERS,
+    ) -> None:
+        """Initialize.
+
+        workers = number of notifications sent in parallel
+        """
+        self._reddit = reddit
+        self.subreddit = subreddit
+        self.state = state
+        self.workers = workers
+        if workers > 1:
+            # praw rate limiter is not made for threads
+            RequestGate.install(reddit)
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+
+    def reply(self, comment_fullname: str, body: str, key: str | None = None) -> bool:
+        """Reply to a comment"""
+        return self.state.enqueue(
+            key or f"{REPLY}:{comment_fullname}", REPLY, comment_fullname, None, body
+        )
+
+    def modmail(self, recipient: str, subject: str, body: str, key: str) -> bool:
+        """Send a modmail to recipient"""
+        return self.state.enqueue(key, MODMAIL, recipient, subject, body)
+
+    def deliver(self, limit: int | None = None) -> int:
+        """Send the due notifications, return the number sent"""
+        now = time.time()
+        if now < self._pause_until:
+            return 0
+        due = self.state.due_notifications(now, limit)
+        if not due:
+            return 0
+        sent = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._send, *row[1:5]): row for row in due}
+            for future in as_completed(futures):
+                notification_id, kind, target, _, _, attempts = futures[future]
+                try:
+                    status, next_utc, archive = future.result()
+                except Exception:
+                    # the other sends of the batch are still marked
+                    LOGGER.exception("Outbox - error sending %s to %s", kind, target)
+                    status, next_utc, archive = NOTIFY_PENDING, 0.0, None
+                if archive:
+                    # the modmail is sent, only the archive is tried again
+                    self.state.enqueue(f"{ARCHIVE}:{archive}", ARCHIVE, archive, None, "")
+                if status == NOTIFY_PENDING and attempts + 1 >= MAX_ATTEMPTS:
+                    LOGGER.error("Outbox - giving up %s to %s", kind, target)
+                    status = NOTIFY_FAILED
+                elif status == NOTIFY_PENDING and not next_utc:
+                    next_utc = time.time() + BACKOFF * 2**attempts
+                self.state.mark_notification(notification_id, status, next_utc)
+                sent += status == NOTIFY_SENT
+        LOGGER.info("Outbox - %d/%d sent", sent, len(due))
+        return sent
+
+    def _send(
+        self, kind: str, target: str, subject: str | None, body: str
+    ) -> tuple[str, float, str | None]:
+        """Send a notification, return its new status, when to try again
+        and the modmail conversation still to archive"""
+        with self._lock:
+            pause_until = self._pause_until
+        if time.time() < pause_until:
+            return NOTIFY_PENDING, pause_until, None
+        archive = None  # type: str | None
+        try:
+            if kind == REPLY:
+                self._reddit.comment(target.split("_", 1)[1]).reply(body)
+            elif kind == ARCHIVE:
+                self.subreddit.modmail(target).archive()
+            else:
+                modconv = self.subreddit.modmail.create(
+                    recipient=target, subject=subject, body=body
+                )
+                if not modconv.is_internal:
+                    archive = modconv.id
+                    modconv.archive()
+                    archive = None
+        except praw.exceptions.RedditAPIException as e:
+            status, next_utc = NOTIFY_FAILED, 0.0
+            for subexception in e.items:
+                if subexception.error_type == "RATELIMIT":
+                    status, next_utc = (
+                        NOTIFY_PENDING,
+                        self._pause(retry_after(subexception.message)),
+                    )
+                    break
+            else:
+                LOGGER.exception("Outbox - error sending %s to %s", kind, target)
+        except prawcore.exceptions.TooManyRequests as e:
+            LOGGER.warning("Outbox - too many requests sending %s to %s", kind, target)
+            delay = float(e.retry_after) if e.retry_after else BACKOFF
+            status, next_utc = NOTIFY_PENDING, self._pause(delay)
+        except prawcore.exceptions.RequestException:
+            LOGGER.warning("Outbox - network error sending %s to %s", kind, target)
+            status, next_utc = NOTIFY_PENDING, 0.0
+        except prawcore.exceptions.ServerError:
+            LOGGER.warning("Outbox - server error sending %s to %s", kind, target)
+            status, next_utc = NOTIFY_PENDING, 0.0
+        except prawcore.exceptions.ResponseException:
+            # Forbidden, NotFound...: sending again would not help
+            LOGGER.exception("Outbox - error sending %s to %s", kind, target)
+            status, next_utc = NOTIFY_FAILED, 0.0
+        else:
+            return NOTIFY_SENT, 0, None
+        if archive:
+            # sending again would duplicate the modmail
+            return NOTIFY_SENT, 0, archive
+        return status, next_utc, None
+
+    def _pause(self, seconds: float) -> float:
+        """Pause every worker for seconds at least, return when they start again"""
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.time() + seconds)
+            return self._pause_until
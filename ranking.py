@@ -0,0 +1,31 @@
+"""Top-k and bottom-k with ties, in O(n log k) instead of sorting everything"""
+
+import heapq
+from collections.abc import Callable, Collection
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+def top(items: Collection[T], k: int, key: Callable[[T], Any]) -> list[T]:
+    """The items with a key at least as large as the k-th largest one, largest first.
+
+    Items with the same key keep their order, like sorted()"""
+    if k <= 0 or not items:
+        return []
+    keys = [key(item) for item in items]
+    limit = heapq.nlargest(k, keys)[-1]
+    ranked = [item for item, value in zip(items, keys, strict=True) if value >= limit]
+    return sorted(ranked, key=key, reverse=True)
+
+
+def bottom(items: Collection[T], k: int, key: Callable[[T], Any]) -> list[T]:
+    """The items with a key at most as small as the k-th smallest one, smallest first.
+
+    Items with the same key keep their order, like sorted()"""
+    if k <= 0 or not items:
+        return []
+    keys = [key(item) for item in items]
+    limit = heapq.nsmallest(k, keys)[-1]
+    ranked = [item for item, value in zip(items, keys, strict=True) if value <= limit]
+    return sorted(ranked, key=key)
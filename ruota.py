@@ -10,6 +10,9 @@ from datetime import datetime, timedelta
 
 import praw
 
+from session import RequestMeter
+from state import ListingCursor, StateStore
+
 MAX_LETTERS = 1  #   max attempts in DELTA_LETTERS hours
 MAX_ANSWERS = 2  #   max attempts in DELTA_ANSWERS hours
 DELTA_LETTERS = 1  # after how many hours we reset the number of attempts for LETTERS
@@ -296,17 +299,27 @@ class OuijaPost:
 class Ouija:
     """Contain all bot logic."""
 
-    def __init__(self, subreddit: str) -> None:
+    def __init__(self, subreddit: str, reddit: praw.Reddit | None = None) -> None:
         """Initialize.
 
         subreddit = DimmiOuija subreddit
+        reddit = the praw instance to use, default from praw.ini
         """
-        reddit = praw.Reddit(check_for_updates=False, client_secret=None)
+        reddit = reddit or praw.Reddit(check_for_updates=False, client_secret=None)
         reddit.validate_on_submit = True
         self._reddit = reddit
+        self.meter = RequestMeter.install(reddit)
         self.me = reddit.user.me()
         self.subreddit = reddit.subreddit(subreddit)
         self.solution = self.subreddit.wiki["rdellaf"].content_md.strip().upper()
+        self.listing = ListingCursor(
+            StateStore(),
+            reddit,
+            self.subreddit,
+            "ruota",
+            TIME_LIMIT,
+            lambda: self.subreddit.new(limit=100),
+        )
 
     def _title_count(self) -> str:
         return " ".join(
@@ -352,7 +365,12 @@ Ogni giocatore può:
 
     def check_submission(self) -> bool:
         """Check the submission for an unanswered post"""
-        submissions = self.subreddit.new(limit=100)
+        submissions = self.listing.fetch()
+        self.listing.keep(
+            submission
+            for submission in submissions
+            if submission.link_flair_text in (UNANSWERED["text"], ANSWERED["text"])
+        )
         for submission in submissions:
             if not submission.link_flair_text:
                 continue
@@ -364,13 +382,10 @@ Ogni giocatore può:
                         submission.mod.flair(**ANSWERED)
                 return True
             if submission.link_flair_text == ANSWERED["text"]:
-                try:
-                    post = OuijaPost(submission, self.solution)
-                    if self.solution in post.current_revealed:
-                        LOGGER.debug("Found solved %s", post)
-                        return True
-                except ValueError:
-                    continue
+                # OuijaPost does not parse solved ruote, the solution is revealed in the text
+                if self.solution in submission.selftext.upper():
+                    LOGGER.debug("Found solved %s", submission.permalink)
+                    return True
         return False
 
     def work(self):
@@ -404,12 +419,15 @@ def main() -> None:
         LOGGER.addHandler(logging.StreamHandler(sys.stdout))
         LOGGER.setLevel(logging.DEBUG)
 
-    if args.action == "check":
-        bot.check_submission()
-    elif args.action == "open":
-        bot.open()
-    elif args.action == "work":
-        bot.work()
+    try:
+        if args.action == "check":
+            bot.check_submission()
+        elif args.action == "open":
+            bot.open()
+        elif args.action == "work":
+            bot.work()
+    finally:
+        bot.meter.write(f"ruota_{args.action}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+"""Helpers around the praw session shared by the bot actions"""
+
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import praw
+from prawcore.rate_limit import RateLimiter
+
+NANOSECONDS = 1_000_000_000
+RETRY_DELAY = 10 * 60  # wait after a RATELIMIT error without a delay in the message
+METRICS_LOG = "data/requests.jsonl"  # a line for every run
+METRICS_DIR = "data/metrics"  # a Prometheus textfile for every action
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+ENDPOINTS = [  # path pattern, endpoint name
+    (r"api/v1/access_token", "access_token"),
+    (r"api/v1/me", "me"),
+    (r"api/info", "info"),
+    (r"r/[^/]+/(new|hot|top|rising|controversial)", "listing"),
+    (r"r/[^/]+/comments", "subreddit_comments"),
+    (r"r/[^/]+/about/sticky", "sticky"),
+    (r"r/[^/]+/about/moderators", "moderators"),
+    (r"r/[^/]+/api/wiki/edit", "wiki_edit"),
+    (r"r/[^/]+/wiki/.+", "wiki"),
+    (r"r/[^/]+/api/(selectflair|flair)", "flair"),
+    (r"(r/[^/]+/)?comments/.+", "comments"),
+    (r"api/morechildren", "morechildren"),
+    (r"api/comment", "comment"),
+    (r"api/submit", "submit"),
+    (r"api/editusertext", "edit"),
+    (r"api/remove", "remove"),
+    (r"api/mod/conversations.*", "modmail"),
+    (r"api/compose", "message"),
+    (r"api/(lock|distinguish|set_subreddit_sticky|set_suggested_sort)", "moderation"),
+]
+_ENDPOINTS = [(re.compile(pattern + "/?$"), name) for pattern, name in ENDPOINTS]
+
+
+def retry_after(message: str | None) -> int:
+    """Seconds to wait, from a RATELIMIT error message"""
+    match = re.search(r"(\d+) (second|minute)", message or "")
+    if not match:
+        return RETRY_DELAY
+    return int(match.group(1)) * (60 if match.group(2) == "minute" else 1)
+
+
+class RequestGate(RateLimiter):
+    """A prawcore RateLimiter that can be shared by many threads.
+
+    Every request reserves a slot, slots are spaced to spread the requests
+    remaining in the rate limit window until its reset.
+
+    Works with the positional call of prawcore 2 and the keyword one of later versions."""
+
+    def __init__(self, window_size: int = 600) -> None:
+        """Initialize."""
+        super().__init__(window_size=window_size)
+        self._lock = threading.Lock()
+        self._next_slot_ns = 0
+        self._reset_ns = 0
+
+    @classmethod
+    def install(cls, reddit: praw.Reddit) -> "RequestGate":
+        """Use a gate for all the requests of reddit, reuse the installed one"""
+        if isinstance(reddit._core._rate_limiter, cls):
+            return reddit._core._rate_limiter
+        gate = cls(window_size=reddit.config.window_size)
+        for core in (reddit._authorized_core, reddit._read_only_core):
+            if core is not None:
+                core._rate_limiter = gate
+        return gate
+
+    def __deepcopy__(self, memo: dict) -> "RequestGate":
+        # prawcore deep copies the request data, that may hold praw objects (and so the gate)
+        return self
+
+    def call(self, *args, **kwargs):
+        """Wait for a slot, then perform the request.
+
+        prawcore 2 passes request_function, set_header_callback, method and url
+        positionally, later versions pass them all by keyword"""
+        if "request_function" in kwargs:
+            request_function = kwargs.pop("request_function")
+            set_header_callback = kwargs.pop("set_header_callback")
+            args = (kwargs.pop("method"), kwargs.pop("url"))
+        else:
+            request_function, set_header_callback, *args = args
+        self.delay()
+        with self._lock:
+            kwargs["headers"] = set_header_callback()
+        response = request_function(*args, **kwargs)
+        with self._lock:
+            self.update(response_headers=response.headers)
+        return response
+
+    def _next_request_ns(self) -> int:
+        """When prawcore would allow the next request, on the monotonic clock"""
+        next_ns = getattr(self, "next_request_timestamp_ns", None)
+        if next_ns is not None:
+            return next_ns
+        # prawcore 2 keeps a wall clock timestamp in seconds
+        next_timestamp = getattr(self, "next_request_timestamp", None)
+        if next_timestamp is None:
+            return 0
+        return time.monotonic_ns() + int((next_timestamp - time.time()) * NANOSECONDS)
+
+    def delay(self) -> None:
+        """Reserve the next slot and sleep until it comes"""
+        with self._lock:
+            now_ns = time.monotonic_ns()
+            slot_ns = max(now_ns, self._next_slot_ns, self._next_request_ns())
+            self._next_slot_ns = slot_ns + self._spacing_ns(slot_ns)
+        if slot_ns > now_ns:
+            time.sleep((slot_ns - now_ns) / NANOSECONDS)
+
+    def update(self, response_headers) -> None:
+        """Update the state of the gate based on the response headers"""
+        super().update(response_headers=response_headers)
+        if "x-ratelimit-reset" in response_headers:
+            reset = int(response_headers["x-ratelimit-reset"])
+            self._reset_ns = time.monotonic_ns() + reset * NANOSECONDS
+
+    def _spacing_ns(self, slot_ns: int) -> int:
+        """Time between two slots, to make the remaining requests last until the reset"""
+        if self.remaining is None or slot_ns >= self._reset_ns:
+            return 0
+        return int((self._reset_ns - slot_ns) // max(self.remaining, 1))
+
+
+def endpoint(method: str, url: str) -> str:
+    """Name of the reddit endpoint of a request"""
+    path = urlsplit(url).path.strip("/")
+    for pattern, name in _ENDPOINTS:
+        if pattern.match(path):
+            return name
+    return f"{method.upper()} {path.split('/')[0] or '/'}"
+
+
+class EndpointStats:
+    """Requests, latency histogram and bytes received from an endpoint"""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.requests = 0
+        self.errors = 0  # no response or status >= 400
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+
+    def add(self, seconds: float, size: int, error: bool) -> None:
+        """Account a request"""
+        self.requests += 1
+        self.errors += error
+        self.seconds += seconds
+        self.bytes += size
+        index = next(
+            (i for i, limit in enumerate(LATENCY_BUCKETS) if seconds <= limit),
+            len(LATENCY_BUCKETS),
+        )
+        self.buckets[index] += 1
+
+    def to_dict(self) -> dict:
+        """The stats as a JSON object, with cumulative buckets like Prometheus"""
+        cumulative = 0
+        buckets = {}
+        for limit, count in zip([*LATENCY_BUCKETS, "+Inf"], self.buckets, strict=True):
+            cumulative += count
+            buckets[str(limit)] = cumulative
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 4),
+            "bytes": self.bytes,
+            "buckets": buckets,
+        }
+
+
+class RequestMeter:
+    """Count the requests of a praw session by endpoint, with their latency,
+    the bytes received and the rate limit left after them.
+
+    Installed on the requestor, so it sees every request: the authentication,
+    the retries and the requests of all the threads."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.remaining: float | None = None
+        """Lowest rate limit headroom seen"""
+        self.used: int | None = None
+        """Requests used in the last rate limit window seen"""
+
+    @classmethod
+    def install(cls, reddit: praw.Reddit) -> "RequestMeter":
+        """Meter all the requests of reddit, reuse the installed meter"""
+        core = reddit._core
+        # a public property since prawcore 3, private in the locked prawcore 2
+        requestor = getattr(core, "requestor", None) or core._requestor
+        meter = getattr(requestor, "_meter", None)
+        if isinstance(meter, cls):
+            return meter
+        meter = cls()
+        request = requestor.request
+
+        def metered(method, url, *args, **kwargs):
+            start = time.perf_counter()
+            response = None
+            try:
+                response = request(method, url, *args, **kwargs)
+                return response
+            finally:
+                meter.record(method, url, time.perf_counter() - start, response)
+
+        requestor.request = metered
+        requestor._meter = meter
+        return meter
+
+    def __deepcopy__(self, memo: dict) -> "RequestMeter":
+        # prawcore deep copies the request data, that may hold praw objects (and so the meter)
+        return self
+
+    def record(self, method: str, url: str, seconds: float, response) -> None:
+        """Account a request, response is None if it failed before getting one"""
+        name = endpoint(method, url)
+        size = 0
+        remaining = used = None
+        if response is not None:
+            size = int(response.headers.get("content-length") or len(response.content or b""))
+            remaining = response.headers.get("x-ratelimit-remaining")
+            used = response.headers.get("x-ratelimit-used")
+        error = response is None or response.status_code >= 400
+        with self._lock:
+            self.endpoints.setdefault(name, EndpointStats()).add(seconds, size, error)
+            if remaining is not None:
+                remaining = float(remaining)
+                if self.remaining is not None:
+                    remaining = min(self.remaining, remaining)
+                self.remaining = remaining
+            if used is not None:
+                self.used = int(float(used))
+
+    def total(self) -> int:
+        """Number of requests, authentication excluded"""
+        return sum(
+            stats.requests for name, stats in self.endpoints.items() if name != "access_token"
+        )
+
+    def report(self, action: str) -> dict:
+        """The stats of the run, as a JSON object"""
+        with self._lock:
+            return {
+                "action": action,
+                "started": round(self.started, 3),
+                "seconds": round(time.time() - self.started, 3),
+                "requests": self.total(),
+                "ratelimit_remaining": self.remaining,
+                "ratelimit_used": self.used,
+                "endpoints": {
+                    name: stats.to_dict() for name, stats in sorted(self.endpoints.items())
+                },
+            }
+
+    def write(self, action: str, log: str = METRICS_LOG, textfile_dir: str = METRICS_DIR) -> dict:
+        """Append the stats of the run to the log, replace the textfile of the action"""
+        report = self.report(action)
+        os.makedirs(os.path.dirname(log) or ".", exist_ok=True)
+        with open(log, "a", encoding="utf-8") as fout:
+            fout.write(json.dumps(report) + "\n")
+        os.makedirs(textfile_dir, exist_ok=True)
+        path = os.path.join(textfile_dir, f"{action}.prom")
+        # the textfile collector may read at any time, replace the file in a single step
+        with open(path + ".tmp", "w", encoding="utf-8") as fout:
+            fout.write(prometheus(report))
+        os.replace(path + ".tmp", path)
+        return report
+
+
+def prometheus(report: dict) -> str:
+    """A run report in the Prometheus text format"""
+    action = report["action"]
+    lines = [
+        "# HELP dimmiouija_requests_total Requests to reddit in the last run.",
+        "# TYPE dimmiouija_requests_total counter",
+    ]
+    for name, stats in report["endpoints"].items():
+        lines.append(
+            f'dimmiouija_requests_total{{action="{action}",endpoint="{name}"}} {stats["requests"]}'
+        )
+    lines += [
+        "# HELP dimmiouija_request_errors_total Failed requests to reddit in the last run.",
+        "# TYPE dimmiouija_request_errors_total counter",
+    ]
+    for name, stats in report["endpoints"].items():
+        lines.append(
+            f'dimmiouija_request_errors_total{{action="{action}",endpoint="{name}"}} '
+            f"{stats['errors']}"
+        )
+    lines += [
+        "# HELP dimmiouija_response_bytes_total Bytes received from reddit in the last run.",
+        "# TYPE dimmiouija_response_bytes_total counter",
+    ]
+    for name, stats in report["endpoints"].items():
+        lines.append(
+            f'dimmiouija_response_bytes_total{{action="{action}",endpoint="{name}"}} '
+            f"{stats['bytes']}"
+        )
+    lines += [
+        "# HELP dimmiouija_request_seconds Latency of the requests to reddit in the last run.",
+        "# TYPE dimmiouija_request_seconds histogram",
+    ]
+    for name, stats in report["endpoints"].items():
+        labels = f'action="{action}",endpoint="{name}"'
+        for limit, count in stats["buckets"].items():
+            lines.append(f'dimmiouija_request_seconds_bucket{{{labels},le="{limit}"}} {count}')
+        lines.append(f"dimmiouija_request_seconds_sum{{{labels}}} {stats['seconds']}")
+        lines.append(f"dimmiouija_request_seconds_count{{{labels}}} {stats['requests']}")
+    lines += [
+        "# HELP dimmiouija_run_seconds Duration of the last run.",
+        "# TYPE dimmiouija_run_seconds gauge",
+        f'dimmiouija_run_seconds{{action="{action}"}} {report["seconds"]}',
+        "# HELP dimmiouija_run_timestamp_seconds Start of the last run.",
+        "# TYPE dimmiouija_run_timestamp_seconds gauge",
+        f'dimmiouija_run_timestamp_seconds{{action="{action}"}} {report["started"]}',
+    ]
+    if report["ratelimit_remaining"] is not None:
+        lines += [
+            "# HELP dimmiouija_ratelimit_remaining Lowest rate limit headroom in the last run.",
+            "# TYPE dimmiouija_ratelimit_remaining gauge",
+            f'dimmiouija_ratelimit_remaining{{action="{action}"}} {report["ratelimit_remaining"]}',
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,152 @@
+"""Compressed snapshots of the threads fetched by dump.py, to parse them again offline"""
+
+import gzip
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from praw.models import Submission
+
+SNAPSHOT_DIR = "data/snapshots"
+SUBMISSION_FIELDS = (
+    "id",
+    "name",
+    "title",
+    "url",
+    "score",
+    "created_utc",
+    "author",
+    "permalink",
+    "link_flair_text",
+    "selftext",
+    "num_comments",
+)
+COMMENT_FIELDS = (
+    "name",
+    "parent_id",
+    "body",
+    "score",
+    "permalink",
+    "created_utc",
+    "author",
+    "removed",
+    "distinguished",
+    "locked",
+)
+COMPLETE = "complete"  # the line closing a snapshot with every thread of the week
+
+
+def snapshot_path(week: str | None) -> Path:
+    """The snapshot file of a week"""
+    return Path(SNAPSHOT_DIR) / f"{week}.jsonl.gz"
+
+
+def _value(thing, field: str):
+    value = getattr(thing, field, None)
+    if field == "author":
+        return value.name if value else None
+    return value
+
+
+def snapshot(submission: "Submission") -> dict:
+    """The fields of a submission and of all its comments, already expanded.
+
+    Comments are lists of COMMENT_FIELDS values"""
+    data = {field: _value(submission, field) for field in SUBMISSION_FIELDS}
+    data["comments"] = [
+        [_value(comment, field) for field in COMMENT_FIELDS]
+        for comment in submission.comments.list()
+    ]
+    return data
+
+
+class Archive:
+    """A gzip file of snapshots, a JSON line for every thread"""
+
+    def __init__(self, path: Path) -> None:
+        """Initialize."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # a rerun appends another gzip member, the last snapshot of a thread wins
+        self._file = gzip.open(path, "at", encoding="utf-8")
+
+    def add(self, data: dict) -> None:
+        """Store the snapshot of a thread"""
+        self._file.write(json.dumps(data, separators=(",", ":")) + "\n")
+
+    def close(self, complete: bool = False) -> None:
+        """Flush and close the file, complete if every thread of the week was added"""
+        if complete:
+            self._file.write(json.dumps({COMPLETE: True}) + "\n")
+        self._file.close()
+
+
+class SnapshotComment:
+    """A comment read from a snapshot, with the attributes used by dump.py"""
+
+    def __init__(self, values: list) -> None:
+        """Initialize."""
+        self.__dict__.update(zip(COMMENT_FIELDS, values, strict=True))
+        self.id = self.name[3:]
+        self.author = SimpleNamespace(name=self.author) if self.author else None
+
+
+class SnapshotForest:
+    """The comments of a snapshot, already expanded"""
+
+    def __init__(self, comments: list[SnapshotComment]) -> None:
+        """Initialize."""
+        self._comments = comments
+
+    def replace_more(self, limit: int | None = 32, threshold: int = 0) -> list:
+        """Nothing to load"""
+        return []
+
+    def list(self) -> list[SnapshotComment]:
+        """All the comments, like CommentForest.list"""
+        return self._comments
+
+
+class SnapshotSubmission:
+    """A submission read from a snapshot, with the attributes used by dump.py"""
+
+    def __init__(self, data: dict) -> None:
+        """Initialize."""
+        self.__dict__.update({field: data.get(field) for field in SUBMISSION_FIELDS})
+        self.author = SimpleNamespace(name=self.author) if self.author else None
+        self.comments = SnapshotForest([SnapshotComment(values) for values in data["comments"]])
+
+    def __str__(self) -> str:
+        return self.id
+
+
+def _lines(path: Path) -> Iterator[dict]:
+    """The JSON lines of a file, up to the end of a member cut by a killed run"""
+    with gzip.open(path, "rt", encoding="utf-8") as fin:
+        try:
+            for line in fin:
+                yield json.loads(line)
+        except (EOFError, json.JSONDecodeError):
+            return
+
+
+def load(path: Path) -> list[dict]:
+    """The snapshots of a file, the last one of each thread"""
+    snapshots = {}
+    for data in _lines(path):
+        if COMPLETE not in data:
+            snapshots[data["name"]] = data
+    return list(snapshots.values())
+
+
+def is_complete(path: Path) -> bool:
+    """True if a run archived every thread of the week in the file"""
+    return any(COMPLETE in data for data in _lines(path))
+
+
+def weeks() -> Iterator[tuple[str, Path]]:
+    """The weeks with a snapshot file, oldest first"""
+    for path in sorted(Path(SNAPSHOT_DIR).glob("*.jsonl.gz")):
+        yield path.name.split(".")[0], path
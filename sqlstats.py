@@ -0,0 +1,113 @@
+"""Statistics of any range of weeks, aggregated by the dump database"""
+
+from collections import Counter
+from collections.abc import Iterator
+
+from accumulator import Distribution, summaries
+from storage import CHAIN, FIRST_WEEK, LAST_WEEK, DumpStore, week_key
+
+WEEKS = "week BETWEEN :first AND :last"
+
+
+def bounds(first: str | None, last: str | None) -> dict[str, int]:
+    """The keys of the weeks from first to last, None for no limit"""
+    return {
+        "first": FIRST_WEEK if first is None else week_key(first),
+        "last": LAST_WEEK if last is None else week_key(last),
+    }
+
+
+class StatsEngine:
+    """Compute the variables of stats.md with GROUP BY and window queries.
+
+    The counters are sums of the per week aggregates, the comments of a question are
+    ranked from its last one (the Goodbye, or the solution of a ruota) for the open times:
+    only the counters and the open times leave the database."""
+
+    def __init__(self, store: DumpStore | None = None) -> None:
+        """Initialize."""
+        self._con = (store or DumpStore())._con
+
+    def _posts(self, table: str, weeks: dict[str, int]) -> list[dict]:
+        """The questions (or ruote) of the weeks, without comments"""
+        cur = self._con.execute(
+            f"""SELECT id AS name, title, score, created_utc, author, permalink, answer, week
+            FROM {table} WHERE {WEEKS} ORDER BY week, score DESC""",
+            weeks,
+        )
+        columns = [column[0] for column in cur.description]
+        return [dict(zip(columns, row, strict=True)) for row in cur]
+
+    def _counter(self, column: str, weeks: dict[str, int]) -> Counter:
+        return Counter(
+            dict(
+                self._con.execute(
+                    f"""SELECT author, SUM({column}) AS n FROM user_weeks WHERE {WEEKS}
+                    GROUP BY author HAVING n > 0 ORDER BY n DESC, author""",
+                    weeks,
+                )
+            )
+        )
+
+    def _open_time(
+        self, table: str, ctable: str, posts: list[dict], weeks: dict[str, int]
+    ) -> list[tuple[int, dict]]:
+        """Seconds from each post to its last comment, shortest first"""
+        by_name = {post["name"]: post for post in posts}
+        chain = CHAIN.format(table=table, ctable=ctable, weeks=WEEKS)
+        return [
+            (open_time, by_name[name])
+            for name, open_time in self._con.execute(
+                f"""SELECT q.id, r.created_utc - q.created_utc AS open_time
+                FROM ({chain}) AS r JOIN {table} AS q ON q.id = r.parent_id
+                WHERE r.from_end = 1 ORDER BY open_time, q.week, q.score DESC""",
+                weeks,
+            )
+        ]
+
+    def leaderboard(self, first: str | None = None, last: str | None = None) -> dict:
+        """The counters of the statistics from week first to last (both included),
+        read from the aggregates only"""
+        return self._leaderboard(bounds(first, last))
+
+    def _leaderboard(self, weeks: dict[str, int]) -> dict:
+        chars = self._con.execute(
+            f"""SELECT letter, SUM(count) AS n FROM letter_weeks WHERE {WEEKS}
+            GROUP BY letter ORDER BY n DESC, letter""",
+            weeks,
+        )
+        return {
+            "authors": self._counter("questions", weeks),
+            "solvers": self._counter("letters", weeks),
+            "goodbyers": self._counter("goodbyes", weeks),
+            "chars": Counter(dict(chars)),
+            "ruote_solvers": self._counter("ruote", weeks),
+        }
+
+    def activity(self, first: str | None = None, last: str | None = None) -> Iterator[float]:
+        """The created_utc of the comments of the questions from week first to last"""
+        chain = CHAIN.format(table="questions", ctable="comments", weeks=WEEKS)
+        for (created_utc,) in self._con.execute(
+            f"SELECT created_utc FROM ({chain})", bounds(first, last)
+        ):
+            yield created_utc
+
+    def make_stats(
+        self, first: str | None = None, last: str | None = None
+    ) -> tuple[list[dict], list[dict], dict]:
+        """The questions, ruote and statistics from week first to last (both included),
+        like Summarizer.make_stats does with the weekly JSON files"""
+        weeks = bounds(first, last)
+        questions = self._posts("questions", weeks)
+        ruote = self._posts("ruote", weeks)
+        stats = self._leaderboard(weeks)
+        stats["open_time"] = self._open_time("questions", "comments", questions, weeks)
+        stats["ruote_open_time"] = self._open_time("ruote", "rcomments", ruote, weeks)
+        stats.update(
+            summaries(
+                Distribution(len(question["answer"]) for question in questions),
+                Distribution(stats["solvers"].values()),
+                Distribution(time for time, _ in stats["open_time"]),
+            )
+        )
+        return questions, ruote, stats
@@ -0,0 +1,498 @@
+"""Local state of the bot, persisted between runs"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    import praw
+    from praw.models import Submission, Subreddit
+
+STATE_PATH = "data/state.sqlite3"
+FULL_REFRESH = 6 * 60 * 60  # walk again the whole tree at least every 6 hours
+PM_TODO = "todo"
+PM_SENT = "sent"
+PM_RETRY = "retry"  # rate limited, send again after retry_utc
+PM_MISSING = "USER_DOESNT_EXIST"
+PM_FAILED = "failed"
+PM_LOADED = "loaded"  # status of the marker row of a loaded queue, its user is NULL
+NOTIFY_PENDING = "pending"
+NOTIFY_SENT = "sent"
+NOTIFY_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    num_comments INT,
+    last_comment_utc REAL,
+    walked_utc REAL,
+    answer_id TEXT,
+    answer_text TEXT,
+    answer_score INT,
+    answer_permalink TEXT
+);
+
+CREATE TABLE IF NOT EXISTS seen_comments (
+    id TEXT PRIMARY KEY,
+    post_id TEXT
+);
+
+CREATE INDEX IF NOT EXISTS seen_post_index ON seen_comments(post_id);
+
+CREATE TABLE IF NOT EXISTS ledger (
+    id TEXT,
+    post_id TEXT,
+    action TEXT,
+    value TEXT,
+    PRIMARY KEY (id, action)
+);
+
+CREATE INDEX IF NOT EXISTS ledger_post_index ON ledger(post_id);
+
+CREATE TABLE IF NOT EXISTS candidates (
+    id TEXT PRIMARY KEY,
+    post_id TEXT,
+    position INT,
+    answer_text TEXT,
+    score INT,
+    permalink TEXT,
+    branch TEXT
+);
+
+CREATE INDEX IF NOT EXISTS candidates_post_index ON candidates(post_id);
+
+CREATE TABLE IF NOT EXISTS cursors (
+    listing TEXT PRIMARY KEY,
+    fullname TEXT,
+    created_utc REAL
+);
+
+CREATE TABLE IF NOT EXISTS known_posts (
+    listing TEXT,
+    fullname TEXT,
+    created_utc REAL,
+    PRIMARY KEY (listing, fullname)
+);
+
+CREATE TABLE IF NOT EXISTS pmlist (
+    position INTEGER PRIMARY KEY,
+    user TEXT UNIQUE,
+    status TEXT,
+    retry_utc REAL,
+    attempts INT DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    kind TEXT,
+    target TEXT,
+    subject TEXT,
+    body TEXT,
+    status TEXT,
+    attempts INT DEFAULT 0,
+    next_utc REAL
+);
+
+CREATE INDEX IF NOT EXISTS outbox_status_index ON outbox(status, next_utc);
+"""
+
+
+class PostState:
+    """What we know about a submission from the previous runs"""
+
+    def __init__(self, post_id: str) -> None:
+        """Initialize."""
+        self.id = post_id
+        self.num_comments: int | None = None
+        self.last_comment_utc = 0.0
+        self.walked_utc = 0.0
+        self.seen: set[str] = set()
+        """Comment IDs already evaluated by the moderation"""
+        self.answer_id: str | None = None
+        self.answer_text: str | None = None
+        self.answer_score = float("-inf")
+        self.answer_permalink: str | None = None
+        self.removed: dict[str, bool] = {}
+        """Comment IDs removed by the bot, True if with all their replies"""
+        self.flair: str | None = None
+        """Last flair set by the bot"""
+        self.candidates: dict[str, tuple[str, int, str, tuple[str, ...]]] = {}
+        """Goodbyes found by the last walk, in visit order:
+        answer text, score, permalink and the IDs of the letters leading to it"""
+
+    def is_recent(self) -> bool:
+        """True if the last full walk is younger than FULL_REFRESH"""
+        return time.time() - self.walked_utc < FULL_REFRESH
+
+    def is_unchanged(self, num_comments: int) -> bool:
+        """True if the comment tree is the same of the last full walk"""
+        return self.num_comments == num_comments and self.is_recent()
+
+    def branches(self) -> set[str]:
+        """Comment IDs of the letters leading to the candidates"""
+        return {letter for *_, branch in self.candidates.values() for letter in branch}
+
+    def rescore(self, comment_id: str, score: int) -> None:
+        """Update the score of a goodbye found by the last walk"""
+        if comment_id in self.candidates:
+            answer_text, _, permalink, branch = self.candidates[comment_id]
+            self.candidates[comment_id] = (answer_text, score, permalink, branch)
+        elif comment_id == self.answer_id:
+            # stored before the candidates
+            self.answer_score = score
+
+    def choose_answer(self) -> None:
+        """Choose the answer among the candidates like the walk does: in visit order, a goodbye
+        with a higher score is accepted unless its parent already leads to an accepted one"""
+        if not self.candidates:
+            return
+        best = None
+        found: set[str] = set()
+        for comment_id, (_, score, _, branch) in self.candidates.items():
+            # the submission is the empty parent
+            if (branch[-1] if branch else "") in found:
+                continue
+            if best is None or score > self.candidates[best][1]:
+                best = comment_id
+                found.update(("", *branch))
+        self.answer_id = best
+        self.answer_text, self.answer_score, self.answer_permalink, _ = self.candidates[best]
+
+    def invalidate(self) -> None:
+        """Force a full walk on next process"""
+        self.num_comments = None
+
+
+class StateStore:
+    """SQLite-backed store of PostState"""
+
+    def __init__(self, path: str = STATE_PATH) -> None:
+        """Initialize."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path)
+        self._con.executescript(SCHEMA)
+
+    def load_post(self, post_id: str) -> PostState:
+        """Return the state of a post, empty if never seen"""
+        state = PostState(post_id)
+        row = self._con.execute(
+            """SELECT num_comments, last_comment_utc, walked_utc,
+            answer_id, answer_text, answer_score, answer_permalink
+            FROM posts WHERE id = ?""",
+            (post_id,),
+        ).fetchone()
+        if not row:
+            return state
+        (
+            state.num_comments,
+            state.last_comment_utc,
+            state.walked_utc,
+            state.answer_id,
+            state.answer_text,
+            answer_score,
+            state.answer_permalink,
+        ) = row
+        if answer_score is not None:
+            state.answer_score = answer_score
+        state.seen = {
+            comment_id
+            for (comment_id,) in self._con.execute(
+                "SELECT id FROM seen_comments WHERE post_id = ?", (post_id,)
+            )
+        }
+        for thing_id, action, value in self._con.execute(
+            "SELECT id, action, value FROM ledger WHERE post_id = ?", (post_id,)
+        ):
+            if action == "remove":
+                state.removed[thing_id] = value == "thread"
+            elif action == "flair":
+                state.flair = value
+        for comment_id, answer_text, score, permalink, branch in self._con.execute(
+            """SELECT id, answer_text, score, permalink, branch FROM candidates
+            WHERE post_id = ? ORDER BY position""",
+            (post_id,),
+        ):
+            state.candidates[comment_id] = (answer_text, score, permalink, tuple(branch.split()))
+        return state
+
+    def save_post(self, state: PostState) -> None:
+        """Persist the state of a post"""
+        answer_score = state.answer_score if state.answer_id else None
+        self._con.execute(
+            """INSERT OR REPLACE INTO posts(
+            id,
+            num_comments,
+            last_comment_utc,
+            walked_utc,
+            answer_id,
+            answer_text,
+            answer_score,
+            answer_permalink) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                state.id,
+                state.num_comments,
+                state.last_comment_utc,
+                state.walked_utc,
+                state.answer_id,
+                state.answer_text,
+                answer_score,
+                state.answer_permalink,
+            ),
+        )
+        self._con.executemany(
+            "INSERT OR IGNORE INTO seen_comments(id, post_id) VALUES (?, ?)",
+            [(comment_id, state.id) for comment_id in state.seen],
+        )
+        ledger = [
+            (comment_id, state.id, "remove", "thread" if thread else "comment")
+            for comment_id, thread in state.removed.items()
+        ]
+        if state.flair is not None:
+            ledger.append((state.id, state.id, "flair", state.flair))
+        else:
+            self._con.execute("DELETE FROM ledger WHERE id = ? AND action = 'flair'", (state.id,))
+        self._con.executemany(
+            "INSERT OR REPLACE INTO ledger(id, post_id, action, value) VALUES (?, ?, ?, ?)",
+            ledger,
+        )
+        self._con.execute("DELETE FROM candidates WHERE post_id = ?", (state.id,))
+        self._con.executemany(
+            """INSERT INTO candidates(id, post_id, position, answer_text, score, permalink, branch)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (comment_id, state.id, position, answer_text, score, permalink, " ".join(branch))
+                for position, (comment_id, (answer_text, score, permalink, branch)) in enumerate(
+                    state.candidates.items()
+                )
+            ],
+        )
+        self._con.commit()
+
+    def prune(self, older_than: float) -> None:
+        """Forget posts not walked since older_than"""
+        self._con.execute(
+            "DELETE FROM seen_comments WHERE post_id IN "
+            "(SELECT id FROM posts WHERE walked_utc < ?)",
+            (older_than,),
+        )
+        self._con.execute(
+            "DELETE FROM ledger WHERE post_id IN (SELECT id FROM posts WHERE walked_utc < ?)",
+            (older_than,),
+        )
+        self._con.execute(
+            "DELETE FROM candidates WHERE post_id IN (SELECT id FROM posts WHERE walked_utc < ?)",
+            (older_than,),
+        )
+        self._con.execute("DELETE FROM posts WHERE walked_utc < ?", (older_than,))
+        self._con.commit()
+
+    def get_cursor(self, listing: str) -> tuple[str, float] | None:
+        """Return fullname and creation time of the newest submission of listing"""
+        return self._con.execute(
+            "SELECT fullname, created_utc FROM cursors WHERE listing = ?", (listing,)
+        ).fetchone()
+
+    def known_posts(
+        self, listing: str, since: float | None = None, limit: int | None = None
+    ) -> list[str]:
+        """Return the fullnames of the submissions of listing created after since, or all,
+        newest first, at most limit"""
+        return [
+            fullname
+            for (fullname,) in self._con.execute(
+                """SELECT fullname FROM known_posts WHERE listing = ? AND created_utc >= ?
+                ORDER BY created_utc DESC LIMIT ?""",
+                (
+                    listing,
+                    float("-inf") if since is None else since,
+                    -1 if limit is None else limit,
+                ),
+            )
+        ]
+
+    def save_listing(
+        self, listing: str, cursor: tuple[str, float] | None, known: list[tuple[str, float]]
+    ) -> None:
+        """Replace the cursor and the known submissions of listing"""
+        if cursor:
+            self._con.execute(
+                "INSERT OR REPLACE INTO cursors(listing, fullname, created_utc) VALUES (?, ?, ?)",
+                (listing, *cursor),
+            )
+        self._con.execute("DELETE FROM known_posts WHERE listing = ?", (listing,))
+        self._con.executemany(
+            "INSERT OR IGNORE INTO known_posts(listing, fullname, created_utc) VALUES (?, ?, ?)",
+            [(listing, fullname, created_utc) for fullname, created_utc in known],
+        )
+        self._con.commit()
+
+    def load_pmlist(self, users: list[str]) -> None:
+        """Replace the PM queue with users, in order"""
+        self._con.execute("DELETE FROM pmlist")
+        self._con.executemany(
+            "INSERT OR IGNORE INTO pmlist(user, status) VALUES (?, ?)",
+            [(None, PM_LOADED), *((user, PM_TODO) for user in users)],
+        )
+        self._con.commit()
+
+    def has_pmlist(self) -> bool:
+        """True if a PM queue was loaded, even if empty or already sent"""
+        return self._con.execute("SELECT 1 FROM pmlist LIMIT 1").fetchone() is not None
+
+    def pending_pm(self, now: float, limit: int | None = None) -> list[str]:
+        """Return the users to message now, in order"""
+        return [
+            user
+            for (user,) in self._con.execute(
+                """SELECT user FROM pmlist
+                WHERE status = ? OR (status = ? AND retry_utc <= ?)
+                ORDER BY position LIMIT ?""",
+                (PM_TODO, PM_RETRY, now, -1 if limit is None else limit),
+            )
+        ]
+
+    def unsent_pm(self) -> list[str]:
+        """Return the users still to message, later retries included"""
+        return [
+            user
+            for (user,) in self._con.execute(
+                "SELECT user FROM pmlist WHERE status IN (?, ?) ORDER BY position",
+                (PM_TODO, PM_RETRY),
+            )
+        ]
+
+    def mark_pm(self, user: str, status: str, retry_utc: float | None = None) -> None:
+        """Record the outcome of a PM to user"""
+        self._con.execute(
+            "UPDATE pmlist SET status = ?, retry_utc = ?, attempts = attempts + 1 WHERE user = ?",
+            (status, retry_utc, user),
+        )
+        self._con.commit()
+
+    def enqueue(self, key: str, kind: str, target: str, subject: str | None, body: str) -> bool:
+        """Add a notification to the outbox, False if key was already there"""
+        cursor = self._con.execute(
+            """INSERT OR IGNORE INTO outbox(key, kind, target, subject, body, status, next_utc)
+            VALUES (?, ?, ?, ?, ?, ?, 0)""",
+            (key, kind, target, subject, body, NOTIFY_PENDING),
+        )
+        self._con.commit()
+        return cursor.rowcount > 0
+
+    def due_notifications(self, now: float, limit: int | None = None) -> list[tuple]:
+        """Return id, kind, target, subject, body and attempts of the notifications to send"""
+        return self._con.execute(
+            """SELECT id, kind, target, subject, body, attempts FROM outbox
+            WHERE status = ? AND next_utc <= ? ORDER BY id LIMIT ?""",
+            (NOTIFY_PENDING, now, -1 if limit is None else limit),
+        ).fetchall()
+
+    def mark_notification(self, notification_id: int, status: str, next_utc: float = 0) -> None:
+        """Record the outcome of a delivery"""
+        self._con.execute(
+            "UPDATE outbox SET status = ?, next_utc = ?, attempts = attempts + 1 WHERE id = ?",
+            (status, next_utc, notification_id),
+        )
+        self._con.commit()
+
+
+class ListingCursor:
+    """Fetch only the submissions newer than the previous run, plus the ones kept then.
+
+    The cursor is the newest submission seen, the kept submissions are refreshed
+    with info() instead of paging the whole listing again.
+
+    Submissions older than max_age are dropped, but the newest keep_old kept ones:
+    the bot keeps following the open posts, the full listing does not find them."""
+
+    def __init__(
+        self,
+        store: StateStore,
+        reddit: "praw.Reddit",
+        subreddit: "Subreddit",
+        listing: str,
+        max_age: float,
+        full: "Callable[[], Iterable[Submission]]",
+        keep_old: int = 0,
+    ) -> None:
+        """Initialize.
+
+        listing = name of the cursor
+        max_age = submissions older than this (in seconds) are ignored
+        full = the listing to use when there is no valid cursor
+        keep_old = number of kept submissions returned even when older than max_age
+        """
+        self._store = store
+        self._reddit = reddit
+        self._subreddit = subreddit
+        self._key = f"{subreddit.display_name}/{listing}"
+        self._max_age = max_age
+        self._full = full
+        self._keep_old = keep_old
+        self._newest: tuple[str, float] | None = None
+
+    def fetch(self) -> "list[Submission]":
+        """Return the submissions, newest first"""
+        since = time.time() - self._max_age
+        self._newest = cursor = self._store.get_cursor(self._key)
+        kept = set(self._store.known_posts(self._key, since))
+        if self._keep_old:
+            # the newest ones are the recent ones, then keep_old older
+            kept.update(self._store.known_posts(self._key, limit=len(kept) + self._keep_old))
+        if cursor is None or cursor[1] < since:
+            submissions = self._full_and_kept(kept)
+        else:
+            submissions = self._newer(cursor[0])
+            seen = {submission.fullname for submission in submissions}
+            known = [fullname for fullname in kept if fullname not in seen]
+            if not submissions and cursor[0] not in known:
+                # check the cursor too: reddit returns nothing before a deleted submission
+                known.append(cursor[0])
+            refreshed = list(self._reddit.info(fullnames=known)) if known else []
+            if not submissions and not any(
+                submission.fullname == cursor[0] and submission.author for submission in refreshed
+            ):
+                submissions = self._full_and_kept(kept)
+            else:
+                submissions += refreshed
+        submissions = [
+            s
+            for s in submissions
+            if s.created_utc >= since or (self._keep_old and s.fullname in kept)
+        ]
+        submissions.sort(key=lambda submission: submission.created_utc, reverse=True)
+        if submissions and (not self._newest or submissions[0].created_utc >= self._newest[1]):
+            self._newest = (submissions[0].fullname, submissions[0].created_utc)
+        return submissions
+
+    def _full_and_kept(self, kept: set[str]) -> "list[Submission]":
+        """The full listing, plus the kept submissions it misses if keep_old"""
+        submissions = list(self._full())
+        if self._keep_old:
+            missing = kept - {submission.fullname for submission in submissions}
+            if missing:
+                submissions += self._reddit.info(fullnames=sorted(missing))
+        return submissions
+
+    def _newer(self, before: str) -> "list[Submission]":
+        """Page the new listing from the cursor onward"""
+        submissions = []  # type: list[Submission]
+        path = f"r/{self._subreddit.display_name}/new"
+        while True:
+            page = list(self._reddit.get(path, params={"before": before, "limit": 100}))
+            submissions.extend(page)
+            if len(page) < 100:
+                return submissions
+            before = page[0].fullname
+
+    def keep(self, submissions: "Iterable[Submission]") -> None:
+        """Store the cursor and the submissions to refresh on the next fetch"""
+        self._store.save_listing(
+            self._key,
+            self._newest,
+            [(submission.fullname, submission.created_utc) for submission in submissions],
+        )
@@ -0,0 +1,404 @@
+"""The SQLite database of the dumps: schema migrations, a tuned connection and upserts"""
+
+import sqlite3
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+DUMP_PATH = "data/dump.sqlite3"
+PRAGMAS = {
+    "journal_mode": "WAL",  # readers do not block the writer
+    "synchronous": "NORMAL",  # safe with WAL, no fsync on every commit
+    "temp_store": "MEMORY",
+    "cache_size": -64 * 1024,  # KiB
+}
+QUESTION_COLUMNS = ("id", "title", "score", "created_utc", "author", "permalink", "answer", "week")
+COMMENT_COLUMNS = ("id", "parent_id", "body", "created_utc", "author", "score", "position")
+CHECKPOINT_COLUMNS = ("id", "kind", "week", "score", "num_comments", "record")
+FIRST_WEEK = 0
+LAST_WEEK = 9999_99
+
+CHECKPOINTS = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    id TEXT PRIMARY KEY,
+    kind TEXT,
+    week TEXT,
+    score INT,
+    num_comments INT,
+    record TEXT
+);
+"""
+
+WITHOUT_ROWID = """
+CREATE TABLE new_questions (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    score INT,
+    created_utc INT,
+    author TEXT,
+    permalink TEXT,
+    answer TEXT,
+    week INT
+) WITHOUT ROWID;
+INSERT INTO new_questions SELECT
+    id, title, score, created_utc, author, permalink, answer,
+    CAST(REPLACE(week, '_', '') AS INTEGER)
+FROM questions;
+DROP TABLE questions;
+ALTER TABLE new_questions RENAME TO questions;
+CREATE INDEX week_index ON questions(week);
+
+CREATE TABLE new_ruote (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    score INT,
+    created_utc INT,
+    author TEXT,
+    permalink TEXT,
+    answer TEXT,
+    week INT
+) WITHOUT ROWID;
+INSERT INTO new_ruote SELECT
+    id, title, score, created_utc, author, permalink, answer,
+    CAST(REPLACE(week, '_', '') AS INTEGER)
+FROM ruote;
+DROP TABLE ruote;
+ALTER TABLE new_ruote RENAME TO ruote;
+CREATE INDEX ruote_week_index ON ruote(week);
+
+CREATE TABLE new_comments (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    body TEXT,
+    score INT,
+    created_utc INT,
+    author TEXT
+) WITHOUT ROWID;
+INSERT INTO new_comments SELECT id, parent_id, body, score, created_utc, author FROM comments;
+DROP TABLE comments;
+ALTER TABLE new_comments RENAME TO comments;
+CREATE INDEX parent_index ON comments(parent_id);
+
+CREATE TABLE new_rcomments (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    body TEXT,
+    score INT,
+    created_utc INT,
+    author TEXT
+) WITHOUT ROWID;
+INSERT INTO new_rcomments SELECT id, parent_id, body, score, created_utc, author FROM rcomments;
+DROP TABLE rcomments;
+ALTER TABLE new_rcomments RENAME TO rcomments;
+CREATE INDEX ruote_parent_index ON rcomments(parent_id);
+
+CREATE TABLE new_checkpoints (
+    id TEXT PRIMARY KEY,
+    kind TEXT,
+    week INT,
+    score INT,
+    num_comments INT,
+    record TEXT
+) WITHOUT ROWID;
+INSERT INTO new_checkpoints SELECT
+    id, kind, CAST(REPLACE(week, '_', '') AS INTEGER), score, num_comments, record
+FROM checkpoints;
+DROP TABLE checkpoints;
+ALTER TABLE new_checkpoints RENAME TO checkpoints;
+"""
+
+IMPORTS = """
+CREATE TABLE imports (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INT,
+    hash TEXT,
+    rows INT
+) WITHOUT ROWID;
+"""
+
+STATS_INDEXES = """
+ALTER TABLE comments ADD COLUMN position INT;
+ALTER TABLE rcomments ADD COLUMN position INT;
+CREATE INDEX comments_author_index ON comments(author);
+CREATE INDEX rcomments_author_index ON rcomments(author);
+CREATE INDEX questions_created_index ON questions(created_utc);
+CREATE INDEX ruote_created_index ON ruote(created_utc);
+"""
+
+# the comments of the posts of some weeks, from_end = 1 for the last one of each chain
+CHAIN = """
+SELECT q.week, c.parent_id, c.author, c.body, c.created_utc,
+    ROW_NUMBER() OVER (
+        PARTITION BY c.parent_id ORDER BY c.position DESC
+    ) AS from_end
+FROM (SELECT id, week FROM {table} WHERE {weeks}) AS q JOIN {ctable} AS c ON c.parent_id = q.id
+"""
+
+USER_WEEKS = """
+INSERT INTO user_weeks(week, author, questions, letters, goodbyes, ruote)
+SELECT week, author, SUM(questions), SUM(letters), SUM(goodbyes), SUM(ruote) FROM (
+    SELECT week, author, 1 AS questions, 0 AS letters, 0 AS goodbyes, 0 AS ruote
+    FROM questions WHERE {weeks}
+    UNION ALL
+    SELECT week, author, 0, from_end > 1, from_end = 1, 0 FROM ({questions})
+    UNION ALL
+    SELECT week, author, 0, 0, 0, 1 FROM ({ruote}) WHERE from_end = 1
+) WHERE author IS NOT NULL GROUP BY week, author
+"""
+
+LETTER_WEEKS = """
+INSERT INTO letter_weeks(week, letter, count)
+SELECT week, letter(body) AS l, COUNT(*) FROM ({questions})
+WHERE from_end > 1 AND body IS NOT NULL GROUP BY week, l
+"""
+
+
+def aggregates(weeks: str) -> tuple[str, str]:
+    """The queries filling user_weeks and letter_weeks with the weeks matching a condition"""
+    chains = {
+        "questions": CHAIN.format(table="questions", ctable="comments", weeks=weeks),
+        "ruote": CHAIN.format(table="ruote", ctable="rcomments", weeks=weeks),
+    }
+    return (
+        USER_WEEKS.format(weeks=weeks, **chains),
+        LETTER_WEEKS.format(questions=chains["questions"]),
+    )
+
+
+AGGREGATES = """
+CREATE TABLE user_weeks (
+    week INT,
+    author TEXT,
+    questions INT,
+    letters INT,
+    goodbyes INT,
+    ruote INT,
+    PRIMARY KEY (week, author)
+) WITHOUT ROWID;
+CREATE INDEX user_weeks_author_index ON user_weeks(author);
+CREATE TABLE letter_weeks (
+    week INT,
+    letter TEXT,
+    count INT,
+    PRIMARY KEY (week, letter)
+) WITHOUT ROWID;
+""" + ";\n".join(aggregates("week IS NOT NULL"))
+
+# the position of the comments imported before STATS_INDEXES: the ids of a question grow
+# along its chain, the ruote are sorted like dump.ruota_comments unless a checkpoint has them
+POSITIONS = """
+UPDATE comments SET position = o.n FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY parent_id ORDER BY length(id), id) - 1 AS n
+    FROM comments WHERE position IS NULL
+) AS o WHERE o.id = comments.id;
+UPDATE rcomments SET position = CAST(j.key AS INT)
+FROM checkpoints AS k, json_each(k.record, '$.comments') AS j
+WHERE rcomments.position IS NULL AND k.id = rcomments.parent_id AND k.kind = 'ruota'
+    AND json_extract(j.value, '$.name') = rcomments.id;
+UPDATE rcomments SET position = o.n FROM (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY parent_id ORDER BY length(body), created_utc, length(id), id
+    ) - 1 AS n
+    FROM rcomments WHERE position IS NULL
+) AS o WHERE o.id = rcomments.id;
+DELETE FROM user_weeks;
+DELETE FROM letter_weeks;
+""" + ";\n".join(aggregates("week IS NOT NULL"))
+
+MIGRATIONS = [  # the database is at version n after MIGRATIONS[n - 1]
+    Path(__file__).with_name("init_dump.sql"),
+    CHECKPOINTS,
+    WITHOUT_ROWID,
+    IMPORTS,
+    STATS_INDEXES,  # position = index of the comment in the chain
+    AGGREGATES,  # per week counters, refreshed by DumpStore.commit
+    POSITIONS,
+]
+
+
+def week_key(week: str | None) -> int | None:
+    """The integer key of a week: 2024_05 -> 202405"""
+    if week is None:
+        return None
+    return int(week.replace("_", ""))
+
+
+def letter(body: str) -> str:
+    """A letter as counted by the statistics: SQLite upper() knows only ASCII"""
+    return body.strip().upper()
+
+
+def upsert(table: str, columns: tuple[str, ...]) -> str:
+    """An INSERT updating the row in place if the id is already there"""
+    return (
+        f"INSERT INTO {table}({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns[1:])}"
+    )
+
+
+class DumpStore:
+    """The dump database, migrated to the last schema version on open"""
+
+    def __init__(self, path: str = DUMP_PATH) -> None:
+        """Initialize."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path)
+        self._con.create_function("letter", 1, letter, deterministic=True)
+        for pragma, value in PRAGMAS.items():
+            self._con.execute(f"PRAGMA {pragma} = {value}")
+        self.migrate()
+        self._stale: set[int] = set()  # weeks written since their aggregates were refreshed
+
+    @property
+    def version(self) -> int:
+        """Schema version of the database"""
+        version = self._con.execute("PRAGMA user_version").fetchone()[0]
+        if (
+            version == 0
+            and self._con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'questions'"
+            ).fetchone()
+        ):
+            # created by hand with init_dump.sql
+            return 1
+        return version
+
+    def migrate(self) -> None:
+        """Apply the missing migrations, each one in its own transaction"""
+        for number in range(self.version + 1, len(MIGRATIONS) + 1):
+            script = MIGRATIONS[number - 1]
+            if isinstance(script, Path):
+                script = script.read_text(encoding="utf-8")
+            self._con.executescript(f"BEGIN;\n{script};\nPRAGMA user_version = {number};\nCOMMIT;")
+
+    def insert(self, table: str, ctable: str, questions: Iterable[dict], week: str | None) -> int:
+        """Upsert questions (or ruote) and replace their comments, without committing: the
+        aggregates of the week are refreshed by the next commit.
+
+        RETURNS the number of rows written"""
+        questions = list(questions)
+        key = week_key(week)
+        cur = self._con.cursor()
+        cur.executemany(
+            upsert(table, QUESTION_COLUMNS),
+            [
+                (
+                    q["name"],
+                    q["title"],
+                    q["score"],
+                    int(q["created_utc"]),
+                    q["author"],
+                    q["permalink"],
+                    q["answer"],
+                    key,
+                )
+                for q in questions
+            ],
+        )
+        # a new fetch may find another chain, forget the old one
+        cur.executemany(
+            f"DELETE FROM {ctable} WHERE parent_id = ?",
+            [(q["name"],) for q in questions if "comments" in q],
+        )
+        comments = [
+            (c["name"], q["name"], c["body"], int(c["created_utc"]), c["author"], c["score"], i)
+            for q in questions
+            for i, c in enumerate(q.get("comments", []))
+        ]
+        cur.executemany(upsert(ctable, COMMENT_COLUMNS), comments)
+        self.touch(week)
+        return len(questions) + len(comments)
+
+    def touch(self, week: str | None) -> None:
+        """Refresh the aggregates of a week at the next commit"""
+        key = week_key(week)
+        if key is not None:
+            self._stale.add(key)
+
+    def refresh_stale(self) -> None:
+        """Compute again the aggregates of the weeks written, once, without committing"""
+        for key in sorted(self._stale):
+            self.refresh(key, key)
+        self._stale.clear()
+
+    def refresh(self, first: int = FIRST_WEEK, last: int = LAST_WEEK) -> None:
+        """Compute again the aggregates of the weeks from first to last, without committing"""
+        weeks = {"first": first, "last": last}
+        for table in ("user_weeks", "letter_weeks"):
+            self._con.execute(f"DELETE FROM {table} WHERE week BETWEEN :first AND :last", weeks)
+        for query in aggregates("week BETWEEN :first AND :last"):
+            self._con.execute(query, weeks)
+
+    def rebuild(self) -> None:
+        """Compute again the aggregates of every week, to repair them"""
+        with self._con:
+            self.refresh()
+
+    def save(
+        self,
+        table: str,
+        ctable: str,
+        question: dict,
+        week: str | None,
+        checkpoint: tuple[str, int, int, str],
+    ) -> None:
+        """Commit a question (or ruota), its comments and its checkpoint (kind, score,
+        num_comments, record) in one transaction, the aggregates at the next commit"""
+        with self._con:
+            self.insert(table, ctable, [question], week)
+            kind, score, num_comments, record = checkpoint
+            self._con.execute(
+                upsert("checkpoints", CHECKPOINT_COLUMNS),
+                (question["name"], kind, week_key(week), score, num_comments, record),
+            )
+
+    def checkpoint(self, name: str, kind: str) -> tuple[int, int, str] | None:
+        """The score, num_comments and record saved for a question (or ruota)"""
+        return self._con.execute(
+            "SELECT score, num_comments, record FROM checkpoints WHERE id = ? AND kind = ?",
+            (name, kind),
+        ).fetchone()
+
+    def imports(self) -> dict[str, tuple[float, int, str]]:
+        """The mtime, size and hash of the files already imported, by path"""
+        return {
+            path: (mtime, size, digest)
+            for path, mtime, size, digest in self._con.execute(
+                "SELECT path, mtime, size, hash FROM imports"
+            )
+        }
+
+    def add_import(self, path: str, mtime: float, size: int, digest: str, rows: int | None) -> None:
+        """Record an imported file in the manifest, without committing.
+
+        rows is None for a file touched but not changed, its rows are kept"""
+        self._con.execute(
+            """INSERT INTO imports(path, mtime, size, hash, rows) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+            mtime = excluded.mtime, size = excluded.size, hash = excluded.hash,
+            rows = CASE WHEN excluded.rows IS NULL THEN rows ELSE excluded.rows END""",
+            (path, mtime, size, digest, rows),
+        )
+
+    def commit(self) -> None:
+        """Refresh the aggregates of the weeks written and commit the pending writes"""
+        with self._con:
+            self.refresh_stale()
+
+    @contextmanager
+    def bulk(self) -> Iterator["DumpStore"]:
+        """A single transaction for a large import, without waiting for the disk.
+
+        A crash during the import can lose the whole import, not the data before it"""
+        self._con.execute("PRAGMA synchronous = OFF")
+        try:
+            with self._con:
+                yield self
+                self.refresh_stale()
+        finally:
+            self._con.execute(f"PRAGMA synchronous = {PRAGMAS['synchronous']}")
+
+    def close(self) -> None:
+        """Close the connection"""
+        self._con.close()
@@ -1,57 +1,57 @@
 """Summarize a brief period of DimmiOuija activity"""
 
+import argparse
 import datetime
+import hashlib
 import json
+import re
+import time
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from pathlib import Path
-from statistics import StatisticsError, mean, mode
-from statistics import median_grouped as median
 from typing import Any
 
 import praw
 from jinja2 import Environment, FileSystemLoader
 
+import ranking
+import vectorstats
+from accumulator import StatsAccumulator
+from session import RequestMeter
+from sqlstats import StatsEngine
+from storage import DumpStore
+
 READ_ONLY = False
 DATE_FORMAT = "%d/%m/%Y"
+WEEK_FILE = re.compile(r"(\d{4}_\d{2})(-ruote)?\.json$")
 
 
 def top_counter(count: Counter, size: int) -> list[tuple[Any, int]]:
     """Return at least 'size' most common, return more in case of same value elements"""
-    if not count:
-        return []
-    sorted_values = sorted(count.values(), reverse=True)
-    while True:
-        try:
-            value_limit = sorted_values[size]
-            break
-        except IndexError:
-            size -= 1
-    real_size = len([value for value in sorted_values if value >= value_limit])
-    return count.most_common(real_size)
+    # the elements as common as the (size + 1)-th are included too
+    return ranking.top(count.items(), size + 1, key=itemgetter(1))
 
 
 def bottom_counter(count: Counter) -> list[tuple[Any, int]]:
     """Return the least common elements"""
-    sorted_values = sorted(count.values())
-    value_limit = sorted(count.values())[0]
-    real_size = len([value for value in sorted_values if value >= value_limit])
-    return count.most_common()[real_size:]
+    return ranking.bottom(count.items(), 1, key=itemgetter(1))
+
 
+def answer_length(question: dict) -> int:
+    """Length of the answer of a question"""
+    return len(question["answer"])
 
-def top_answer(questions: dict, size: int):
+
+def top_answer(questions: list[dict], size: int) -> list[dict]:
     """Return at least 'size' most common, return more in case of same value elements"""
-    solutions = sorted(questions, key=lambda item: len(item["answer"]), reverse=True)
-    limit = len(solutions[size]["answer"])
-    longers = [solution for solution in solutions if len(solution["answer"]) >= limit]
-    return longers
+    # the answers as long as the (size + 1)-th are included too
+    return ranking.top(questions, size + 1, key=answer_length)
 
 
-def bottom_answer(questions: dict):
+def bottom_answer(questions: list[dict]) -> list[dict]:
     """Return the least common elements"""
-    solutions = sorted(questions, key=lambda item: len(item["answer"]))
-    limit = len(solutions[0]["answer"])
-    shorters = [solution for solution in solutions if len(solution["answer"]) == limit]
-    return shorters
+    return ranking.bottom(questions, 1, key=answer_length)
 
 
 def time_string(open_time: float) -> str:
@@ -61,14 +61,40 @@ def time_string(open_time: float) -> str:
     return f"{round(open_time / 60 / 60):d} ore"
 
 
+def stats_variables(questions, ruote, stats) -> dict:
+    """The variables of stats.md"""
+    variables = {
+        "questions": questions,
+        "ruote": ruote,
+        "mediums": len(set(stats["solvers"]) | set(stats["goodbyers"])),
+        "charlenght": sum(stats["chars"].values()),
+    }
+    for k, v in stats.items():
+        variables[k] = v
+    return variables
+
+
+def render_stats(variables: dict) -> str:
+    """Render stats.md"""
+    env = Environment(loader=FileSystemLoader("."))
+    env.filters["top_counter"] = top_counter
+    env.filters["time_string"] = time_string
+    env.filters["top_answer"] = top_answer
+    env.filters["bottom_answer"] = bottom_answer
+    template = env.get_template("stats.md")
+    return template.render(**variables)
+
+
 class Summarizer:
     """A post in ouija"""
 
-    def __init__(self, subreddit: str) -> None:
+    def __init__(self, subreddit: str, reddit: praw.Reddit | None = None) -> None:
         """Initialize."""
+        self.meter: RequestMeter | None = None
         if not READ_ONLY:
-            reddit = praw.Reddit(check_for_updates=False, client_secret=None)
+            reddit = reddit or praw.Reddit(check_for_updates=False, client_secret=None)
             self._reddit = reddit
+            self.meter = RequestMeter.install(reddit)
             self.subreddit = reddit.subreddit(subreddit)
         self.load_infos()
 
@@ -107,87 +133,15 @@ class Summarizer:
 
     @staticmethod
     def make_stats(questions, ruote):
-        """Return statistics of parsed questions with answer"""
-        authors = Counter([question["author"] for question in questions])
-        solvers = Counter(
-            [comment["author"] for question in questions for comment in question["comments"][0:-1]]
-        )
-        goodbyers = Counter([question["comments"][-1]["author"] for question in questions])
-        chars = Counter(
-            [
-                comment["body"].strip().upper()
-                for question in questions
-                for comment in question["comments"][0:-1]
-            ]
-        )
-        open_time = [
-            (
-                question["comments"][-1]["created_utc"] - question["created_utc"],
-                question,
-            )
-            for question in questions
-        ]
-        open_time = sorted(open_time, key=lambda item: item[0])
-        ruote_open_time = [
-            (
-                ruota["comments"][-1]["created_utc"] - ruota["created_utc"],
-                ruota,
-            )
-            for ruota in ruote
-        ]
-        ruote_open_time = sorted(ruote_open_time, key=lambda item: item[0])
-        ruote_solvers = Counter([ruota["comments"][-1]["author"] for ruota in ruote])
-        return {
-            "authors": authors,
-            "solvers": solvers,
-            "goodbyers": goodbyers,
-            "chars": chars,
-            "open_time": open_time,
-            "ruote_solvers": ruote_solvers,
-            "ruote_open_time": ruote_open_time,
-        }
+        """Return statistics of parsed questions with answer, and their summaries"""
+        accumulator = StatsAccumulator().consume(questions, ruote)
+        return {**accumulator.stats(), **accumulator.summaries()}
 
     def write_stats(self, questions, ruote, stats) -> None:
         """Write a <date>_stats.md file with statistics"""
-        variables = {
-            "day": self.fullname,
-            "questions": questions,
-            "ruote": ruote,
-            "mediums": len(set(stats["solvers"]) | set(stats["goodbyers"])),
-            "charlenght": sum(stats["chars"].values()),
-        }
-        for k, v in stats.items():
-            variables[k] = v
-        try:
-            answer_len = [len(question["answer"]) for question in questions]
-            variables["size"] = {
-                "mean": mean(answer_len),
-                "median": median(answer_len),
-                "mode": mode(answer_len),
-            }
-        except StatisticsError:
-            pass
-        try:
-            solvers_answer = stats["solvers"].values()
-            variables["solver"] = {
-                "mean": mean(solvers_answer),
-                "median": median(solvers_answer),
-                "mode": mode(solvers_answer),
-            }
-        except StatisticsError:
-            pass
-        try:
-            times = [time for time, _ in stats["open_time"]]
-            variables["otime"] = {"mean": mean(times), "median": median(times)}
-        except StatisticsError:
-            pass
-        env = Environment(loader=FileSystemLoader("."))
-        env.filters["top_counter"] = top_counter
-        env.filters["time_string"] = time_string
-        env.filters["top_answer"] = top_answer
-        env.filters["bottom_answer"] = bottom_answer
-        template = env.get_template("stats.md")
-        text = template.render(**variables)
+        variables = stats_variables(questions, ruote, stats)
+        variables["day"] = self.fullname
+        text = render_stats(variables)
         with open(f"data/{self.name}_stats.md", "w", encoding="utf-8") as fout:
             fout.write(text)
         if not READ_ONLY:
@@ -239,53 +193,151 @@ e le [statistiche](/r/{self.subreddit.display_name}/wiki/{self.name}_stats) rela
         wiki_caffe.edit(content="\n".join(lines), reason="DimmiOuija chiusura")
 
 
-def load_all():
-    ffilepaths = Path("./data").glob("[0-9][0-9][0-9][0-9]_[0-9][0-9].json")
-    if not ffilepaths:
-        raise ValueError("No data/*.json found")
-
-    plays = []
-    for ffilepath in ffilepaths:
-        try:
-            with ffilepath.open("rt", encoding="utf-8") as fin:
-                plays.extend(json.load(fin))
-        except json.decoder.JSONDecodeError as e:
-            print(e, ffilepath)
-    return plays
-
-
-def sql_all():
-    from dump import Dumper
+def period_stats(first: str | None = None, last: str | None = None) -> str:
+    """Write data/<first>-<last>_stats.md, statistics of the weeks in the dump database.
 
-    ffilepaths = Path("./data").glob("[0-9][0-9][0-9][0-9]_[0-9][0-9].json")
+    With NumPy, also the distributions of vectorstats"""
+    engine = StatsEngine()
+    questions, ruote, stats = engine.make_stats(first, last)
+    if not questions:
+        raise ValueError("No questions in the dump database for these weeks")
+    variables = stats_variables(questions, ruote, stats)
+    if vectorstats.np is not None:
+        variables.update(vectorstats.distributions(questions, stats, engine.activity(first, last)))
+    variables["day"] = " - ".join(
+        datetime.datetime.fromtimestamp(question["created_utc"]).strftime(DATE_FORMAT)
+        for question in (
+            min(questions, key=lambda q: q["created_utc"]),
+            max(questions, key=lambda q: q["created_utc"]),
+        )
+    )
+    name = f"{first or 'inizio'}-{last or 'oggi'}"
+    with open(f"data/{name}_stats.md", "w", encoding="utf-8") as fout:
+        fout.write(render_stats(variables))
+    return name
+
+
+def read_week(path: str) -> tuple[str, str, list | None]:
+    """Hash and parse a weekly JSON file, RETURNS path, hash and content (None if invalid)"""
+    data = Path(path).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        return path, digest, json.loads(data)
+    except json.decoder.JSONDecodeError as e:
+        print(e, path)
+        return path, digest, None
+
+
+def sql_all(workers: int | None = None):
+    """Import the new or changed weekly JSON files in the dump database.
+
+    Files are hashed and parsed on a pool of workers processes (default: one per CPU),
+    a single writer inserts them in one transaction, with the manifest of the imports."""
+    from dump import QUESTION, RUOTA, TABLES
+
+    ffilepaths = [
+        path for path in sorted(Path("./data").glob("*.json")) if WEEK_FILE.match(path.name)
+    ]
     if not ffilepaths:
         raise ValueError("No data/*.json found")
 
-    summary = Dumper("DimmiOuija")
-    questions = []
-    for ffilepath in ffilepaths:
-        try:
-            with ffilepath.open("rt", encoding="utf-8") as fin:
-                questions = json.load(fin)
-        except json.decoder.JSONDecodeError as e:
-            print(e, ffilepath)
-        summary._update_week(questions)
-        summary.to_sql(questions, [])
-        print("ok", ffilepath, len(questions))
+    store = DumpStore()
+    imported = store.imports()
+    stats = {str(path): path.stat() for path in ffilepaths}
+    # a file with the same size and mtime is not read at all
+    todo = [
+        path
+        for path, stat in stats.items()
+        if imported.get(path, (None, None))[:2] != (stat.st_mtime, stat.st_size)
+    ]
+    rows = 0
+
+    def write(results) -> None:
+        nonlocal rows
+        for path, digest, questions in results:
+            stat = stats[path]
+            if questions is None:
+                continue
+            if path in imported and imported[path][2] == digest:
+                # touched, not changed
+                store.add_import(path, stat.st_mtime, stat.st_size, digest, None)
+                continue
+            week, ruote = WEEK_FILE.match(Path(path).name).groups()
+            kind = RUOTA if ruote else QUESTION
+            count = store.insert(*TABLES[kind], questions, week)
+            store.add_import(path, stat.st_mtime, stat.st_size, digest, count)
+            rows += count
+            print("ok", path, len(questions))
+
+    start = time.perf_counter()
+    with store.bulk():
+        if workers == 1 or len(todo) < 2:
+            write(map(read_week, todo))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                write(executor.map(read_week, todo, chunksize=8))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(todo)}/{len(ffilepaths)} files read, {rows} rows in {elapsed:.2f} s "
+        f"({rows / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+    store.close()
 
 
 def main():
     """Perform all bot actions"""
+    parser = argparse.ArgumentParser(description="Summarize the last week of /r/DimmiOuija")
+    parser.add_argument(
+        "--sql-all",
+        action="store_true",
+        help="Import the new or changed data/*.json in the dump database, and exit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes parsing the JSON files for --sql-all (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--period",
+        nargs=2,
+        metavar=("FIRST", "LAST"),
+        help="Write the statistics of the weeks FIRST to LAST (YYYY_WW, - for no limit) "
+        "from the dump database, and exit",
+    )
+    parser.add_argument(
+        "--rebuild-aggregates",
+        action="store_true",
+        help="Compute again the per week aggregates of the dump database, and exit",
+    )
+    args = parser.parse_args()
+    if args.sql_all:
+        sql_all(args.workers)
+        return
+    if args.rebuild_aggregates:
+        store = DumpStore()
+        store.rebuild()
+        store.close()
+        return
+    if args.period:
+        first, last = (None if week == "-" else week for week in args.period)
+        print("Written", period_stats(first, last))
+        return
+
     summary = Summarizer("DimmiOuija")
     questions, ruote = summary.load_infos()
     if not questions:
         print("ERROR - Data missing - Please run dump.py first")
         return
-    summary.write_answers(questions, ruote)
-    stats = summary.make_stats(questions, ruote)
-    summary.write_stats(questions, ruote, stats)
-    if not READ_ONLY:
-        summary.caffe_wiki("italy")
+    try:
+        summary.write_answers(questions, ruote)
+        stats = summary.make_stats(questions, ruote)
+        summary.write_stats(questions, ruote, stats)
+        if not READ_ONLY:
+            summary.caffe_wiki("italy")
+    finally:
+        if summary.meter:
+            summary.meter.write("summary")
 
 
 if __name__ == "__main__":
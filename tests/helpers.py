@@ -0,0 +1,1143 @@
+"""Test doubles and fixtures shared by the tests and the benchmarks.
+
+In-memory stand-ins for praw objects, an offline reddit serving them to praw over HTTP,
+generated editions of the weekly dump and scratch directories laid out like the repository"""
+
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import string
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlsplit
+
+import praw
+import prawcore
+import requests
+from praw.models import MoreComments
+from requests.structures import CaseInsensitiveDict
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ALPHABET = string.ascii_uppercase
+GOODBYES = ["Goodbye", "Arrivederci", "addio", "GOODBYE!"]
+JUNK = ["ciao", "lol", "AB", "questa è una frase", "🤔🤔"]
+EXTRAS = ["\\*", " a ", "à", "👻", "?", "'"]
+
+
+class FakeRedditor:
+    """A reddit user"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, str):
+            return other.lower() == self.name.lower()
+        return isinstance(other, FakeRedditor) and other.name.lower() == self.name.lower()
+
+    def __hash__(self) -> int:
+        return hash(self.name.lower())
+
+
+class FakeMod:
+    """Moderation actions, recorded in the log of the submission"""
+
+    def __init__(self, thing: "FakeComment | FakeSubmission", log: list) -> None:
+        self._thing = thing
+        self._log = log
+
+    def remove(self) -> None:
+        # like praw, the removed attribute is not updated until the next fetch
+        self._log.append(("remove", self._thing.id))
+
+    def flair(self, text: str | None = None, css_class: str = "", **_) -> None:
+        self._log.append(("flair", self._thing.id, text))
+        self._thing.link_flair_text = text
+        self._thing.link_flair_css_class = css_class
+
+    def lock(self) -> None:
+        self._log.append(("lock", self._thing.id))
+
+    def sticky(self, state: bool = True, **_) -> None:
+        self._log.append(("sticky", self._thing.id, state))
+        self._thing.stickied = state
+
+
+class FakeMoreComments(MoreComments):
+    """A "load more comments" placeholder, hiding the comments in _hidden"""
+
+    def __init__(self, submission: "FakeSubmission", parent_id: str, hidden: list) -> None:
+        super().__init__(
+            None,
+            {"count": len(hidden), "children": [c.id for c in hidden], "parent_id": parent_id},
+        )
+        self.submission = submission
+        self._hidden = hidden
+
+    def comments(self, update: bool = True) -> list:
+        self.submission.requests.append(("morechildren", self.parent_id))
+        return list(self._hidden)
+
+
+class FakeForest:
+    """A CommentForest"""
+
+    def __init__(
+        self, submission: "FakeSubmission", comments: "list[FakeComment] | None" = None
+    ) -> None:
+        self._submission = submission
+        self._comments = comments if comments is not None else []
+
+    def __iter__(self):
+        return iter(self._comments)
+
+    def __len__(self) -> int:
+        return len(self._comments)
+
+    def __getitem__(self, index: int) -> "FakeComment":
+        return self._comments[index]
+
+    @staticmethod
+    def _gather_more_comments(tree: list, parent_tree: list | None = None) -> list:
+        more_comments = []
+        queue = [(None, x) for x in tree]
+        while queue:
+            parent, comment = queue.pop(0)
+            if isinstance(comment, MoreComments):
+                more_comments.append(comment)
+                comment._remove_from = parent.replies._comments if parent else parent_tree or tree
+            else:
+                queue.extend((comment, item) for item in comment.replies)
+        return more_comments
+
+    def _insert_comment(self, comment: "FakeComment | FakeMoreComments") -> None:
+        if isinstance(comment, MoreComments) or comment.is_root:
+            self._submission.comments._comments.append(comment)
+        else:
+            self._submission.comments_by_id[comment.parent_id].replies._comments.append(comment)
+
+    def list(self) -> "list[FakeComment]":
+        """Breadth first list of all comments, like CommentForest.list"""
+        comments = []
+        queue = list(self._comments)
+        i = 0
+        while i < len(queue):
+            comment = queue[i]
+            i += 1
+            comments.append(comment)
+            if not isinstance(comment, MoreComments):
+                queue.extend(comment.replies._comments)
+        return comments
+
+    def replace_more(self, limit: int | None = 32, threshold: int = 0) -> list:
+        """Load the hidden comments, like CommentForest.replace_more"""
+        more_comments = self._gather_more_comments(self._comments)
+        skipped = []
+        while more_comments:
+            item = more_comments.pop(0)
+            if limit is not None and limit <= 0:
+                skipped.append(item)
+                item._remove_from.remove(item)
+                continue
+            if limit is not None:
+                limit -= 1
+            new_comments = item.comments(update=False)
+            more_comments.extend(
+                self._gather_more_comments(new_comments, parent_tree=self._comments)
+            )
+            for comment in new_comments:
+                self._insert_comment(comment)
+            item._remove_from.remove(item)
+        return skipped
+
+
+class FakeComment:
+    """A comment"""
+
+    def __init__(
+        self,
+        submission: "FakeSubmission",
+        comment_id: str,
+        parent_id: str,
+        body: str,
+        author: FakeRedditor | None,
+        score: int,
+        created_utc: float,
+    ) -> None:
+        self.submission = submission
+        self.id = comment_id
+        self.name = "t1_" + comment_id
+        self.parent_id = parent_id
+        self.link_id = submission.name
+        self.body = body
+        self.author = author
+        self.score = score
+        self.created = self.created_utc = created_utc
+        self.stickied = False
+        self.distinguished = None
+        self.removed = False
+        self.locked = False
+        self.replies = FakeForest(submission)
+        self.mod = FakeMod(self, submission.log)
+        self.permalink = f"{submission.permalink}{comment_id}/"
+
+    @property
+    def is_root(self) -> bool:
+        return self.parent_id == self.submission.name
+
+    def reply(self, body: str) -> "FakeComment":
+        """Reply as the author of the submission, like the bot does"""
+        return self.submission.add_comment(self, body, author=self.submission.author)
+
+    def parent(self) -> "FakeComment | FakeSubmission":
+        if self.is_root:
+            return self.submission
+        return self.submission.comments_by_id[self.parent_id]
+
+    def __repr__(self) -> str:
+        return f"FakeComment(id={self.id!r}, body={self.body!r})"
+
+
+class FakeSubreddit:
+    """A subreddit"""
+
+    def __init__(self, display_name: str) -> None:
+        self.display_name = display_name
+
+
+class FakeSubmission:
+    """A submission with its comments"""
+
+    def __init__(
+        self,
+        submission_id: str,
+        title: str = "Domanda?",
+        author: FakeRedditor | None = None,
+        created_utc: float = 0.0,
+        subreddit: FakeSubreddit | None = None,
+        comment_prefix: str = "c",
+    ) -> None:
+        self.id = submission_id
+        self.comment_prefix = comment_prefix
+        self.name = self.fullname = "t3_" + submission_id
+        self.title = title
+        self.author = author
+        self.created_utc = created_utc
+        self.subreddit = subreddit or FakeSubreddit("DimmiOuija")
+        self.permalink = f"/r/{self.subreddit.display_name}/comments/{submission_id}/_/"
+        self.url = "https://www.reddit.com" + self.permalink
+        self.score = 1
+        self.selftext = ""
+        self.link_flair_text: str | None = None
+        self.link_flair_css_class: str | None = None
+        self.distinguished = None
+        self.stickied = False
+        self.removed = False
+        self.comment_sort = "confidence"
+        self.comments = FakeForest(self)
+        self.comments_by_id: dict[str, FakeComment] = {}
+        self.log: list = []
+        """Moderation actions"""
+        self.requests: list = []
+        """Requests to load comments"""
+        self.mod = FakeMod(self, self.log)
+
+    def collapse(self, rate: float, seed: int = 0) -> None:
+        """Hide some replies behind MoreComments, like reddit does in big threads"""
+        rnd = random.Random(seed)
+        for parent in [self, *self.comments_by_id.values()]:
+            forest = parent.comments if parent is self else parent.replies
+            if len(forest) < 2 or rnd.random() >= rate:
+                continue
+            keep = rnd.randint(0, len(forest) - 1)
+            hidden = forest._comments[keep:]
+            del forest._comments[keep:]
+            # like morechildren, return the whole branches as a flat list
+            i = 0
+            while i < len(hidden):
+                hidden.extend(c for c in hidden[i].replies if not isinstance(c, MoreComments))
+                hidden[i].replies._comments = [
+                    c for c in hidden[i].replies if isinstance(c, MoreComments)
+                ]
+                i += 1
+            forest._comments.append(FakeMoreComments(self, parent.name, hidden))
+
+    def edit(self, body: str) -> None:
+        self.log.append(("edit", self.id))
+        self.selftext = body
+
+    @property
+    def num_comments(self) -> int:
+        return len(self.comments_by_id)
+
+    def add_comment(
+        self, parent: "FakeComment | FakeSubmission", body: str, **kwargs
+    ) -> FakeComment:
+        """Append a new comment to parent"""
+        comment = FakeComment(
+            self,
+            kwargs.pop("comment_id", f"{self.comment_prefix}{len(self.comments_by_id)}"),
+            parent.name,
+            body,
+            kwargs.pop("author", FakeRedditor("user")),
+            kwargs.pop("score", 1),
+            kwargs.pop("created_utc", self.created_utc + len(self.comments_by_id) + 1),
+        )
+        for key, value in kwargs.items():
+            setattr(comment, key, value)
+        self.comments_by_id[comment.name] = comment
+        if parent is self:
+            self.comments._comments.append(comment)
+        else:
+            parent.replies._comments.append(comment)
+        return comment
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, FakeSubmission) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+def make_thread(
+    size: int,
+    seed: int = 0,
+    depth_bias: float = 0.7,
+    users: int = 30,
+    noise: float = 1.0,
+    created_utc: float = 1_600_000_000.0,
+    submission_id: str | None = None,
+) -> FakeSubmission:
+    """Generate a messy ouija thread of size comments.
+
+    depth_bias is the probability to reply to one of the latest comments,
+    so higher values produce longer chains.
+    noise scales the share of goodbyes, junk and odd characters."""
+    rnd = random.Random(seed)
+    authors = [FakeRedditor(f"user{i}") for i in range(users)]
+    submission = FakeSubmission(
+        submission_id or f"s{seed}",
+        author=authors[0],
+        created_utc=created_utc,
+        comment_prefix=f"{submission_id}c" if submission_id else "c",
+    )
+    nodes: list[FakeComment | FakeSubmission] = [submission]
+    for _ in range(size):
+        if rnd.random() < depth_bias:
+            parent = nodes[-rnd.randint(1, min(len(nodes), 5))]
+        else:
+            parent = rnd.choice(nodes)
+        draw = rnd.random()
+        if draw < 0.08 * noise:
+            body = rnd.choice(GOODBYES)
+        elif draw < 0.13 * noise:
+            body = rnd.choice(JUNK)
+        elif draw < 0.18 * noise:
+            body = rnd.choice(EXTRAS)
+        else:
+            body = rnd.choice(ALPHABET[:8])
+        author = None if rnd.random() < 0.02 else rnd.choice(authors)
+        parent_utc = getattr(parent, "created_utc", submission.created_utc)
+        comment = submission.add_comment(
+            parent,
+            body,
+            author=author,
+            score=rnd.randint(-2, 8),
+            created_utc=parent_utc + rnd.randint(0, 600),
+        )
+        if rnd.random() < 0.01:
+            comment.distinguished = "moderator"
+        if rnd.random() < 0.02:
+            comment.removed = True
+        nodes.append(comment)
+    return submission
+
+
+def make_chain(size: int, goodbye: str = "Goodbye") -> FakeSubmission:
+    """Generate a thread with a single answer of size letters"""
+    submission = FakeSubmission("chain", author=FakeRedditor("op"), created_utc=1_600_000_000.0)
+    parent = submission
+    for i in range(size):
+        parent = submission.add_comment(
+            parent, ALPHABET[i % len(ALPHABET)], author=FakeRedditor(f"user{i % 2}")
+        )
+    submission.add_comment(parent, goodbye, author=FakeRedditor("bye"), score=3)
+    return submission
+
+
+def make_ruota(
+    size: int,
+    seed: int = 0,
+    solution: str = "UNA FRASE MISTERIOSA",
+    users: int = 30,
+    answers: float = 0.05,
+    created_utc: float | None = None,
+    submission_id: str = "ruota",
+) -> FakeSubmission:
+    """Generate an open ruota with size top level comments, asking letters in the last hour.
+
+    answers is the share of (wrong) guesses of the whole solution."""
+    rnd = random.Random(seed)
+    created_utc = created_utc or time.time() - 3 * 60 * 60
+    submission = FakeSubmission(
+        submission_id,
+        title="Ruota della fortuna",
+        author=FakeRedditor("DimmiOuijaBot"),
+        created_utc=created_utc,
+        comment_prefix=f"{submission_id}c",
+    )
+    clue = "".join("-" if c in ALPHABET else c for c in solution)
+    submission.selftext = f"Indovina la frase:\n\n{clue}\n\nLettere non presenti:\n\n---"
+    submission.link_flair_text = "Ruota della fortuna"
+    authors = [FakeRedditor(f"user{i}") for i in range(users)]
+    for i in range(size):
+        if rnd.random() < answers:
+            body = solution[:-1] + rnd.choice(ALPHABET.replace(solution[-1], ""))
+        else:
+            body = rnd.choice(ALPHABET)
+        submission.add_comment(
+            submission,
+            body,
+            author=None if rnd.random() < 0.02 else rnd.choice(authors),
+            created_utc=time.time() - 3600 + i * 3600 / size,
+        )
+    return submission
+
+
+LISTING_CAP = 1000  # reddit listings stop after 1000 items
+MAX_DEPTH = 10  # deeper replies are behind a "continue this thread" link
+ROUTES = [
+    ("POST", r"api/v1/access_token", "access_token"),
+    ("GET", r"api/v1/me", "me"),
+    ("GET", r"api/info", "info"),
+    ("GET", r"r/(?P<sub>[^/]+)/(?P<sort>new|hot|top)", "listing"),
+    ("GET", r"r/(?P<sub>[^/]+)/comments", "subreddit_comments"),
+    ("GET", r"r/(?P<sub>[^/]+)/about/sticky", "sticky"),
+    ("GET", r"r/(?P<sub>[^/]+)/about/moderators", "moderators"),
+    ("GET", r"r/(?P<sub>[^/]+)/wiki/(?P<page>.+)", "wiki"),
+    ("POST", r"r/(?P<sub>[^/]+)/api/wiki/edit", "wiki_edit"),
+    ("POST", r"r/(?P<sub>[^/]+)/api/selectflair", "flair"),
+    ("GET", r"comments/(?P<id>[^/]+)(?:/_/(?P<comment>[^/]+))?", "comments"),
+    ("POST", r"api/morechildren", "morechildren"),
+    ("POST", r"api/comment", "comment"),
+    ("POST", r"api/submit", "submit"),
+    ("POST", r"api/editusertext", "edit"),
+    ("POST", r"api/remove", "remove"),
+    ("POST", r"api/mod/conversations", "modmail"),
+    ("POST", r"api/mod/conversations/(?P<id>[^/]+)/archive", "ok"),
+    ("POST", r"api/compose", "ok"),
+    ("POST", r"api/lock", "ok"),
+    ("POST", r"api/distinguish", "distinguish"),
+    ("POST", r"api/set_subreddit_sticky", "set_sticky"),
+    ("POST", r"api/set_suggested_sort", "ok"),
+]
+
+
+class FakeReddit:
+    """A small reddit served to praw through its HTTP session.
+
+    Subreddits are lists of FakeSubmission (MoreComments included),
+    every request is counted by endpoint in requests."""
+
+    def __init__(self, me: str = "DimmiOuijaBot", latency: float = 0.0) -> None:
+        """Initialize.
+
+        latency = seconds each request takes, to get wall times closer to reality
+        """
+        self.me = me
+        self.latency = latency
+        self.subreddits: dict[str, list[FakeSubmission]] = {}
+        self.wiki: dict[tuple[str, str], dict] = {}
+        self.moderators: dict[str, list[str]] = {}
+        self.things: dict[str, FakeComment | FakeSubmission] = {}
+        self.requests: dict[str, int] = {}
+        """Endpoint -> number of requests"""
+        self.modmail: list[tuple[str, str]] = []
+        """Recipient and subject of the modmails sent"""
+        self.missing_users: set[str] = set()
+        self._routes = [(method, re.compile(path + "/?$"), name) for method, path, name in ROUTES]
+        self._more_ids = 0
+
+    def reddit(self, **kwargs) -> praw.Reddit:
+        """Return a praw instance bound to this fake"""
+        return praw.Reddit(
+            client_id="offline",
+            client_secret="offline",
+            username=self.me,
+            password="offline",
+            user_agent="python:dimmi-ouja:offline (by /u/timendum)",
+            check_for_updates=False,
+            requestor_kwargs={"session": FakeHTTP(self)},
+            **kwargs,
+        )
+
+    def add_subreddit(self, name: str, moderators: list[str] | None = None) -> FakeSubreddit:
+        """Create an empty subreddit"""
+        self.subreddits.setdefault(name, [])
+        self.moderators[name] = moderators or [self.me]
+        return FakeSubreddit(name)
+
+    def add_submission(self, submission: FakeSubmission) -> FakeSubmission:
+        """Publish a submission, with all its comments"""
+        self.subreddits[submission.subreddit.display_name].append(submission)
+        self.things[submission.name] = submission
+        for comment in submission.comments_by_id.values():
+            self.things[comment.name] = comment
+        return submission
+
+    def set_wiki(self, subreddit: str, page: str, content: str, revision_date: float = 0) -> None:
+        """Create or replace a wiki page"""
+        self.wiki[(subreddit.lower(), page.lower())] = {
+            "content_md": content,
+            "revision_date": revision_date or time.time(),
+        }
+
+    def get_wiki(self, subreddit: str, page: str) -> str:
+        """Content of a wiki page"""
+        return self.wiki[(subreddit.lower(), page.lower())]["content_md"]
+
+    def total(self) -> int:
+        """Number of requests, authentication excluded"""
+        return sum(count for name, count in self.requests.items() if name != "access_token")
+
+    def handle(self, method: str, path: str, params: dict, data: dict) -> tuple[int, dict, dict]:
+        """Serve a request, return status, headers and body"""
+        route = next(
+            (
+                (name, match)
+                for route_method, pattern, name in self._routes
+                if route_method == method and (match := pattern.match(path))
+            ),
+            None,
+        )
+        if route is None:
+            name = f"{method} {path}"
+            self.requests[name] = self.requests.get(name, 0) + 1
+            return 404, {}, {"message": "Not Found", "error": 404}
+        name, match = route
+        endpoint = name if name != "ok" else path.split("/")[-1]
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        result = getattr(self, "_" + name)(params=params, data=data, **match.groupdict())
+        if isinstance(result, tuple):
+            return result
+        return 200, {}, result
+
+    # Serialization
+
+    def _submission_data(self, submission: FakeSubmission) -> dict:
+        return {
+            "id": submission.id,
+            "name": submission.name,
+            "title": submission.title,
+            "author": submission.author.name if submission.author else "[deleted]",
+            "created_utc": submission.created_utc,
+            "created": submission.created_utc,
+            "score": submission.score,
+            "num_comments": submission.num_comments,
+            "selftext": submission.selftext,
+            "is_self": True,
+            "link_flair_text": submission.link_flair_text,
+            "link_flair_css_class": submission.link_flair_css_class,
+            "distinguished": submission.distinguished,
+            "stickied": submission.stickied,
+            "removed": submission.removed,
+            "locked": False,
+            "permalink": submission.permalink,
+            "url": submission.url,
+            "subreddit": submission.subreddit.display_name,
+        }
+
+    def _comment_data(self, comment: FakeComment, depth: int | None) -> dict:
+        """A comment, with its replies up to MAX_DEPTH if depth is not None"""
+        data = {
+            "id": comment.id,
+            "name": comment.name,
+            "body": comment.body,
+            "author": comment.author.name if comment.author else "[deleted]",
+            "created_utc": comment.created_utc,
+            "created": comment.created,
+            "score": comment.score,
+            "parent_id": comment.parent_id,
+            "link_id": comment.link_id,
+            "distinguished": comment.distinguished,
+            "stickied": comment.stickied,
+            "removed": comment.removed,
+            "locked": comment.locked,
+            "permalink": comment.permalink,
+            "subreddit": comment.submission.subreddit.display_name,
+            "replies": "",
+        }
+        if depth is not None and len(comment.replies):
+            data["replies"] = self._tree(comment.replies, comment.name, depth + 1)
+        return data
+
+    def _more_data(self, more: FakeMoreComments | None, parent_id: str) -> dict:
+        """A MoreComments, or a "continue this thread" link if more is None"""
+        self._more_ids += 1
+        return {
+            "kind": "more",
+            "data": {
+                "id": f"more{self._more_ids}",
+                "name": f"t1_more{self._more_ids}",
+                "count": more.count if more else 0,
+                "children": list(more.children) if more else [],
+                "parent_id": parent_id,
+            },
+        }
+
+    def _tree(self, forest, parent_id: str, depth: int) -> dict:
+        if depth >= MAX_DEPTH:
+            return self._things([], extra=[self._more_data(None, parent_id)])
+        children = [
+            self._more_data(item, parent_id)
+            if isinstance(item, FakeMoreComments)
+            else {"kind": "t1", "data": self._comment_data(item, depth)}
+            for item in forest
+        ]
+        return self._things([], extra=children)
+
+    def _things(self, things: list, extra: list | None = None) -> dict:
+        children = [
+            {"kind": "t3", "data": self._submission_data(thing)}
+            if isinstance(thing, FakeSubmission)
+            else {"kind": "t1", "data": self._comment_data(thing, None)}
+            for thing in things
+        ]
+        return {
+            "kind": "Listing",
+            "data": {"after": None, "before": None, "children": children + (extra or [])},
+        }
+
+    def _page(self, things: list, params: dict) -> dict:
+        """A page of a listing, following limit, after and before"""
+        things = things[:LISTING_CAP]
+        names = [thing.name for thing in things]
+        limit = min(int(params.get("limit") or 25), 100)
+        if params.get("before"):
+            end = names.index(params["before"]) if params["before"] in names else 0
+            page = things[max(end - limit, 0) : end]
+        else:
+            start = names.index(params["after"]) + 1 if params.get("after") in names else 0
+            page = things[start : start + limit]
+        listing = self._things(page)
+        if page and page[-1].name != names[-1] and not params.get("before"):
+            listing["data"]["after"] = page[-1].name
+        return listing
+
+    # Endpoints
+
+    def _access_token(self, **_) -> dict:
+        return {"access_token": "offline", "expires_in": 3600, "scope": "*", "token_type": "bearer"}
+
+    def _me(self, **_) -> dict:
+        return {"name": self.me, "id": "offline"}
+
+    def _ok(self, **_) -> dict:
+        return {}
+
+    def _info(self, params: dict, **_) -> dict:
+        names = params.get("id", "").split(",")
+        return self._things([self.things[name] for name in names if name in self.things])
+
+    def _listing(self, params: dict, sub: str, sort: str, **_) -> dict:
+        submissions = [s for s in self.subreddits[sub] if not s.removed]
+        if sort == "new":
+            submissions.sort(key=lambda s: s.created_utc, reverse=True)
+        elif sort == "hot":
+            submissions.sort(key=lambda s: (s.stickied, s.score, s.created_utc), reverse=True)
+        else:
+            since = time.time() - {"week": 7, "day": 1}.get(params.get("t"), 100_000) * 86400
+            submissions = [s for s in submissions if s.created_utc >= since]
+            submissions.sort(key=lambda s: s.score, reverse=True)
+        return self._page(submissions, params)
+
+    def _subreddit_comments(self, params: dict, sub: str, **_) -> dict:
+        comments = [
+            comment
+            for submission in self.subreddits[sub]
+            for comment in submission.comments_by_id.values()
+        ]
+        comments.sort(key=lambda c: c.created_utc, reverse=True)
+        return self._page(comments, params)
+
+    def _sticky(self, params: dict, sub: str, **_) -> tuple:
+        stickied = [s for s in self.subreddits[sub] if s.stickied]
+        number = int(params.get("num", 1))
+        if len(stickied) < number:
+            return 404, {}, {"message": "Not Found", "error": 404}
+        location = f"https://oauth.reddit.com{stickied[number - 1].permalink}"
+        return 302, {"location": location}, {}
+
+    def _moderators(self, sub: str, **_) -> dict:
+        children = [
+            {"name": name, "id": f"t2_{name}", "date": 0.0} for name in self.moderators[sub]
+        ]
+        return {"kind": "UserList", "data": {"children": children}}
+
+    def _wiki(self, sub: str, page: str, **_) -> tuple | dict:
+        wiki = self.wiki.get((sub.lower(), page.lower()))
+        if wiki is None:
+            return 404, {}, {"reason": "PAGE_NOT_FOUND", "message": "Not Found"}
+        return {
+            "kind": "wikipage",
+            "data": {
+                "content_md": wiki["content_md"],
+                "content_html": "",
+                "may_revise": True,
+                "revision_date": wiki["revision_date"],
+                "revision_by": {"kind": "t2", "data": {"name": self.me}},
+                "revision_id": "offline",
+            },
+        }
+
+    def _wiki_edit(self, data: dict, sub: str, **_) -> dict:
+        self.set_wiki(sub, data["page"], data["content"])
+        return {}
+
+    def _flair(self, data: dict, **_) -> dict:
+        submission = self.things[data["link"]]
+        submission.link_flair_text = data.get("text")
+        submission.link_flair_css_class = data.get("css_class")
+        return {"json": {"errors": []}}
+
+    def _comments(self, params: dict, id: str, comment: str | None = None, **_) -> list:
+        submission = self.things["t3_" + id]
+        if comment:
+            tree = self._things(
+                [],
+                extra=[{"kind": "t1", "data": self._comment_data(self.things["t1_" + comment], 0)}],
+            )
+        else:
+            tree = self._tree(submission.comments, submission.name, 0)
+        return [self._things([submission]), tree]
+
+    def _morechildren(self, data: dict, **_) -> dict:
+        things = []
+        for comment_id in data["children"].split(","):
+            comment = self.things["t1_" + comment_id]
+            things.append({"kind": "t1", "data": self._comment_data(comment, None)})
+            things.extend(
+                self._more_data(item, comment.name)
+                for item in comment.replies
+                if isinstance(item, FakeMoreComments)
+            )
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def _comment(self, data: dict, **_) -> dict:
+        parent = self.things[data["thing_id"]]
+        submission = parent if isinstance(parent, FakeSubmission) else parent.submission
+        comment = submission.add_comment(
+            parent, data["text"], author=FakeRedditor(self.me), created_utc=time.time()
+        )
+        self.things[comment.name] = comment
+        return {
+            "json": {
+                "errors": [],
+                "data": {"things": [{"kind": "t1", "data": self._comment_data(comment, None)}]},
+            }
+        }
+
+    def _submit(self, data: dict, **_) -> dict:
+        sub = data["sr"]
+        submission = FakeSubmission(
+            f"n{len(self.things)}",
+            title=data["title"],
+            author=FakeRedditor(self.me),
+            created_utc=time.time(),
+            subreddit=FakeSubreddit(sub),
+        )
+        submission.selftext = data.get("text", "")
+        self.add_submission(submission)
+        return {
+            "json": {
+                "errors": [],
+                "data": {"url": submission.url, "id": submission.name, "name": submission.name},
+            }
+        }
+
+    def _edit(self, data: dict, **_) -> dict:
+        thing = self.things[data["thing_id"]]
+        if isinstance(thing, FakeSubmission):
+            thing.selftext = data["text"]
+            things = [{"kind": "t3", "data": self._submission_data(thing)}]
+        else:
+            thing.body = data["text"]
+            things = [{"kind": "t1", "data": self._comment_data(thing, None)}]
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def _remove(self, data: dict, **_) -> dict:
+        self.things[data["id"]].removed = True
+        return {}
+
+    def _distinguish(self, data: dict, **_) -> dict:
+        thing = self.things[data["id"]]
+        thing.distinguished = "moderator" if data["how"] == "yes" else None
+        if isinstance(thing, FakeComment):
+            thing.stickied = data.get("sticky") == "true"
+        return {"json": {"errors": [], "data": {"things": []}}}
+
+    def _set_sticky(self, data: dict, **_) -> dict:
+        self.things[data["id"]].stickied = data.get("state") in (True, "True", "true")
+        return {}
+
+    def _modmail(self, data: dict, **_) -> dict:
+        recipient = data["to"]
+        if recipient in self.missing_users:
+            return {"json": {"errors": [["USER_DOESNT_EXIST", "that user doesn't exist", "to"]]}}
+        self.modmail.append((recipient, data["subject"]))
+        conversation = {
+            "id": f"conv{len(self.modmail)}",
+            "isInternal": False,
+            "subject": data["subject"],
+            "authors": [],
+            "owner": {"displayName": data["srName"], "type": "subreddit", "id": "t5_offline"},
+            "participant": {"name": recipient, "id": "t2_offline"},
+            "objIds": [],
+        }
+        return {"conversation": conversation, "messages": {}, "modActions": {}}
+
+
+def form(data) -> dict:
+    """Decode the data of a request, as strings like requests sends them"""
+    if isinstance(data, str):
+        return dict(parse_qsl(data))
+    if isinstance(data, dict):
+        data = data.items()
+    return {key: str(value) for key, value in data or []}
+
+
+class FakeHTTP:
+    """A requests.Session answering with a FakeReddit"""
+
+    def __init__(self, server: FakeReddit) -> None:
+        self.server = server
+        self.headers = CaseInsensitiveDict()
+        self._used = 0
+
+    def request(self, method: str, url: str, params=None, data=None, **_) -> requests.Response:
+        """Serve the request, with rate limit headers that never need to wait"""
+        split = urlsplit(url)
+        status, headers, body = self.server.handle(
+            method.upper(),
+            split.path.strip("/"),
+            dict(params or {}),
+            form(data),
+        )
+        self._used += 1
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response._content = json.dumps(body).encode()
+        response.headers = CaseInsensitiveDict(
+            {
+                "content-type": "application/json",
+                "content-length": str(len(response._content)),
+                "x-ratelimit-remaining": str(max(1000 - self._used, 0)),
+                "x-ratelimit-used": str(self._used),
+                "x-ratelimit-reset": "0",
+                **headers,
+            }
+        )
+        return response
+
+    def __deepcopy__(self, memo: dict) -> "FakeHTTP":
+        # prawcore deep copies the request data, that may hold praw objects (and so the fake)
+        return self
+
+    def close(self) -> None:
+        pass
+
+
+def make_answered(
+    size: int, seed: int, created_utc: float, submission_id: str, answer: str
+) -> FakeSubmission:
+    """A messy thread with answer spelled by a chain under a root comment"""
+    submission = make_thread(size, seed, created_utc=created_utc, submission_id=submission_id)
+    parent = submission
+    for i, letter in enumerate(answer):
+        parent = submission.add_comment(
+            parent, letter, author=FakeRedditor(f"user{i % 7}"), score=2, created_utc=created_utc
+        )
+    submission.add_comment(parent, "Goodbye", author=FakeRedditor("bye"), score=50)
+    submission.link_flair_text = "Ouija dice: " + answer
+    submission.link_flair_css_class = "answered"
+    return submission
+
+
+def make_subreddit(
+    fake: FakeReddit,
+    name: str = "DimmiOuija",
+    questions: int = 40,
+    answered: float = 0.5,
+    size: int = 150,
+    depth_bias: float = 0.7,
+    collapse: float = 0.2,
+    ruote: int = 2,
+    pmlist: int = 50,
+    notify: int = 30,
+    seed: int = 0,
+) -> FakeSubreddit:
+    """Fill fake with a subreddit in the middle of an edition.
+
+    questions = number of submissions, answered = share already answered,
+    size = comments per submission, collapse = share of replies behind MoreComments,
+    ruote = number of solved ruote, pmlist = users in the PM list,
+    notify = users asking for a reply at the next opening."""
+    rnd = random.Random(seed)
+    subreddit = fake.add_subreddit(name)
+    now = time.time()
+    for i in range(questions):
+        created_utc = now - (questions - i) * 600
+        if rnd.random() < answered:
+            answer = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(2, 12)))
+            submission = make_answered(size, seed + i, created_utc, f"q{i}", answer)
+        else:
+            submission = make_thread(
+                size, seed + i, depth_bias, created_utc=created_utc, submission_id=f"q{i}"
+            )
+        submission.subreddit = subreddit
+        submission.score = rnd.randint(1, 30)
+        submission.title = f"Domanda {i}?"
+        submission.collapse(collapse, seed + i)
+        fake.add_submission(submission)
+    for i in range(ruote):
+        solution = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(8, 16)))
+        ruota = FakeSubmission(
+            f"r{i}",
+            title="Ruota della fortuna",
+            author=FakeRedditor(fake.me),
+            created_utc=now - (ruote - i) * 3600,
+            subreddit=subreddit,
+        )
+        ruota.selftext = f"Indovina la frase:\n\nSoluzione: {solution}\n\nHa indovinato: u/user1"
+        ruota.link_flair_text = "Indovinato!"
+        for letter in solution[: len(solution) // 2]:
+            ruota.add_comment(ruota, letter, author=FakeRedditor(f"user{rnd.randint(0, 9)}"))
+        ruota.add_comment(ruota, solution, author=FakeRedditor("user1"))
+        fake.add_submission(ruota)
+    # the ruota of today, a few letters asked
+    solution = "UNA FRASE MISTERIOSA"
+    ruota = FakeSubmission(
+        "rtoday",
+        title="Ruota della fortuna - 3 5 10",
+        author=FakeRedditor(fake.me),
+        created_utc=now - 3 * 3600,
+        subreddit=subreddit,
+    )
+    clue = "".join("-" if c in ALPHABET else c for c in solution)
+    ruota.selftext = f"Indovina la frase:\n\n{clue}\n\nLettere non presenti:\n\n---"
+    ruota.link_flair_text = "Ruota della fortuna"
+    for i, letter in enumerate("AEOSBZ"):
+        ruota.add_comment(
+            ruota, letter, author=FakeRedditor(f"user{i}"), created_utc=now - 3600 + i
+        )
+    fake.add_submission(ruota)
+    # the announcement of the next opening, with the users to notify
+    prossima = FakeSubmission(
+        "prossima",
+        title="Riapriamo il 1 gennaio",
+        author=FakeRedditor(fake.me),
+        created_utc=now - 14 * 86400,
+        subreddit=subreddit,
+    )
+    prossima.distinguished = "moderator"
+    prossima.stickied = True
+    prossima.score = 100
+    notice = prossima.add_comment(prossima, "Vuoi essere contattato?", author=FakeRedditor(fake.me))
+    notice.distinguished = "moderator"
+    for i in range(notify):
+        prossima.add_comment(notice, "Io!", author=FakeRedditor(f"user{i}"))
+    fake.add_submission(prossima)
+    users = "\n\n".join(f"user{i}" for i in range(pmlist))
+    fake.set_wiki(name, "pmlist", users)
+    fake.set_wiki(name, "pmlist_todo", "")
+    fake.set_wiki(name, "config/automoderator", "---\n    ~name: [x]\n    # DummyUtente9510\n---")
+    fake.set_wiki(name, "rdellaf", solution.lower())
+    fake.set_wiki(name, "index", "# DimmiOuija\n\n[](/list-separator)\n\n")
+    fake.add_subreddit("italy")
+    fake.set_wiki("italy", "ambrogio_caffe", "[](/oggi-start)\n\n[](/ieri-start)\n[](/ieri-end)")
+    return subreddit
+
+
+QUESTIONS = 40  # questions per edition
+USERS = 300
+WEEK = 7 * 24 * 60 * 60
+START = 1_500_000_000.0
+
+
+def make_edition(index: int, seed: int = 0) -> tuple[list[dict], list[dict]]:
+    """Questions and ruote of an edition, as written in data/<week>.json by dump.py"""
+    rnd = random.Random(seed * 100_003 + index)
+    created = START + index * WEEK
+
+    def comments(name: str, letters: str, last: str, start: float) -> list[dict]:
+        bodies = [*letters, last]
+        return [
+            {
+                "body": body,
+                "name": f"t1_{name}c{i}",
+                "score": rnd.randint(1, 9),
+                "permalink": f"/r/DimmiOuija/comments/{name}/_/{name}c{i}/",
+                "created_utc": start + (i + 1) * rnd.randint(30, 900),
+                "author": f"user{rnd.randrange(USERS)}",
+            }
+            for i, body in enumerate(bodies)
+        ]
+
+    def post(name: str, answer: str, start: float) -> dict:
+        return {
+            "title": f"Domanda {name}?",
+            "url": f"https://www.reddit.com/r/DimmiOuija/comments/{name}/_/",
+            "name": f"t3_{name}",
+            "score": rnd.randint(1, 50),
+            "created_utc": start,
+            "author": f"user{rnd.randrange(USERS)}",
+            "permalink": f"/r/DimmiOuija/comments/{name}/_/",
+            "answer": answer,
+        }
+
+    questions = []
+    for i in range(QUESTIONS):
+        answer = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 14)))
+        question = post(f"e{index}q{i}", answer, created + i * 600)
+        question["comments"] = comments(f"e{index}q{i}", answer, "Goodbye", created + i * 600)
+        questions.append(question)
+    answer = "UNA FRASE MISTERIOSA"
+    ruota_post = post(f"e{index}r", answer, created)
+    ruota_post["comments"] = comments(f"e{index}r", "AEIOSR", answer, created)
+    return questions, [ruota_post]
+
+
+def make_editions(editions: int, seed: int) -> tuple[list[dict], list[dict]]:
+    """All the questions and ruote of the editions"""
+    questions, ruote = [], []
+    for index in range(editions):
+        edition_questions, edition_ruote = make_edition(index, seed)
+        questions.extend(edition_questions)
+        ruote.extend(edition_ruote)
+    return questions, ruote
+
+
+def prepare(workdir: Path) -> None:
+    """Lay out a scratch directory like the repository: templates and an empty dump"""
+    (workdir / "data").mkdir()
+    for template in ("wiki.md", "stats.md"):
+        shutil.copy(ROOT / template, workdir / template)
+    con = sqlite3.connect(workdir / "data" / "dump.sqlite3")
+    con.executescript((ROOT / "init_dump.sql").read_text(encoding="utf-8"))
+    con.close()
+
+
+class WorkdirTestCase(unittest.TestCase):
+    """A test case running in a scratch directory, removed at the end"""
+
+    def setUp(self) -> None:
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir.name)
+        self.workdir = Path(workdir.name)
+
+
+class ListingReddit:
+    """The new listing and info endpoints, counting the requests"""
+
+    def __init__(self) -> None:
+        self.submissions = []  # newest first
+        self.requests = []
+
+    def post(self, post_id: str) -> FakeSubmission:
+        submission = FakeSubmission(post_id, created_utc=time.time() - 1000 + len(self.submissions))
+        self.submissions.insert(0, submission)
+        return submission
+
+    def get(self, path: str, params: dict) -> list:
+        self.requests.append(("new", params["before"]))
+        names = [s.fullname for s in self.submissions]
+        if params["before"] not in names:
+            return []
+        return self.submissions[: names.index(params["before"])][-params["limit"] :]
+
+    def info(self, fullnames: list) -> list:
+        self.requests.append(("info", len(fullnames)))
+        return [s for s in self.submissions if s.fullname in fullnames]
+
+    def new(self) -> list:
+        self.requests.append(("full", None))
+        return list(self.submissions)
+
+
+class ReplyReddit:
+    """Replies to comments, failing with the errors set for some of them"""
+
+    def __init__(self) -> None:
+        self.replies = []
+        self.errors = {}
+
+    def comment(self, comment_id: str):
+        return SimpleNamespace(reply=lambda body: self._reply(comment_id, body))
+
+    def _reply(self, comment_id: str, body: str) -> None:
+        if comment_id in self.errors:
+            error = self.errors[comment_id]
+            if isinstance(error, Exception):
+                raise error
+            raise praw.exceptions.RedditAPIException([[error[0], error[1], None]])
+        self.replies.append(comment_id)
+
+
+class FakeModmail:
+    """Modmail conversations created and archived, failing with the errors set for some
+    recipients and the first archive_errors archives"""
+
+    def __init__(self, is_internal: bool = False) -> None:
+        self.is_internal = is_internal
+        self.created = []
+        self.archived = []
+        self.errors = {}
+        self.archive_errors = 0
+
+    def __call__(self, conversation_id: str):
+        return SimpleNamespace(id=conversation_id, archive=lambda: self._archive(conversation_id))
+
+    def create(self, recipient: str, subject: str, body: str):
+        if recipient in self.errors:
+            error = self.errors[recipient]
+            raise praw.exceptions.RedditAPIException([[error[0], error[1], "to"]])
+        self.created.append(recipient)
+        return SimpleNamespace(
+            is_internal=self.is_internal, **vars(self(f"conv{len(self.created)}"))
+        )
+
+    def _archive(self, conversation_id: str) -> None:
+        if self.archive_errors:
+            self.archive_errors -= 1
+            raise prawcore.exceptions.RequestException(OSError("reset"), (), {})
+        self.archived.append(conversation_id)
+
+
+class FakeWiki:
+    """A wiki page, counting reads and edits"""
+
+    def __init__(self, content_md: str = "") -> None:
+        self._content_md = content_md
+        self.edits = 0
+        self.reads = 0
+
+    @property
+    def content_md(self) -> str:
+        self.reads += 1
+        return self._content_md
+
+    def edit(self, content: str, reason: str = "") -> None:
+        self._content_md = content
+        self.edits += 1
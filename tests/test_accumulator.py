@@ -0,0 +1,72 @@
+import random
+import statistics
+import unittest
+
+from accumulator import Distribution, StatsAccumulator
+from tests.helpers import make_editions
+
+
+class TestDistribution(unittest.TestCase):
+    def test_same_as_statistics(self) -> None:
+        rnd = random.Random(0)
+        for size in (1, 2, 3, 10, 101):
+            for data in (
+                [rnd.randint(1, 14) for _ in range(size)],
+                [rnd.uniform(0, 3600) for _ in range(size)],
+                [rnd.choice([60, 120, 180.5]) for _ in range(size)],
+            ):
+                with self.subTest(data=data):
+                    distribution = Distribution(data)
+                    self.assertAlmostEqual(distribution.mean(), statistics.mean(data))
+                    self.assertIs(type(distribution.mean()), type(statistics.mean(data)))
+                    self.assertAlmostEqual(distribution.median(), statistics.median_grouped(data))
+                    self.assertEqual(distribution.mode(), statistics.mode(data))
+
+    def test_empty(self) -> None:
+        distribution = Distribution()
+        self.assertIsNone(distribution.summary())
+        for method in (distribution.mean, distribution.median, distribution.mode):
+            with self.assertRaises(statistics.StatisticsError):
+                method()
+
+
+class TestStatsAccumulator(unittest.TestCase):
+    def test_single_pass(self) -> None:
+        questions, ruote = make_editions(3, 0)
+        consumed = []
+
+        def stream():
+            for question in questions:
+                consumed.append(question["name"])
+                yield question
+
+        stats = StatsAccumulator().consume(stream(), iter(ruote)).stats()
+        self.assertEqual(consumed, [question["name"] for question in questions])
+        self.assertEqual(sum(stats["authors"].values()), len(questions))
+        self.assertEqual(
+            stats["open_time"],
+            sorted(
+                (
+                    (question["comments"][-1]["created_utc"] - question["created_utc"], question)
+                    for question in questions
+                ),
+                key=lambda item: item[0],
+            ),
+        )
+
+    def test_extremes(self) -> None:
+        questions, ruote = make_editions(3, 0)
+        for question in questions[::3]:
+            # ties are kept in the order of the questions
+            question["comments"][-1]["created_utc"] = question["created_utc"] + 1
+        full = StatsAccumulator().consume(questions, ruote)
+        extremes = StatsAccumulator(extremes=5).consume(questions, ruote)
+        self.assertEqual(
+            extremes.stats()["open_time"],
+            [*full.stats()["open_time"][:5], full.stats()["open_time"][-1]],
+        )
+        self.assertEqual(extremes.summaries(), full.summaries())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from benchmarks import bench_suite
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_single_edition(self) -> None:
+        for name, (_, unit) in bench_suite.BENCHMARKS.items():
+            with self.subTest(name):
+                result = bench_suite.run(name, 1, 0)
+                self.assertEqual(result["editions"], 1)
+                self.assertGreater(result[unit], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import copy
+import sys
+import unittest
+
+import grapheme
+
+import bot
+from tests.helpers import FakeRedditor, FakeSubmission, make_chain, make_thread
+
+
+class RecursivePost:
+    """The recursive browse_comments of bot.OuijaPost, before the iterative engine"""
+
+    def __init__(self, post) -> None:
+        self._post = post
+        self.author = post.author.name if post.author else None
+        self.answer_text = None
+        self.answer_permalink = None
+        self.answer_score = float("-inf")
+
+    def accept_answer(self, comment) -> bool:
+        if comment.score > self.answer_score:
+            self.answer_text = ""
+            self.answer_score = comment.score
+            self.answer_permalink = comment.permalink
+            return True
+        return False
+
+    def moderation(self, comment, parent) -> bool:
+        def delete_thread(comment) -> None:
+            replies = comment.replies
+            replies.replace_more(limit=None)
+            for reply in replies.list():
+                reply.mod.remove()
+            comment.mod.remove()
+
+        if comment.author and comment.author.name == self.author:
+            delete_thread(comment)
+            return True
+        if comment.author and comment.author.name == parent.author.name:
+            delete_thread(comment)
+            return True
+        return False
+
+    def browse_comments(self, parent) -> bool:  # noqa: C901
+        found = False
+        existing = {}
+        try:
+            comments = parent.replies
+        except AttributeError:
+            comments = parent.comments
+        for comment in comments:
+            if comment.stickied or comment.distinguished or comment.removed:
+                continue
+            if not comment.author:
+                continue
+            if self.moderation(comment, parent):
+                continue
+            body = comment.body.strip().lstrip("\\")
+            if bot.GOODBYE.match(body):
+                if existing.get("GOODBYE"):
+                    if (
+                        comment.score < existing["GOODBYE"].score
+                        or comment.created > existing["GOODBYE"].created
+                    ):
+                        comment.mod.remove()
+                        continue
+                existing["GOODBYE"] = comment
+                found = found or self.accept_answer(comment)
+            elif len(body) == 1 or grapheme.length(body) == 1:
+                if existing.get(body):
+                    if comment.created > existing[body].created and len(comment.replies) < 1:
+                        comment.mod.remove()
+                        continue
+                    if len(existing[body].replies) < 1:
+                        existing[body].mod.remove()
+                        existing[body] = comment
+                        continue
+                existing[body] = comment
+                if self.browse_comments(comment):
+                    self.answer_text = body + self.answer_text
+                    self.answer_text = self.answer_text.upper()
+                    found = True
+            else:
+                comment.mod.remove()
+        return found
+
+
+def decisions(post_class, submission) -> tuple:
+    post = post_class(submission)
+    if post_class is RecursivePost:
+        found = post.browse_comments(submission)
+    else:
+        found = post.walk()
+    return (found, post.answer_text, post.answer_score, post.answer_permalink, submission.log)
+
+
+class TestBrowseComments(unittest.TestCase):
+    def test_simple_answer(self):
+        submission = FakeSubmission("x", author=FakeRedditor("op"))
+        first = submission.add_comment(submission, "s", author=FakeRedditor("a"))
+        second = submission.add_comment(first, "\\*", author=FakeRedditor("b"))
+        submission.add_comment(second, "Goodbye", author=FakeRedditor("a"), score=5)
+        submission.add_comment(first, "long comment", author=FakeRedditor("c"))
+        submission.add_comment(submission, "x", author=FakeRedditor("op"))
+        found, text, score, _, log = decisions(bot.OuijaPost, submission)
+        self.assertTrue(found)
+        self.assertEqual(text, "S*")
+        self.assertEqual(score, 5)
+        self.assertEqual(log, [("remove", "c3"), ("remove", "c4")])
+
+    def test_same_decisions(self):
+        for seed in range(200):
+            for size, depth_bias in ((20, 0.9), (150, 0.7), (400, 0.5)):
+                expected = decisions(RecursivePost, make_thread(size, seed, depth_bias))
+                actual = decisions(bot.OuijaPost, make_thread(size, seed, depth_bias))
+                self.assertEqual(actual, expected, f"seed={seed} size={size}")
+
+    def test_lazy_more_comments(self):
+        saved = 0
+        for seed in range(100):
+            expected = decisions(RecursivePost, make_thread(300, seed))
+            submission = make_thread(300, seed)
+            submission.collapse(0.3, seed)
+            post = bot.OuijaPost(submission)
+            found = post.walk()
+            actual = (found, post.answer_text, post.answer_score, post.answer_permalink)
+            self.assertEqual(actual, expected[:4], f"seed={seed}")
+            self.assertEqual(sorted(submission.log), sorted(expected[4]), f"seed={seed}")
+            self.assertEqual(len(submission.requests), post.more_requests)
+            saved += post.more_saved
+        self.assertGreater(saved, 0)
+
+    def test_ledger(self):
+        for seed in range(50):
+            first = make_thread(300, seed)
+            first.collapse(0.3, seed)
+            post = bot.OuijaPost(first)
+            post.walk()
+            # what reddit returns once the removals are done
+            updated = make_thread(300, seed)
+            for action in first.log:
+                updated.comments_by_id["t1_" + action[1]].removed = True
+            expected = decisions(bot.OuijaPost, updated)
+            # reddit is late: the removed comments are still there on the next fetch
+            second = make_thread(300, seed)
+            second.collapse(0.3, seed)
+            again = bot.OuijaPost(second, post.state)
+            again.walk()
+            self.assertEqual(again.answer_text, expected[1], f"seed={seed}")
+            # nothing is removed twice
+            self.assertFalse(set(first.log) & set(second.log), f"seed={seed}")
+            self.assertLessEqual(set(second.log), set(expected[4]), f"seed={seed}")
+            self.assertLessEqual(len(second.requests), len(first.requests), f"seed={seed}")
+
+    def test_known_more_comments(self):
+        known = 0
+        for seed in range(50):
+            first = make_thread(300, seed)
+            first.collapse(0.3, seed)
+            post = bot.OuijaPost(first)
+            post.walk()
+            updated = []
+            for _ in range(2):
+                # a new comment under the submission, the rest is the same
+                submission = make_thread(300, seed)
+                submission.collapse(0.3, seed)
+                submission.add_comment(submission, "z", author=FakeRedditor("new"))
+                updated.append(submission)
+            expected = bot.OuijaPost(updated[0], copy.deepcopy(post.state))
+            expected.walk()
+            again = bot.OuijaPost(updated[1], post.state)
+            again.walk(skip_known=True)
+            self.assertEqual(
+                (again.answer_text, again.answer_score, again.answer_permalink),
+                (expected.answer_text, expected.answer_score, expected.answer_permalink),
+                f"seed={seed}",
+            )
+            self.assertEqual(again.state.candidates, expected.state.candidates, f"seed={seed}")
+            self.assertEqual(updated[1].log, updated[0].log, f"seed={seed}")
+            self.assertLessEqual(len(updated[1].requests), len(updated[0].requests))
+            known += len(updated[0].requests) - len(updated[1].requests)
+        self.assertGreater(known, 0)
+
+    def test_handle_comment(self):
+        submission = FakeSubmission("x", author=FakeRedditor("op"))
+        first = submission.add_comment(submission, "s", author=FakeRedditor("a"))
+        post = bot.OuijaPost(submission)
+        # the first comment from the stream walks the tree
+        self.assertFalse(post.handle_comment(first))
+        second = submission.add_comment(first, "i", author=FakeRedditor("b"))
+        self.assertFalse(post.handle_comment(second))
+        junk = submission.add_comment(second, "long comment", author=FakeRedditor("c"))
+        self.assertFalse(post.handle_comment(junk))
+        goodbye = submission.add_comment(second, "Goodbye", author=FakeRedditor("d"), score=5)
+        self.assertTrue(post.handle_comment(goodbye))
+        self.assertFalse(post.handle_comment(goodbye))
+        self.assertEqual(post.answer_text, "SI")
+        self.assertEqual(post.answer_score, 5)
+        self.assertEqual(list(post.state.candidates), [goodbye.id])
+        self.assertEqual(submission.log, [("remove", junk.id)])
+
+    def test_handle_comment_known(self):
+        def thread(seed: int) -> FakeSubmission:
+            submission = make_thread(300, seed)
+            submission.collapse(0.3, seed)
+            return submission
+
+        for seed in range(50):
+            post = bot.OuijaPost(thread(seed))
+            post.walk()
+            second = thread(seed)
+            again = bot.OuijaPost(second, post.state)
+            again.walk(skip_known=True)
+            # a letter with some replies behind a known MoreComments
+            parents = sorted(again._known_more & again._walked.keys() - {second.name})
+            if parents:
+                break
+        else:
+            self.fail("no known MoreComments under a letter")
+        comment = second.add_comment(
+            second.comments_by_id[parents[0]], "z", author=FakeRedditor("new")
+        )
+        # left to the next walk, that loads the siblings
+        self.assertFalse(again.handle_comment(comment))
+        self.assertNotIn(comment.id, again.state.seen)
+        third = thread(seed)
+        third.add_comment(
+            third.comments_by_id[parents[0]], "z", author=FakeRedditor("new"), comment_id=comment.id
+        )
+        retry = bot.OuijaPost(third, again.state)
+        retry.walk(skip_known=True)
+        self.assertIn(comment.id, retry.state.seen)
+        self.assertNotIn(parents[0], retry._known_more)
+
+    def test_deep_thread(self):
+        depth = sys.getrecursionlimit() * 2
+        post = bot.OuijaPost(make_chain(depth, "Arrivederci"))
+        self.assertTrue(post.walk())
+        self.assertEqual(len(post.answer_text), depth)
+        self.assertTrue(post.answer_text.startswith("ABCDEFGHIJ"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+import gc
+import json
+import os
+import time
+import unittest
+
+from praw.models import Comment
+
+import dump
+import snapshot
+from tests.helpers import (
+    FakeReddit,
+    FakeRedditor,
+    FakeSubmission,
+    WorkdirTestCase,
+    make_answered,
+    make_subreddit,
+    prepare,
+)
+
+
+def chain(submission: FakeSubmission, bodies: list[str]) -> list:
+    parent = submission
+    tree = []
+    for i, body in enumerate(bodies):
+        parent = submission.add_comment(parent, body, author=FakeRedditor(f"user{i}"))
+        tree.append(parent)
+    return tree
+
+
+class TestFindSolution(unittest.TestCase):
+    def test_answered(self) -> None:
+        submission = make_answered(300, 1, time.time(), "q", "CIAO")
+        tree = dump.find_solution(submission, "CIAO")
+        self.assertEqual([c.body for c in tree], ["C", "I", "A", "O", "Goodbye"])
+
+    def test_no_parent_requests(self) -> None:
+        submission = make_answered(300, 1, time.time(), "q", "CIAO")
+        calls = []
+        for comment in submission.comments_by_id.values():
+            comment.parent = lambda: calls.append(1)
+        self.assertIsNotNone(dump.find_solution(submission, "CIAO"))
+        self.assertEqual(calls, [])
+
+    def test_exact_before_deleted(self) -> None:
+        submission = FakeSubmission("q")
+        deleted = chain(submission, ["C", "[deleted]", "A", "Goodbye"])
+        exact = chain(submission, ["C", "I", "A", "Goodbye"])
+        self.assertEqual(dump.find_solution(submission, "CIA"), exact)
+        self.assertEqual(deleted[1].body, "[deleted]")
+
+    def test_deleted(self) -> None:
+        submission = FakeSubmission("q")
+        chain(submission, ["C", "X", "A", "Goodbye"])
+        tree = chain(submission, ["[deleted]", "I", "[deleted]", "Goodbye"])
+        self.assertEqual(dump.find_solution(submission, "CIA"), tree)
+        self.assertEqual([c.body for c in tree], ["C", "I", "A", "Goodbye"])
+
+    def test_not_found(self) -> None:
+        submission = FakeSubmission("q")
+        chain(submission, ["[deleted]", "[deleted]", "[deleted]", "[deleted]", "Goodbye"])
+        self.assertIsNone(dump.find_solution(submission, "CIA"))
+
+
+class DumpCase(WorkdirTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        prepare(self.workdir)
+        self.fake = FakeReddit()
+        make_subreddit(self.fake, questions=10, size=20, ruote=2)
+
+
+class TestClassify(DumpCase):
+    def test_single_listing(self) -> None:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        questions, ruote = dumper.classify()
+        self.assertEqual(self.fake.requests["listing"], 1)
+        self.assertTrue(questions)
+        self.assertEqual(len(ruote), 2)
+        self.assertTrue(all(q["answer"] for q in questions + ruote))
+        scores = [q["score"] for q in questions]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertIsNotNone(dumper.week)
+        self.assertIs(dumper.get_questions(), questions)
+        self.assertIs(dumper.get_ruota(), ruote)
+        self.assertEqual(self.fake.requests["listing"], 1)
+
+    def test_workers(self) -> None:
+        results = []
+        for workers in (1, 4):
+            fake = FakeReddit()
+            make_subreddit(fake, questions=10, size=40, ruote=2)
+            dumper = dump.Dumper("DimmiOuija", reddit=fake.reddit(), workers=workers)
+            questions, ruote = dumper.classify()
+            dumper.add_threads(questions, dumper.workers)
+            dumper.add_ruota(ruote, dumper.workers)
+            results.append([[c["name"] for c in q["comments"]] for q in questions + ruote])
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(all(results[0]))
+
+
+class CrashError(Exception):
+    pass
+
+
+class TestResume(DumpCase):
+    def dump(self, crash_after: int | None = None) -> tuple[list[dict], list[dict]]:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        questions, ruote = dumper.classify()
+        saved = []
+
+        def save(question: dict) -> None:
+            if crash_after is not None and len(saved) == crash_after:
+                raise CrashError
+            dumper.save(question, dump.QUESTION)
+            saved.append(question["name"])
+
+        dumper.add_threads(dumper.resume(questions, dump.QUESTION), on_done=save)
+        dumper.add_ruota(
+            dumper.resume(ruote, dump.RUOTA), on_done=lambda r: dumper.save(r, dump.RUOTA)
+        )
+        return questions, ruote
+
+    def test_resume(self) -> None:
+        full, full_ruote = self.dump()
+        full_requests = self.fake.requests["comments"]
+        self.assertGreaterEqual(full_requests, len(full) + len(full_ruote))
+        self.fake.requests.clear()
+        questions, ruote = self.dump()
+        # every thread is restored, none is fetched again
+        self.assertNotIn("comments", self.fake.requests)
+        self.assertEqual(questions, full)
+        self.assertTrue(all(r["comments"] for r in ruote))
+
+    def test_crash(self) -> None:
+        with self.assertRaises(CrashError):
+            self.dump(crash_after=2)
+        self.fake.requests.clear()
+        questions, _ = self.dump()
+        # the two saved questions are not fetched again
+        self.assertLess(self.fake.requests["comments"], len(questions) + 2)
+        self.assertTrue(all(q["comments"] for q in questions))
+
+    def test_changed(self) -> None:
+        questions, _ = self.dump()
+        self.fake.requests.clear()
+        self.fake.things[questions[0]["name"]].score += 1
+        self.dump()
+        self.assertEqual(self.fake.requests["comments"], 1)
+
+
+class TestStream(DumpCase):
+    def test_same_as_lists(self) -> None:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        dumper.write_records(dumper.records())
+        with open(f"data/{dumper.week}.json", encoding="utf-8") as fin:
+            streamed = json.load(fin)
+        with open(f"data/{dumper.week}-ruote.json", encoding="utf-8") as fin:
+            streamed_ruote = json.load(fin)
+        # the aggregates of the week are refreshed at the end
+        total = dumper._store._con.execute("SELECT SUM(questions) FROM user_weeks").fetchone()[0]
+        self.assertEqual(total, sum(question["author"] is not None for question in streamed))
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        dumper._store._con.execute("DELETE FROM checkpoints")
+        questions, ruote = dumper.classify()
+        dumper.add_threads(questions)
+        dumper.add_ruota(ruote)
+        self.assertEqual(streamed, questions)
+        self.assertEqual(streamed_ruote, ruote)
+
+    def test_release(self) -> None:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        alive = []
+        save = dumper.save
+
+        def counting_save(question: dict, kind: str) -> None:
+            gc.collect()
+            alive.append(sum(isinstance(o, Comment) for o in gc.get_objects()))
+            save(question, kind)
+
+        dumper.save = counting_save
+        for _ in dumper.records():
+            pass
+        # only the comments of the thread being saved are alive
+        self.assertLess(max(alive), 2 * 30)
+        self.assertGreater(len(alive), 3)
+
+
+class TestSnapshots(DumpCase):
+    def test_rederive(self) -> None:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit(), snapshots=True)
+        dumper.write_records(dumper.records())
+        week = dumper.week
+        with open(f"data/{week}.json", encoding="utf-8") as fin:
+            questions = json.load(fin)
+        with open(f"data/{week}-ruote.json", encoding="utf-8") as fin:
+            ruote = json.load(fin)
+        con = dumper._store._con
+        rows = con.execute("SELECT * FROM comments ORDER BY id").fetchall()
+        con.execute("DELETE FROM comments")
+        con.execute("DELETE FROM rcomments")
+        con.commit()
+        os.remove(f"data/{week}.json")
+        self.fake.requests.clear()
+        dump.rederive()
+        self.assertEqual(self.fake.total(), 0)
+        with open(f"data/{week}.json", encoding="utf-8") as fin:
+            self.assertEqual(json.load(fin), questions)
+        with open(f"data/{week}-ruote.json", encoding="utf-8") as fin:
+            self.assertEqual(json.load(fin), ruote)
+        self.assertEqual(con.execute("SELECT * FROM comments ORDER BY id").fetchall(), rows)
+
+    def test_resumed_threads(self) -> None:
+        # a first run without snapshots checkpoints every thread
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit())
+        records = list(dumper.records())
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit(), snapshots=True)
+        dumper.write_records(dumper.records())
+        path = snapshot.snapshot_path(dumper.week)
+        self.assertTrue(snapshot.is_complete(path))
+        self.assertEqual(
+            sorted(data["name"] for data in snapshot.load(path)),
+            sorted(record["name"] for _, record in records),
+        )
+
+    def test_incomplete(self) -> None:
+        dumper = dump.Dumper("DimmiOuija", reddit=self.fake.reddit(), snapshots=True)
+        records = dumper.records()
+        next(records)
+        records.close()
+        path = snapshot.snapshot_path(dumper.week)
+        self.assertEqual(len(snapshot.load(path)), 1)
+        self.assertFalse(snapshot.is_complete(path))
+        # a snapshot without questions
+        snapshot.Archive(snapshot.snapshot_path("2000_01")).close(complete=True)
+        before = sorted(os.listdir("data"))
+        dump.rederive()
+        self.assertEqual(sorted(os.listdir("data")), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
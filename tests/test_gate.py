@@ -0,0 +1,77 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from session import RequestGate
+from tests.helpers import FakeReddit, make_subreddit
+
+HEADERS = {"x-ratelimit-remaining": "4", "x-ratelimit-used": "596", "x-ratelimit-reset": "8"}
+
+
+class TestRequestGate(unittest.TestCase):
+    def request(self, method: str, url: str, **kwargs) -> SimpleNamespace:
+        self.requests.append((method, url, kwargs))
+        return SimpleNamespace(headers=HEADERS)
+
+    def setUp(self) -> None:
+        self.requests = []
+        self.gate = RequestGate()
+
+    def test_call_signatures(self) -> None:
+        with mock.patch("session.time.sleep"):
+            # prawcore 2: positional
+            self.gate.call(self.request, lambda: {"h": "1"}, "GET", "/a", timeout=5)
+            # later versions: keywords only
+            self.gate.call(
+                method="POST",
+                request_function=self.request,
+                set_header_callback=lambda: {"h": "2"},
+                url="/b",
+                timeout=5,
+            )
+        self.assertEqual(
+            self.requests,
+            [
+                ("GET", "/a", {"timeout": 5, "headers": {"h": "1"}}),
+                ("POST", "/b", {"timeout": 5, "headers": {"h": "2"}}),
+            ],
+        )
+        self.assertEqual(self.gate.remaining, 4)
+
+    def test_slots(self) -> None:
+        self.gate.update(HEADERS)
+        sleeps = []
+        lock = threading.Lock()
+
+        def sleep(seconds: float) -> None:
+            with lock:
+                sleeps.append(seconds)
+
+        with mock.patch("session.time.sleep", sleep):
+            threads = [threading.Thread(target=self.gate.delay) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # every thread gets its own slot, the 4 requests left are spread until the reset
+        sleeps.sort()
+        self.assertEqual(len(sleeps), 4)
+        for before, after in zip(sleeps, sleeps[1:], strict=False):
+            self.assertGreater(after - before, 0.5)
+        self.assertLessEqual(sleeps[-1], 8)
+        self.assertIsInstance(self.gate._next_slot_ns, int)
+
+    def test_install(self) -> None:
+        fake = FakeReddit()
+        make_subreddit(fake, questions=1, size=5)
+        reddit = fake.reddit()
+        gate = RequestGate.install(reddit)
+        self.assertIs(RequestGate.install(reddit), gate)
+        self.assertIs(reddit._core._rate_limiter, gate)
+        next(iter(reddit.subreddit("DimmiOuija").new(limit=1)))
+        self.assertTrue(fake.total())
+
+
+if __name__ == "__main__":
+    unittest.main()
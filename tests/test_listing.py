@@ -0,0 +1,94 @@
+import unittest
+
+from state import ListingCursor, StateStore
+from tests.helpers import FakeSubreddit, ListingReddit
+
+
+class TestListingCursor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.reddit = ListingReddit()
+        self.listing = ListingCursor(
+            StateStore(":memory:"),
+            self.reddit,
+            FakeSubreddit("DimmiOuija"),
+            "unanswered",
+            24 * 60 * 60,
+            self.reddit.new,
+        )
+
+    def test_incremental(self) -> None:
+        old = self.reddit.post("a")
+        self.reddit.post("b")
+        self.assertEqual([s.id for s in self.listing.fetch()], ["b", "a"])
+        self.listing.keep([old])
+        self.reddit.post("c")
+        self.reddit.requests.clear()
+        self.assertEqual([s.id for s in self.listing.fetch()], ["c", "a"])
+        self.assertEqual(self.reddit.requests, [("new", "t3_b"), ("info", 1)])
+
+    def test_deleted_cursor(self) -> None:
+        self.reddit.post("a")
+        self.listing.fetch()
+        self.listing.keep([])
+        self.reddit.submissions[0].author = None
+        self.reddit.post("b")
+        self.reddit.submissions.pop(1)
+        self.reddit.requests.clear()
+        self.assertEqual([s.id for s in self.listing.fetch()], ["b"])
+        self.assertEqual(self.reddit.requests, [("new", "t3_a"), ("info", 1), ("full", None)])
+
+    def test_keep_old(self) -> None:
+        for keep_old in (0, 1):
+            with self.subTest(keep_old=keep_old):
+                reddit = ListingReddit()
+                listing = ListingCursor(
+                    StateStore(":memory:"),
+                    reddit,
+                    FakeSubreddit("DimmiOuija"),
+                    "unanswered",
+                    24 * 60 * 60,
+                    # like new(limit=1)
+                    lambda reddit=reddit: reddit.new()[:1],
+                    keep_old=keep_old,
+                )
+                old = reddit.post("a")
+                listing.fetch()
+                listing.keep([old])
+                # still open two days later
+                old.created_utc -= 2 * 24 * 60 * 60
+                reddit.post("b")
+                expected = ["b", "a"] if keep_old else ["b"]
+                self.assertEqual([s.id for s in listing.fetch()], expected)
+                listing.keep([old])
+                # no new posts for a while: the cursor expires, the full listing is used
+                reddit.submissions[0].created_utc -= 2 * 24 * 60 * 60
+                expected = ["a"] if keep_old else []
+                self.assertEqual([s.id for s in listing.fetch()], expected)
+                self.assertEqual(reddit.requests[-1], ("info", 1) if keep_old else ("full", None))
+
+    def test_keep_old_limit(self) -> None:
+        listing = ListingCursor(
+            StateStore(":memory:"),
+            self.reddit,
+            FakeSubreddit("DimmiOuija"),
+            "unanswered",
+            24 * 60 * 60,
+            self.reddit.new,
+            keep_old=2,
+        )
+        posts = [self.reddit.post(post_id) for post_id in "abc"]
+        listing.fetch()
+        # still open two days later
+        for post in posts:
+            post.created_utc -= 2 * 24 * 60 * 60
+        listing.keep(posts)
+        self.reddit.post("d")
+        # only the newest old posts are still followed
+        submissions = listing.fetch()
+        self.assertEqual([s.id for s in submissions], ["d", "c", "b"])
+        listing.keep(submissions)
+        self.assertEqual([s.id for s in listing.fetch()], ["d", "c", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import json
+import unittest
+
+import bot
+from session import RequestMeter, endpoint
+from tests.helpers import FakeReddit, WorkdirTestCase, make_subreddit
+
+
+class TestRequestMeter(WorkdirTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.fake = FakeReddit()
+        make_subreddit(self.fake, questions=4, size=30, pmlist=3, notify=3)
+
+    def test_endpoint(self) -> None:
+        oauth = "https://oauth.reddit.com"
+        self.assertEqual(endpoint("GET", f"{oauth}/r/DimmiOuija/new"), "listing")
+        self.assertEqual(endpoint("GET", f"{oauth}/comments/abc/_/def"), "comments")
+        self.assertEqual(endpoint("GET", f"{oauth}/r/DimmiOuija/wiki/pmlist"), "wiki")
+        self.assertEqual(endpoint("POST", f"{oauth}/r/DimmiOuija/api/wiki/edit"), "wiki_edit")
+        self.assertEqual(endpoint("POST", f"{oauth}/api/mod/conversations"), "modmail")
+        self.assertEqual(endpoint("GET", f"{oauth}/api/unknown"), "GET api")
+
+    def test_check(self) -> None:
+        reddit = self.fake.reddit()
+        ouija = bot.Ouija("DimmiOuija", reddit=reddit)
+        self.assertIs(RequestMeter.install(reddit), ouija.meter)
+        ouija.check_submission()
+        report = ouija.meter.write("check", log="requests.jsonl", textfile_dir="metrics")
+        self.assertEqual(report["requests"], self.fake.total())
+        for name in self.fake.requests.keys() & report["endpoints"].keys():
+            self.assertEqual(report["endpoints"][name]["requests"], self.fake.requests[name])
+        self.assertIsNotNone(report["ratelimit_remaining"])
+        with open("requests.jsonl", encoding="utf-8") as fin:
+            self.assertEqual(json.loads(fin.readline())["requests"], report["requests"])
+        with open("metrics/check.prom", encoding="utf-8") as fin:
+            textfile = fin.read()
+        self.assertIn('dimmiouija_requests_total{action="check",endpoint="listing"} 1', textfile)
+        self.assertIn('endpoint="comments",le="+Inf"}', textfile)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import prawcore
+
+import bot
+from session import RequestGate
+from tests.helpers import (
+    FakeReddit,
+    FakeRedditor,
+    FakeSubmission,
+    FakeSubreddit,
+    WorkdirTestCase,
+    make_subreddit,
+)
+
+
+class TestOffline(WorkdirTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.fake = FakeReddit()
+        make_subreddit(self.fake, questions=6, size=40, pmlist=5, notify=5)
+
+    def test_check_twice(self) -> None:
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        ouija.check_submission()
+        first = dict(self.fake.requests)
+        self.assertEqual(first["listing"], 1)
+        self.assertGreater(first["comments"], 0)
+        self.fake.requests.clear()
+        ouija.check_submission()
+        # nothing new: the cursor and the state spare the full listing and the threads
+        self.assertNotIn("remove", self.fake.requests)
+        self.assertLess(self.fake.total(), sum(first.values()))
+        # the unchanged threads are not fetched again
+        self.assertNotIn("comments", self.fake.requests)
+        self.assertNotIn("morechildren", self.fake.requests)
+
+    def test_stale_votes(self) -> None:
+        submission = FakeSubmission(
+            "votes",
+            author=FakeRedditor("op"),
+            created_utc=time.time(),
+            subreddit=FakeSubreddit("DimmiOuija"),
+        )
+        first = submission.add_comment(submission, "s", author=FakeRedditor("a"))
+        second = submission.add_comment(submission, "n", author=FakeRedditor("b"))
+        submission.add_comment(first, "Goodbye", author=FakeRedditor("c"), score=2)
+        other = submission.add_comment(second, "Goodbye", author=FakeRedditor("d"), score=1)
+        self.fake.add_submission(submission)
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        ouija.check_submission()
+        # both goodbyes are under the score limit
+        self.assertEqual(submission.link_flair_text, bot.UNANSWERED["text"])
+        other.score = 10
+        self.fake.requests.clear()
+        ouija.check_submission()
+        # the tree is unchanged, but the votes moved to the other goodbye
+        self.assertNotIn("comments", self.fake.requests)
+        self.assertEqual(submission.link_flair_text, bot.ANSWERED["text"] + "N")
+
+    def walked(self, ouija: bot.Ouija, submission: FakeSubmission) -> tuple:
+        """The answer of a full walk of the submission, on a copy of the state"""
+        state = ouija.state.load_post(submission.id)
+        state.invalidate()
+        listing = self.fake.reddit().subreddit("DimmiOuija").new()
+        post = bot.OuijaPost(next(s for s in listing if s.id == submission.id), state)
+        post.process()
+        return post.answer_id, post.answer_text
+
+    def test_refresh_like_walk(self) -> None:
+        submission = FakeSubmission(
+            "sibling",
+            author=FakeRedditor("op"),
+            created_utc=time.time(),
+            subreddit=FakeSubreddit("DimmiOuija"),
+        )
+        first = submission.add_comment(submission, "x", author=FakeRedditor("a"))
+        second = submission.add_comment(first, "y", author=FakeRedditor("b"))
+        submission.add_comment(second, "Goodbye", author=FakeRedditor("c"), score=2)
+        # a sibling of a branch with an answer is never accepted by the walk
+        submission.add_comment(first, "Goodbye", author=FakeRedditor("d"), score=10)
+        self.fake.add_submission(submission)
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        ouija.check_submission()
+        walked = self.walked(ouija, submission)
+        self.assertEqual(walked[1], "XY")
+        self.fake.requests.clear()
+        ouija.check_submission()
+        self.assertNotIn("comments", self.fake.requests)
+        state = ouija.state.load_post(submission.id)
+        self.assertEqual((state.answer_id, state.answer_text), walked)
+        self.assertEqual(submission.link_flair_text, bot.UNANSWERED["text"])
+
+    def test_refresh_deleted_letter(self) -> None:
+        submission = FakeSubmission(
+            "deleted",
+            author=FakeRedditor("op"),
+            created_utc=time.time(),
+            subreddit=FakeSubreddit("DimmiOuija"),
+        )
+        first = submission.add_comment(submission, "x", author=FakeRedditor("a"))
+        second = submission.add_comment(first, "y", author=FakeRedditor("b"))
+        goodbye = submission.add_comment(second, "Goodbye", author=FakeRedditor("c"), score=2)
+        self.fake.add_submission(submission)
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        ouija.check_submission()
+        self.assertEqual(ouija.state.load_post(submission.id).answer_text, "XY")
+        second.author = None
+        goodbye.score = 10
+        self.fake.requests.clear()
+        ouija.check_submission()
+        # the letter is gone: the tree is walked again, there is no answer left
+        self.assertIn("comments", self.fake.requests)
+        self.assertIsNone(ouija.state.load_post(submission.id).answer_text)
+        self.assertEqual(submission.link_flair_text, bot.UNANSWERED["text"])
+
+    def test_daemon_retry(self) -> None:
+        class StopError(Exception):
+            pass
+
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        streams = []
+
+        def comments(**kwargs):
+            streams.append(kwargs)
+            if len(streams) == 1:
+                raise prawcore.exceptions.ServerError(
+                    SimpleNamespace(status_code=503, headers={}, text="")
+                )
+            yield None
+            raise StopError
+
+        checks = []
+        check_submission = ouija.check_submission
+        ouija.check_submission = lambda: checks.append(1) or check_submission()
+        with (
+            mock.patch.object(ouija.subreddit.stream, "comments", comments),
+            mock.patch("bot.time.sleep") as sleep,
+            self.assertRaises(StopError),
+        ):
+            ouija.daemon()
+        # the stream is made again, the comments missed meanwhile are checked
+        sleep.assert_called_once_with(bot.DAEMON_BACKOFF)
+        self.assertEqual(len(streams), 2)
+        self.assertEqual(len(checks), 2)
+
+    def test_flair_reset(self) -> None:
+        submission = FakeSubmission(
+            "reset",
+            author=FakeRedditor("op"),
+            created_utc=time.time(),
+            subreddit=FakeSubreddit("DimmiOuija"),
+        )
+        letter = submission.add_comment(submission, "s", author=FakeRedditor("a"))
+        submission.add_comment(letter, "Goodbye", author=FakeRedditor("b"), score=10)
+        self.fake.add_submission(submission)
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        ouija.check_submission()
+        self.assertEqual(submission.link_flair_text, bot.ANSWERED["text"] + "S")
+        modmail = list(self.fake.modmail)
+        # a moderator opens the question again
+        submission.link_flair_text = submission.link_flair_css_class = None
+        ouija.check_submission()
+        self.assertEqual(submission.link_flair_text, bot.ANSWERED["text"] + "S")
+        # the author was already told
+        self.assertEqual(self.fake.modmail, modmail)
+
+    def test_workers_gate(self) -> None:
+        # praw rate limiter, unless the bot runs with more workers
+        ouija = bot.Ouija("DimmiOuija", reddit=self.fake.reddit())
+        self.assertEqual(ouija.outbox.workers, 1)
+        self.assertNotIsInstance(ouija._reddit._core._rate_limiter, RequestGate)
+        ouija.check_submission()
+        self.assertTrue(self.fake.modmail)
+        ouija = bot.Ouija("DimmiOuija", workers=2, reddit=self.fake.reddit())
+        self.assertEqual(ouija.outbox.workers, 2)
+        self.assertIsInstance(ouija._reddit._core._rate_limiter, RequestGate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import time
+import unittest
+from types import SimpleNamespace
+
+import prawcore
+
+from outbox import Outbox
+from state import NOTIFY_FAILED, NOTIFY_PENDING, NOTIFY_SENT, StateStore
+from tests.helpers import FakeModmail, ReplyReddit
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self) -> None:
+        self.reddit = ReplyReddit()
+        self.state = StateStore(":memory:")
+        self.modmail = FakeModmail()
+        self.outbox = Outbox(
+            self.reddit, SimpleNamespace(modmail=self.modmail), self.state, workers=1
+        )
+
+    def statuses(self) -> dict:
+        return dict(self.state._con.execute("SELECT target, status FROM outbox"))
+
+    def test_deliver(self) -> None:
+        for i in range(20):
+            self.assertTrue(self.outbox.reply(f"t1_c{i}", "Ciao"))
+        self.assertFalse(self.outbox.reply("t1_c0", "Ciao"))
+        self.assertEqual(self.outbox.deliver(), 20)
+        self.assertEqual(sorted(self.reddit.replies), sorted(f"c{i}" for i in range(20)))
+        self.assertEqual(self.outbox.deliver(), 0)
+
+    def test_ratelimit(self) -> None:
+        self.reddit.errors = {
+            "c0": ("RATELIMIT", "Take a break for 2 minutes before trying again."),
+            "c1": ("DELETED_COMMENT", "deleted"),
+        }
+        self.outbox.reply("t1_c0", "Ciao")
+        self.outbox.reply("t1_c1", "Ciao")
+        self.outbox.reply("t1_c2", "Ciao")
+        self.assertEqual(self.outbox.deliver(), 0)
+        # the workers stop until the delay asked by reddit
+        self.assertEqual(set(self.statuses().values()), {NOTIFY_PENDING})
+        self.assertEqual(self.reddit.replies, [])
+        del self.reddit.errors["c0"]
+        self.assertEqual(self.outbox.deliver(), 0)
+        self.outbox._pause_until = 0
+        self.state._con.execute("UPDATE outbox SET next_utc = 0")
+        self.assertEqual(self.outbox.deliver(), 2)
+        self.assertEqual(
+            self.statuses(),
+            {"t1_c0": NOTIFY_SENT, "t1_c1": NOTIFY_FAILED, "t1_c2": NOTIFY_SENT},
+        )
+
+    def test_response_errors(self) -> None:
+        def response(status_code: int, **headers: str) -> SimpleNamespace:
+            return SimpleNamespace(status_code=status_code, headers=headers, text="")
+
+        self.reddit.errors = {
+            "c0": prawcore.exceptions.Forbidden(response(403)),
+            "c1": ValueError("unexpected"),
+            "c3": prawcore.exceptions.TooManyRequests(response(429, **{"retry-after": "60"})),
+        }
+        for i in range(5):
+            self.outbox.reply(f"t1_c{i}", "Ciao")
+        self.assertEqual(self.outbox.deliver(), 1)
+        # every send is marked, the 429 pauses the workers
+        self.assertEqual(
+            self.statuses(),
+            {
+                "t1_c0": NOTIFY_FAILED,
+                "t1_c1": NOTIFY_PENDING,
+                "t1_c2": NOTIFY_SENT,
+                "t1_c3": NOTIFY_PENDING,
+                "t1_c4": NOTIFY_PENDING,
+            },
+        )
+        self.assertGreater(self.outbox._pause_until, time.time() + 50)
+        self.assertEqual(self.reddit.replies, ["c2"])
+
+    def test_archive_retry(self) -> None:
+        self.modmail.archive_errors = 1
+        self.outbox.modmail("user", "Risposta", "Ciao", "answer:x")
+        self.assertEqual(self.outbox.deliver(), 1)
+        # the modmail is sent once, only the archive is pending
+        self.assertEqual(self.statuses(), {"user": NOTIFY_SENT, "conv1": NOTIFY_PENDING})
+        self.assertEqual(self.outbox.deliver(), 1)
+        self.assertEqual(self.modmail.created, ["user"])
+        self.assertEqual(self.modmail.archived, ["conv1"])
+        self.assertEqual(set(self.statuses().values()), {NOTIFY_SENT})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from types import SimpleNamespace
+
+import bot
+from state import PM_MISSING, PM_RETRY, PM_SENT, StateStore
+from tests.helpers import FakeModmail, FakeWiki
+
+
+class TestPMList(unittest.TestCase):
+    def setUp(self) -> None:
+        self.wiki = {"pmlist": FakeWiki("a\n\nb\\_b\n\nc\n\nd"), "pmlist_todo": FakeWiki()}
+        self.subreddit = SimpleNamespace(
+            wiki=self.wiki, modmail=FakeModmail(is_internal=True), message=lambda *args: None
+        )
+        self.reddit = SimpleNamespace(auth=SimpleNamespace(limits={"remaining": 100}))
+        self.state = StateStore(":memory:")
+        self.pmlist = bot.PMList(self.reddit, self.subreddit, self.state, batch=2)
+        self.pmlist.start()
+
+    def test_batches(self) -> None:
+        self.assertEqual(self.pmlist.send_next(), 2)
+        self.assertEqual(self.subreddit.modmail.created, ["a", "b_b"])
+        # no checkpoint until the queue is drained
+        self.assertEqual(self.wiki["pmlist_todo"].edits, 1)
+        self.assertEqual(self.pmlist.send_next(), 2)
+        self.assertEqual(self.wiki["pmlist_todo"].edits, 2)
+        self.assertEqual(self.wiki["pmlist_todo"].content_md, "")
+
+    def test_status(self) -> None:
+        self.subreddit.modmail.errors = {
+            "a": ("USER_DOESNT_EXIST", "no"),
+            "b_b": ("RATELIMIT", "Take a break for 3 minutes before trying again."),
+        }
+        self.assertEqual(self.pmlist.send_next(limit=4), 0)
+        statuses = dict(self.state._con.execute("SELECT user, status FROM pmlist"))
+        self.assertEqual(statuses["a"], PM_MISSING)
+        self.assertEqual(statuses["b_b"], PM_RETRY)
+        self.assertEqual(self.state.pending_pm(0), ["c", "d"])
+        self.subreddit.modmail.errors = {}
+        self.pmlist.send_next(limit=4)
+        statuses = dict(self.state._con.execute("SELECT user, status FROM pmlist"))
+        self.assertEqual(statuses["c"], PM_SENT)
+        self.pmlist.checkpoint(force=True)
+        self.assertEqual(self.wiki["pmlist_todo"].content_md, "b_b")
+
+    def test_empty_queue(self) -> None:
+        pmlist = bot.PMList(self.reddit, self.subreddit, StateStore(":memory:"))
+        self.wiki["pmlist_todo"].edit("")
+        for _ in range(3):
+            self.assertEqual(pmlist.send_next(), 0)
+        # the empty queue is read from the wiki only once
+        self.assertEqual(self.wiki["pmlist_todo"].reads, 1)
+
+    def test_rate_budget(self) -> None:
+        self.reddit.auth.limits["remaining"] = bot.PM_RESERVE
+        self.assertEqual(self.pmlist.send_next(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import unittest
+from collections import Counter
+
+import ranking
+import summary
+from tests.helpers import make_editions
+
+
+def sorted_top_counter(count: Counter, size: int) -> list:
+    """summary.top_counter before ranking"""
+    if not count:
+        return []
+    sorted_values = sorted(count.values(), reverse=True)
+    while True:
+        try:
+            value_limit = sorted_values[size]
+            break
+        except IndexError:
+            size -= 1
+    real_size = len([value for value in sorted_values if value >= value_limit])
+    return count.most_common(real_size)
+
+
+def sorted_top_answer(questions: list, size: int) -> list:
+    """summary.top_answer before ranking"""
+    solutions = sorted(questions, key=lambda item: len(item["answer"]), reverse=True)
+    limit = len(solutions[size]["answer"])
+    return [solution for solution in solutions if len(solution["answer"]) >= limit]
+
+
+def sorted_bottom_answer(questions: list) -> list:
+    """summary.bottom_answer before ranking"""
+    solutions = sorted(questions, key=lambda item: len(item["answer"]))
+    limit = len(solutions[0]["answer"])
+    return [solution for solution in solutions if len(solution["answer"]) == limit]
+
+
+class TestRanking(unittest.TestCase):
+    def test_ties(self) -> None:
+        items = [("a", 3), ("b", 5), ("c", 3), ("d", 1), ("e", 5), ("f", 1)]
+        value = lambda item: item[1]  # noqa: E731
+        self.assertEqual(ranking.top(items, 1, value), [("b", 5), ("e", 5)])
+        self.assertEqual(ranking.top(items, 3, value), [("b", 5), ("e", 5), ("a", 3), ("c", 3)])
+        self.assertEqual(ranking.bottom(items, 1, value), [("d", 1), ("f", 1)])
+        self.assertEqual(ranking.top(items, 10, value), sorted(items, key=value, reverse=True))
+        self.assertEqual(ranking.top([], 3, value), [])
+        self.assertEqual(ranking.bottom(items, 0, value), [])
+
+    def test_same_as_sorted(self) -> None:
+        rnd = random.Random(0)
+        for users in (1, 2, 5, 50, 2000):
+            count = Counter({f"user{i}": rnd.randint(1, 6) for i in range(users)})
+            for size in (0, 1, 3, 4, 9):
+                with self.subTest(users=users, size=size):
+                    self.assertEqual(
+                        summary.top_counter(count, size), sorted_top_counter(count, size)
+                    )
+        self.assertEqual(summary.top_counter(Counter(), 4), [])
+
+    def test_bottom_counter(self) -> None:
+        count = Counter({"a": 2, "b": 1, "c": 4, "d": 1})
+        self.assertEqual(summary.bottom_counter(count), [("b", 1), ("d", 1)])
+
+    def test_answers(self) -> None:
+        questions, _ = make_editions(5, 0)
+        for size in (0, 1, 4, 10):
+            with self.subTest(size=size):
+                self.assertEqual(
+                    summary.top_answer(questions, size), sorted_top_answer(questions, size)
+                )
+        self.assertEqual(summary.bottom_answer(questions), sorted_bottom_answer(questions))
+        # fewer questions than size: all of them, instead of an IndexError
+        self.assertEqual(len(summary.top_answer(questions[:3], 4)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import unittest
+from pathlib import Path
+
+import summary
+from sqlstats import StatsEngine
+from storage import DumpStore
+from tests.helpers import ROOT, WorkdirTestCase, make_edition
+
+
+class TestStatsEngine(WorkdirTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        Path("data").mkdir()
+        self.store = DumpStore()
+        self.editions = []
+        for index in range(3):
+            questions, ruote = make_edition(index)
+            week = f"2017_0{index}"
+            self.store.insert("questions", "comments", questions, week)
+            self.store.insert("ruote", "rcomments", ruote, week)
+            self.editions.append((questions, ruote))
+        self.store.commit()
+        self.addCleanup(self.store.close)
+
+    def assert_same_stats(self, questions, ruote, first=None, last=None) -> None:
+        expected = summary.Summarizer.make_stats(questions, ruote)
+        sql_questions, sql_ruote, stats = StatsEngine(self.store).make_stats(first, last)
+        self.assertEqual(len(sql_questions), len(questions))
+        self.assertEqual(len(sql_ruote), len(ruote))
+        for key in ("authors", "solvers", "goodbyers", "chars", "ruote_solvers"):
+            self.assertEqual(stats[key], expected[key], key)
+        for key in ("open_time", "ruote_open_time"):
+            self.assertEqual(
+                sorted((int(time), post["name"]) for time, post in stats[key]),
+                sorted((int(time), post["name"]) for time, post in expected[key]),
+                key,
+            )
+
+    def test_all(self) -> None:
+        questions = [q for edition, _ in self.editions for q in edition]
+        ruote = [r for _, edition in self.editions for r in edition]
+        self.assert_same_stats(questions, ruote)
+
+    def test_period(self) -> None:
+        questions, ruote = self.editions[1]
+        self.assert_same_stats(questions, ruote, "2017_01", "2017_01")
+
+    def test_variables(self) -> None:
+        questions, ruote = self.editions[0]
+        expected = summary.stats_variables(
+            questions, ruote, summary.Summarizer.make_stats(questions, ruote)
+        )
+        variables = summary.stats_variables(
+            *StatsEngine(self.store).make_stats("2017_00", "2017_00")
+        )
+        for key in ("mediums", "charlenght", "size", "solver"):
+            self.assertEqual(variables[key], expected[key], key)
+
+    def test_period_stats(self) -> None:
+        shutil.copy(ROOT / "stats.md", "stats.md")
+        self.assertEqual(summary.period_stats("2017_01", None), "2017_01-oggi")
+        text = Path("data/2017_01-oggi_stats.md").read_text(encoding="utf-8")
+        self.assertIn("Gli spiriti hanno risposto a 80 domande.", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
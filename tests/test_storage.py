@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import summary
+from storage import MIGRATIONS, STATS_INDEXES, DumpStore
+from tests.helpers import WorkdirTestCase, make_edition
+
+
+class TestDumpStore(WorkdirTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        Path("data").mkdir()
+
+    def test_migrate_init_dump(self) -> None:
+        con = sqlite3.connect("data/dump.sqlite3")
+        con.executescript(MIGRATIONS[0].read_text(encoding="utf-8"))
+        con.execute("INSERT INTO questions(id, week) VALUES ('t3_a', '2024_05')")
+        con.execute("INSERT INTO comments(id, parent_id, body) VALUES ('t1_b', 't3_a', 'X')")
+        con.commit()
+        con.close()
+        store = DumpStore()
+        self.assertEqual(store.version, len(MIGRATIONS))
+        self.assertEqual(store._con.execute("SELECT week FROM questions").fetchall(), [(202405,)])
+        self.assertEqual(store._con.execute("SELECT body FROM comments").fetchall(), [("X",)])
+        sql = store._con.execute("SELECT sql FROM sqlite_master WHERE name = 'comments'")
+        self.assertIn("WITHOUT ROWID", sql.fetchone()[0])
+        self.assertEqual(store._con.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        store.close()
+        # nothing to do the second time
+        self.assertEqual(DumpStore().version, len(MIGRATIONS))
+
+    def test_upsert(self) -> None:
+        store = DumpStore()
+        questions, _ = make_edition(0)
+        rows = store.insert("questions", "comments", questions, "2017_00")
+        store.commit()
+        self.assertEqual(rows, len(questions) + sum(len(q["comments"]) for q in questions))
+        questions[0]["score"] = 1000
+        store.insert("questions", "comments", questions, "2017_00")
+        store.commit()
+        count = store._con.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        self.assertEqual(count, len(questions))
+        score = store._con.execute(
+            "SELECT score FROM questions WHERE id = ?", (questions[0]["name"],)
+        ).fetchone()[0]
+        self.assertEqual(score, 1000)
+
+    def aggregates(self, store: DumpStore) -> tuple[list, list]:
+        return (
+            store._con.execute("SELECT * FROM user_weeks ORDER BY week, author").fetchall(),
+            store._con.execute("SELECT * FROM letter_weeks ORDER BY week, letter").fetchall(),
+        )
+
+    def test_aggregates(self) -> None:
+        store = DumpStore()
+        questions, ruote = make_edition(0)
+        with mock.patch.object(store, "refresh", wraps=store.refresh) as refresh:
+            store.save("questions", "comments", questions[0], "2017_00", ("question", 1, 1, "{}"))
+            store.insert("questions", "comments", questions[1:], "2017_00")
+            store.insert("ruote", "rcomments", ruote, "2017_00")
+            self.assertEqual(self.aggregates(store), ([], []))
+            store.commit()
+        # once per week, not once per save
+        refresh.assert_called_once_with(201700, 201700)
+        rows = {row[1]: row[2:] for row in self.aggregates(store)[0]}
+        stats = summary.Summarizer.make_stats(questions, ruote)
+        for column, key in enumerate(("authors", "solvers", "goodbyers", "ruote_solvers")):
+            self.assertEqual(
+                {author: row[column] for author, row in rows.items() if row[column]},
+                dict(stats[key]),
+                key,
+            )
+        letters = self.aggregates(store)[1]
+        self.assertEqual({letter: count for _, letter, count in letters}, dict(stats["chars"]))
+        # a new chain of the same question replaces its counts
+        questions[0]["comments"] = questions[0]["comments"][-2:]
+        store.save("questions", "comments", questions[0], "2017_00", ("question", 1, 1, "{}"))
+        store.commit()
+        saved = self.aggregates(store)
+        with store._con:
+            store._con.execute("DELETE FROM user_weeks")
+            store._con.execute("UPDATE letter_weeks SET count = 0")
+        store.rebuild()
+        self.assertEqual(self.aggregates(store), saved)
+        self.assertEqual(
+            sum(row[3] for row in saved[0]),
+            sum(len(q["comments"]) - 1 for q in questions),
+        )
+
+    def test_migrate_positions(self) -> None:
+        con = sqlite3.connect("data/dump.sqlite3")
+        for number, migration in enumerate(MIGRATIONS[: MIGRATIONS.index(STATS_INDEXES) + 1], 1):
+            script = migration.read_text(encoding="utf-8") if number == 1 else migration
+            con.executescript(f"BEGIN;\n{script};\nPRAGMA user_version = {number};\nCOMMIT;")
+        questions, ruote = make_edition(0)
+        _, checkpointed = make_edition(1)
+        # same time for the whole chain, a solution older than its letters
+        for comment in questions[0]["comments"]:
+            comment["created_utc"] = questions[0]["created_utc"]
+        ruote[0]["comments"][-1]["created_utc"] = ruote[0]["created_utc"]
+        ruote[0]["comments"][-1]["author"] = "solver"
+        # only the checkpoint knows the order
+        checkpointed[0]["comments"][-1].update(body="X", author="checkpointed")
+        ruote.extend(checkpointed)
+        for table, ctable, posts in (
+            ("questions", "comments", questions),
+            ("ruote", "rcomments", ruote),
+        ):
+            for post in posts:
+                con.execute(
+                    f"INSERT INTO {table}(id, created_utc, author, week) VALUES (?, ?, ?, 201700)",
+                    (post["name"], post["created_utc"], post["author"]),
+                )
+                con.executemany(
+                    f"INSERT INTO {ctable}(id, parent_id, body, created_utc, author) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (c["name"], post["name"], c["body"], c["created_utc"], c["author"])
+                        for c in post["comments"]
+                    ],
+                )
+        con.execute(
+            "INSERT INTO checkpoints(id, kind, week, record) VALUES (?, 'ruota', 201700, ?)",
+            (checkpointed[0]["name"], json.dumps(checkpointed[0])),
+        )
+        con.commit()
+        con.close()
+        store = DumpStore()
+        for ctable in ("comments", "rcomments"):
+            nulls = f"SELECT COUNT(*) FROM {ctable} WHERE position IS NULL"
+            self.assertEqual(store._con.execute(nulls).fetchone()[0], 0)
+        rows = {row[1]: row[2:] for row in self.aggregates(store)[0]}
+        stats = summary.Summarizer.make_stats(questions, ruote)
+        for column, key in enumerate(("authors", "solvers", "goodbyers", "ruote_solvers")):
+            self.assertEqual(
+                {author: row[column] for author, row in rows.items() if row[column]},
+                dict(stats[key]),
+                key,
+            )
+        self.assertEqual(stats["ruote_solvers"]["solver"], 1)
+        self.assertEqual(stats["ruote_solvers"]["checkpointed"], 1)
+
+    def write_editions(self, editions: int) -> None:
+        for index in range(editions):
+            questions, ruote = make_edition(index)
+            with open(f"data/2017_0{index}.json", "w", encoding="utf-8") as fout:
+                json.dump(questions, fout)
+            with open(f"data/2017_0{index}-ruote.json", "w", encoding="utf-8") as fout:
+                json.dump(ruote, fout)
+
+    def test_sql_all(self) -> None:
+        self.write_editions(3)
+        Path("data/2017_03.json").write_text("[{", encoding="utf-8")
+        summary.sql_all(workers=2)
+        con = sqlite3.connect("data/dump.sqlite3")
+        weeks = con.execute("SELECT week, COUNT(*) FROM questions GROUP BY week").fetchall()
+        self.assertEqual(weeks, [(201700, 40), (201701, 40), (201702, 40)])
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM ruote").fetchone()[0], 3)
+        # the invalid file is not in the manifest, it will be read again
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM imports").fetchone()[0], 6)
+
+    def test_sql_all_changed_chain(self) -> None:
+        self.write_editions(1)
+        summary.sql_all(workers=1)
+        questions = json.loads(Path("data/2017_00.json").read_text(encoding="utf-8"))
+        ruote = json.loads(Path("data/2017_00-ruote.json").read_text(encoding="utf-8"))
+        # a shorter chain, with another goodbye
+        goodbye = {**questions[1]["comments"][-1], "name": "t1_other"}
+        questions[0]["comments"] = [questions[0]["comments"][0], goodbye]
+        Path("data/2017_00.json").write_text(json.dumps(questions), encoding="utf-8")
+        summary.sql_all(workers=1)
+        store = DumpStore()
+        count = store._con.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+        self.assertEqual(count, sum(len(q["comments"]) for q in questions))
+        rows = {row[1]: row[2:] for row in self.aggregates(store)[0]}
+        stats = summary.Summarizer.make_stats(questions, ruote)
+        self.assertEqual({a: row[2] for a, row in rows.items() if row[2]}, dict(stats["goodbyers"]))
+
+    def test_sql_all_incremental(self) -> None:
+        self.write_editions(2)
+        summary.sql_all(workers=1)
+        read = []
+        real = summary.read_week
+
+        def counting(path: str):
+            read.append(path)
+            return real(path)
+
+        summary.read_week = counting
+        try:
+            summary.sql_all(workers=1)
+            self.assertEqual(read, [])
+            # touched only: read, not imported
+            os.utime("data/2017_00.json", (1, 1))
+            summary.sql_all(workers=1)
+            self.assertEqual(read, ["data/2017_00.json"])
+            read.clear()
+            summary.sql_all(workers=1)
+            self.assertEqual(read, [])
+            questions = json.loads(Path("data/2017_01.json").read_text(encoding="utf-8"))
+            questions[0]["score"] = 1000
+            Path("data/2017_01.json").write_text(json.dumps(questions), encoding="utf-8")
+            summary.sql_all(workers=1)
+            self.assertEqual(read, ["data/2017_01.json"])
+        finally:
+            summary.read_week = real
+        con = sqlite3.connect("data/dump.sqlite3")
+        score = con.execute(
+            "SELECT score FROM questions WHERE id = ?", (questions[0]["name"],)
+        ).fetchone()[0]
+        self.assertEqual(score, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
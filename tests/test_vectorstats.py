@@ -0,0 +1,66 @@
+import datetime
+import unittest
+from pathlib import Path
+
+import summary
+import vectorstats
+from accumulator import StatsAccumulator
+from storage import DumpStore
+from tests.helpers import WorkdirTestCase, make_edition, make_editions, prepare
+
+
+@unittest.skipIf(vectorstats.np is None, "NumPy not installed")
+class TestDistributions(WorkdirTestCase):
+    def test_same_summaries(self) -> None:
+        questions, ruote = make_editions(3, 0)
+        accumulator = StatsAccumulator().consume(questions, ruote)
+        activity = [c["created_utc"] for q in questions for c in q["comments"]]
+        variables = vectorstats.distributions(questions, accumulator.stats(), activity)
+        for key, expected in accumulator.summaries().items():
+            for name, value in expected.items():
+                self.assertAlmostEqual(variables[key][name], value, msg=f"{key}.{name}")
+        self.assertEqual(sum(variables["hours"]), len(activity))
+        self.assertEqual(sum(count for _, _, count in variables["histograms"]["size"]), 120)
+        lengths = sorted(len(question["answer"]) for question in questions)
+        self.assertEqual(variables["percentiles"]["size"][50], (lengths[59] + lengths[60]) / 2)
+
+    def test_mode_first_seen(self) -> None:
+        values = vectorstats.np.array([3, 1, 1, 3, 2])
+        self.assertEqual(vectorstats.summary(values)["mode"], 3)
+
+    def test_heatmap(self) -> None:
+        monday = datetime.datetime(2024, 1, 1, 15, 30, tzinfo=datetime.timezone.utc)
+        times = [monday.timestamp(), monday.timestamp() + 6 * 86400 + 3600]
+        heat = vectorstats.heatmap(vectorstats.np.array(times))
+        self.assertEqual(heat[0][15], 1)
+        self.assertEqual(heat[6][16], 1)
+        self.assertEqual(heat.sum(), 2)
+
+    def test_period_stats(self) -> None:
+        prepare(self.workdir)
+        store = DumpStore()
+        questions, ruote = make_edition(0)
+        store.insert("questions", "comments", questions, "2017_00")
+        store.insert("ruote", "rcomments", ruote, "2017_00")
+        store.commit()
+        store.close()
+        summary.period_stats()
+        text = Path("data/inizio-oggi_stats.md").read_text(encoding="utf-8")
+        self.assertIn("## Distribuzioni", text)
+        self.assertIn("Lun | ", text)
+
+    def test_no_open_time(self) -> None:
+        questions, ruote = make_edition(0)
+        stats = StatsAccumulator().consume(questions, ruote).stats()
+        stats["open_time"] = []
+        variables = summary.stats_variables(questions, ruote, stats)
+        variables.update(vectorstats.distributions(questions, stats, []))
+        variables["day"] = "2017_00"
+        prepare(self.workdir)
+        text = summary.render_stats(variables)
+        self.assertIn("## Distribuzioni", text)
+        self.assertNotIn("Tempo di apertura", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
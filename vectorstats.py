@@ -0,0 +1,96 @@
+"""Distributions of the questions of many weeks, vectorized with NumPy.
+
+NumPy is optional: without it, np is None and the reports have only the summaries of
+accumulator.Distribution"""
+
+from collections.abc import Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90)
+BINS = 10
+DAY = 24 * 60 * 60
+HOUR = 60 * 60
+WEEKDAYS = ("Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom")
+
+
+def summary(values: "np.ndarray", mode: bool = True) -> dict | None:
+    """Mean, median_grouped and mode like accumulator.Distribution, None without values"""
+    n = len(values)
+    if n == 0:
+        return None
+    ordered = np.sort(values)
+    if n == 1:
+        median = ordered[0].item()
+    else:
+        x = ordered[n // 2]
+        below = np.searchsorted(ordered, x, side="left")
+        count = np.searchsorted(ordered, x, side="right") - below
+        median = (x - 0.5 + (n / 2 - below) / count).item()
+    result = {"mean": values.mean().item(), "median": median}
+    if mode:
+        # the first value seen among the most common ones, like statistics.mode
+        unique, first, counts = np.unique(values, return_index=True, return_counts=True)
+        common = counts == counts.max()
+        result["mode"] = unique[common][np.argmin(first[common])].item()
+    return result
+
+
+def percentiles(values: "np.ndarray") -> dict[int, float]:
+    """The PERCENTILES of the values"""
+    if len(values) == 0:
+        return {}
+    return dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist(), strict=True))
+
+
+def histogram(values: "np.ndarray", bins: int = BINS) -> list[tuple[float, float, int]]:
+    """The (from, to, count) of bins equally wide intervals"""
+    if len(values) == 0:
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist(), counts.tolist(), strict=True))
+
+
+def heatmap(times: "np.ndarray") -> "np.ndarray":
+    """Count of the timestamps by weekday (Monday first) and hour, UTC"""
+    seconds = times.astype(np.int64)
+    # 1970-01-01 was a Thursday
+    weekday = (seconds // DAY + 3) % 7
+    hour = seconds % DAY // HOUR
+    return np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+
+def distributions(questions: list[dict], stats: dict, activity: Iterable[float]) -> dict:
+    """The variables of stats.md computed on arrays: size, solver and otime like
+    summary.stats_variables, plus percentiles, histograms, hours, weekdays and heatmap.
+
+    activity are the created_utc of the comments"""
+    answer_len = np.fromiter(
+        (len(question["answer"]) for question in questions), dtype=np.int64, count=len(questions)
+    )
+    letters = np.fromiter(stats["solvers"].values(), dtype=np.int64, count=len(stats["solvers"]))
+    open_time = np.fromiter(
+        (time for time, _ in stats["open_time"]), dtype=np.float64, count=len(stats["open_time"])
+    )
+    heat = heatmap(np.fromiter(activity, dtype=np.float64))
+    variables = {
+        "size": summary(answer_len),
+        "solver": summary(letters),
+        "otime": summary(open_time, mode=False),
+        "percentiles": {
+            "size": percentiles(answer_len),
+            "solver": percentiles(letters),
+            "otime": percentiles(open_time),
+        },
+        "histograms": {
+            "size": histogram(answer_len),
+            "otime": histogram(open_time),
+        },
+        "hours": heat.sum(axis=0).tolist(),
+        "weekdays": dict(zip(WEEKDAYS, heat.sum(axis=1).tolist(), strict=True)),
+        "heatmap": dict(zip(WEEKDAYS, heat.tolist(), strict=True)),
+    }
+    return {key: value for key, value in variables.items() if value is not None}